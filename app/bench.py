@@ -0,0 +1,479 @@
+"""Benchmarks reprodutíveis das funções de `app.database` e dos fluxos da interface.
+
+Gera um livro-caixa sintético (determinístico para a mesma semente) num banco
+descartável, mede cada função pública de `database` e os fluxos equivalentes
+aos da interface (abrir a aplicação, listar um mês, rolar a tabela, análise,
+salvar e atualizar a tabela, exportar um ano) e grava os resultados em JSON,
+para comparar entre commits.
+
+Uso:
+
+  python -m app.bench                                  # SQLite, 10k lançamentos
+  python -m app.bench --tamanho 1m --saida antes.json
+  python -m app.bench --tamanho 1m --saida depois.json --comparar antes.json
+  python -m app.bench --backend sqlite postgres        # sobe um PostgreSQL local
+  python -m app.bench --backend postgres --postgres-url postgresql://u@host/banco_descartavel
+  python -m app.bench --instrumentar        # + comandos SQL, linhas e tempo por caso
+
+Tamanhos: 10k, 1m e 10m (ou --linhas N). Para o PostgreSQL, sem
+--postgres-url, é criado um cluster temporário com initdb/pg_ctl (procurados
+no PATH, em PG_BIN ou em /usr/lib/postgresql/*/bin) e o schema de
+scripts/schema_postgres.sql é aplicado. --postgres-url deve apontar para um
+banco vazio e descartável: o schema é criado e os dados são gerados nele.
+
+Cada backend roda num processo próprio, porque `database` lê a configuração
+na importação. Nunca usa o banco configurado da aplicação.
+"""
+import argparse
+import glob
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+SCHEMA_POSTGRES = os.path.join(ROOT_DIR, 'scripts', 'schema_postgres.sql')
+
+TAMANHOS = {'10k': 10_000, '1m': 1_000_000, '10m': 10_000_000}
+ANOS = tuple(range(2015, 2025))
+CATEGORIAS = tuple(f"Categoria {i:02d}" for i in range(1, 41))
+BANCOS = tuple(f"Banco {i}" for i in range(1, 9))
+CARTOES = tuple(f"Cartão {i}" for i in range(1, 7))
+DESCRICOES = ('Mercado', 'Aluguel', 'Salário', 'Farmácia', 'Combustível', 'Restaurante', 'Assinatura',
+              'Energia', 'Internet', 'Transferência', 'Parcela', 'Tarifa bancária')
+
+
+# --- Gerador do livro-caixa sintético ---
+
+def gerar_registros(linhas, seed=42):
+    """Registros no formato de `database.importar_lancamentos`, sempre os mesmos para a mesma semente.
+
+    Distribuídos uniformemente em `ANOS`; todos têm categoria (obrigatória no
+    PostgreSQL), ~90% banco, ~30% cartão, ~85% valor pago e ~25% valor previsto.
+    """
+    rnd = random.Random(seed)
+    for i in range(linhas):
+        pago = round(rnd.uniform(-800, 300) * 100) if rnd.random() < 0.85 else None
+        yield {
+            'linha': i + 1,
+            'data': date(rnd.choice(ANOS), rnd.randint(1, 12), rnd.randint(1, 28)),
+            'descricao': f"{rnd.choice(DESCRICOES)} {i}",
+            'valor_previsto': round(rnd.uniform(-800, 300) * 100) if rnd.random() < 0.25 else None,
+            'valor_pago': pago,
+            'categoria': rnd.choice(CATEGORIAS),
+            'banco': rnd.choice(BANCOS) if rnd.random() < 0.9 else None,
+            'cartao': rnd.choice(CARTOES) if rnd.random() < 0.3 else None,
+        }
+
+
+def gerar_livro(database, linhas, seed=42, ao_progredir=None):
+    inicio = time.perf_counter()
+    resultado = database.importar_lancamentos(gerar_registros(linhas, seed), tamanho_lote=5000,
+                                              ao_progredir=ao_progredir)
+    if resultado['erros']:
+        raise RuntimeError(f"Falha ao gerar o livro-caixa: {resultado['erros'][:3]}")
+    return time.perf_counter() - inicio
+
+
+# --- Medição ---
+
+def medir(funcao, repeticoes, aquecimento=1):
+    """Executa `funcao` e retorna estatísticas em ms (e o tamanho do último resultado)."""
+    for _ in range(aquecimento):
+        funcao()
+    tempos = []
+    linhas = None
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = funcao()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+        if isinstance(resultado, (list, tuple)):
+            linhas = len(resultado)
+        elif isinstance(resultado, int) and not isinstance(resultado, bool):
+            linhas = resultado
+    tempos.sort()
+    return {
+        'repeticoes': repeticoes,
+        'min_ms': round(tempos[0], 3),
+        'mediana_ms': round(statistics.median(tempos), 3),
+        'p95_ms': round(tempos[min(len(tempos) - 1, int(len(tempos) * 0.95))], 3),
+        'media_ms': round(statistics.fmean(tempos), 3),
+        'linhas': linhas,
+    }
+
+
+def casos(database, repeticoes):
+    """(nome, função, repetições) de cada medição, na ordem em que rodam.
+
+    Leituras primeiro; as gravações desfazem o que criam, e
+    `reconstruir_agregados` (a mais pesada) fica por último.
+    """
+    from . import exportacao
+    from .formatacao import formatar_lancamento, formatar_lancamentos
+
+    ano, mes = ANOS[len(ANOS) // 2], 6
+    meio = database.listar_lancamentos_pagina(ano=ano, mes=mes, limite=1)
+    id_existente = int(meio[0]['id'])
+    chave_meio = database.chave_lancamento(meio[0])
+    intervalo = {'data_inicio': date(ano, mes, 10), 'data_fim': date(ano, mes + 1, 9)}
+    poucas = max(1, repeticoes // 5)
+
+    def n_linhas(gerador):
+        return sum(1 for _ in gerador)
+
+    def tendencia_por_mes():
+        # Como se montava a evolução do ano antes de obter_tendencia_mensal
+        return [database.obter_entradas_saidas_saldo(m, ano) for m in range(1, 13)]
+
+    def tendencia_sem_cache(ano_inicio, ano_fim, por_categoria=False):
+        database._lancamentos_alterados()
+        return database.obter_tendencia_mensal(ano_inicio, ano_fim, por_categoria=por_categoria)
+
+    def conectar_e_devolver():
+        conn, _ = database.conectar()
+        conn.close()
+
+    def novo_lancamento(i=0):
+        return {'dia': 1 + i % 28, 'mes': mes, 'ano': ano, 'descricao': f"Bench {i}",
+                'categoria_id': 1, 'banco_id': None, 'cartao_id': None,
+                'valor_previsto': None, 'valor_pago': -1234}
+
+    def adicionar_e_excluir():
+        novo = database.adicionar_lancamento(novo_lancamento())
+        database.excluir_lancamento(int(novo['id']))
+
+    def atualizar():
+        original = database.obter_lancamento(id_existente)
+        return database.atualizar_lancamento(id_existente, {
+            'dia': int(original['dia']), 'mes': int(original['mes']), 'ano': int(original['ano']),
+            'descricao': original['descricao'], 'categoria_id': 1, 'banco_id': None, 'cartao_id': None,
+            'valor_previsto': original['valor_previsto'], 'valor_pago': original['valor_pago']})
+
+    def importar_lote():
+        registros = list(gerar_registros(1000, seed=7))
+        for reg in registros:
+            reg['descricao'] = 'Bench importação'
+        resultado = database.importar_lancamentos(registros)
+        conn, cursor = database.conectar()
+        cursor.execute(f"DELETE FROM {database.T_LANCAMENTOS} WHERE "
+                       f"{database.C_LANC_DESCRICAO if database.USE_POSTGRES else 'descricao'} = ?",
+                       ('Bench importação',))
+        conn.commit()
+        conn.close()
+        return resultado['inseridos']
+
+    # Fluxos da interface (o que cada tela faz no banco e na formatação)
+    def fluxo_abrir_aplicacao():
+        database.invalidar_cadastros()
+        for tabela in database.TABELAS_CADASTRO:
+            database.listar_itens_cadastro(tabela)
+        database.listar_anos()
+        database.contar_lancamentos(ano=ano)
+        return formatar_lancamentos(database.listar_lancamentos_pagina(ano=ano, limite=200))
+
+    def fluxo_listar_mes():
+        filtro = database.FiltroLancamentos(mes=mes, ano=ano)
+        database.contar_lancamentos(filtro=filtro)
+        return formatar_lancamentos(database.listar_lancamentos_pagina(filtro=filtro, limite=200))
+
+    def fluxo_rolar_10_paginas():
+        apos, total = None, 0
+        for _ in range(10):
+            pagina = database.listar_lancamentos_pagina(apos=apos, limite=200)
+            if not pagina:
+                break
+            formatar_lancamentos(pagina)
+            total += len(pagina)
+            apos = database.chave_lancamento(pagina[-1])
+        return total
+
+    def fluxo_salvar_e_atualizar():
+        novo = database.adicionar_lancamento(novo_lancamento())
+        formatar_lancamento(novo)
+        database.excluir_lancamento(int(novo['id']))
+
+    def fluxo_exportar_ano():
+        return exportacao.exportar(io.StringIO(), 'csv', ano=ano)
+
+    return [
+        # Conexão e cadastros
+        ('conectar', conectar_e_devolver, repeticoes * 10),
+        ('versao_schema', database.versao_schema, repeticoes),
+        ('aplicar_migracoes', database.aplicar_migracoes, repeticoes),
+        ('nomes_cadastro', lambda: database.nomes_cadastro(database.T_CATEGORIAS), repeticoes * 10),
+        ('listar_itens_cadastro', lambda: database.listar_itens_cadastro(database.T_CATEGORIAS), repeticoes),
+        # Listagem
+        ('contar_lancamentos', database.contar_lancamentos, repeticoes),
+        ('contar_lancamentos_mes', lambda: database.contar_lancamentos(mes=mes, ano=ano), repeticoes),
+        ('contar_lancamentos_intervalo', lambda: database.contar_lancamentos(**intervalo), repeticoes),
+        ('listar_lancamentos_filtrados_mes', lambda: database.listar_lancamentos_filtrados(mes=mes, ano=ano),
+         repeticoes),
+        ('listar_lancamentos_filtrados_previsto',
+         lambda: database.listar_lancamentos_filtrados(mes=mes, ano=ano, somente_previsto=True), repeticoes),
+        ('listar_lancamentos_pagina_primeira', lambda: database.listar_lancamentos_pagina(limite=200),
+         repeticoes),
+        ('listar_lancamentos_pagina_meio', lambda: database.listar_lancamentos_pagina(apos=chave_meio, limite=200),
+         repeticoes),
+        ('listar_lancamentos_pagina_categoria',
+         lambda: database.listar_lancamentos_pagina(filtro=database.FiltroLancamentos(categorias=[1]), limite=200),
+         repeticoes),
+        ('listar_lancamentos_pagina_filtro_composto',
+         lambda: database.listar_lancamentos_pagina(filtro=database.FiltroLancamentos(
+             ano=ano, bancos=[1, 2], valor_max=-10000, pago=True), limite=200), repeticoes),
+        ('listar_lancamentos_pagina_mes_saldo',
+         lambda: database.listar_lancamentos_pagina(mes=mes, ano=ano, limite=200, com_saldo=True), repeticoes),
+        ('listar_lancamentos_pagina_meio_saldo',
+         lambda: database.listar_lancamentos_pagina(apos=chave_meio, limite=200, com_saldo=True,
+                                                    saldo_anterior=(0, 0)), repeticoes),
+        ('obter_saldo_anterior_mes', lambda: database.obter_saldo_anterior(mes=mes, ano=ano), repeticoes),
+        ('obter_saldo_anterior_intervalo', lambda: database.obter_saldo_anterior(**intervalo), repeticoes),
+        ('obter_saldo_anterior_apos', lambda: database.obter_saldo_anterior(apos=chave_meio), repeticoes),
+        ('contar_lancamentos_categoria',
+         lambda: database.contar_lancamentos(filtro=database.FiltroLancamentos(categorias=[1])), repeticoes),
+        ('iterar_lancamentos_ano', lambda: n_linhas(database.iterar_lancamentos(ano=ano)), poucas),
+        ('obter_lancamento', lambda: database.obter_lancamento(id_existente), repeticoes * 10),
+        ('chave_lancamento', lambda: database.chave_lancamento(meio[0]), repeticoes * 100),
+        # Busca textual
+        ('buscar_lancamentos_prefixo', lambda: database.buscar_lancamentos('merc'), repeticoes),
+        ('buscar_lancamentos_duas_palavras', lambda: database.buscar_lancamentos('tarifa banc'), repeticoes),
+        ('buscar_lancamentos_mes', lambda: database.buscar_lancamentos('farm', mes=mes), repeticoes),
+        ('buscar_lancamentos_raro', lambda: database.buscar_lancamentos(str(id_existente)), repeticoes),
+        # Análise
+        ('obter_entradas_saidas_saldo', lambda: database.obter_entradas_saidas_saldo(mes, ano), repeticoes),
+        ('obter_soma_por_categoria', lambda: database.obter_soma_por_categoria(mes, ano), repeticoes),
+        ('obter_soma_por_banco', lambda: database.obter_soma_por_banco(mes, ano), repeticoes),
+        ('obter_resumo_mensal', lambda: database.obter_resumo_mensal(mes, ano), repeticoes),
+        ('obter_resumo_mensal_ano', lambda: database.obter_resumo_mensal(ano=ano), repeticoes),
+        ('obter_resumo_mensal_intervalo', lambda: database.obter_resumo_mensal(**intervalo), repeticoes),
+        ('tendencia_12_chamadas_por_mes', tendencia_por_mes, repeticoes),
+        ('obter_tendencia_mensal_ano', lambda: tendencia_sem_cache(ano, ano), repeticoes),
+        ('obter_tendencia_mensal_todos_anos',
+         lambda: tendencia_sem_cache(ANOS[0], ANOS[-1], por_categoria=True), repeticoes),
+        ('obter_tendencia_mensal_cache', lambda: database.obter_tendencia_mensal(ano), repeticoes),
+        # Fluxos da interface
+        ('fluxo_abrir_aplicacao', fluxo_abrir_aplicacao, repeticoes),
+        ('fluxo_listar_mes', fluxo_listar_mes, repeticoes),
+        ('fluxo_rolar_10_paginas', fluxo_rolar_10_paginas, repeticoes),
+        ('fluxo_analise', lambda: database.obter_resumo_mensal(mes, ano), repeticoes),
+        ('fluxo_salvar_e_atualizar', fluxo_salvar_e_atualizar, repeticoes),
+        ('fluxo_exportar_ano', fluxo_exportar_ano, poucas),
+        # Gravação e manutenção
+        ('adicionar_e_excluir_lancamento', adicionar_e_excluir, repeticoes),
+        ('atualizar_lancamento', atualizar, repeticoes),
+        ('importar_lancamentos_1000', importar_lote, poucas),
+        ('verificar_agregados', database.verificar_agregados, 1),
+        ('reconstruir_agregados', database.reconstruir_agregados, 1),
+    ]
+
+
+def rodar_interno(args):
+    """Processo filho: o ambiente já aponta para o banco descartável."""
+    sys.path.insert(0, ROOT_DIR)
+    from app import database
+
+    def progresso(lidos, inseridos, erros):
+        print(f"\r  gerando: {inseridos}/{args.linhas}", end='', file=sys.stderr, flush=True)
+
+    geracao = gerar_livro(database, args.linhas, args.seed, progresso)
+    print(file=sys.stderr)
+    if args.instrumentar:
+        from app.instrumentacao import Coletor
+        database.instrumentar(Coletor(limite_lento_ms=database.LIMITE_LENTO_MS))
+
+    resultados = {}
+    filtro = set(args.casos or ())
+    for nome, funcao, repeticoes in casos(database, args.repeticoes):
+        if filtro and nome not in filtro:
+            continue
+        if args.instrumentar:
+            from app.instrumentacao import origem
+            with origem(nome):
+                resultados[nome] = medir(funcao, repeticoes)
+        else:
+            resultados[nome] = medir(funcao, repeticoes)
+        print(f"  {nome:<40} {resultados[nome]['mediana_ms']:>10.3f} ms", file=sys.stderr)
+    database.fechar_conexoes()
+
+    saida = {'geracao_s': round(geracao, 3), 'resultados': resultados}
+    if args.instrumentar:
+        saida['consultas'] = database.coletor_consultas().contadores()
+    if database.USE_POSTGRES:
+        saida['instrucoes'] = database.estatisticas_instrucoes()
+        print(f"  instruções preparadas: taxa de acerto {saida['instrucoes']['taxa_acerto']:.1%}", file=sys.stderr)
+    json.dump(saida, sys.stdout)
+
+
+# --- Backends ---
+
+def _binario_postgres(nome):
+    candidatos = [os.environ.get('PG_BIN', ''), os.path.dirname(shutil.which(nome) or '')]
+    candidatos += sorted(glob.glob('/usr/lib/postgresql/*/bin'), reverse=True)
+    for diretorio in candidatos:
+        caminho = os.path.join(diretorio, nome)
+        if diretorio and os.access(caminho, os.X_OK):
+            return caminho
+    raise RuntimeError(f"'{nome}' não encontrado (instale o PostgreSQL ou defina PG_BIN).")
+
+
+def _porta_livre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class PostgresTemporario:
+    """Cluster PostgreSQL descartável (initdb + pg_ctl) num diretório temporário."""
+
+    def __init__(self, diretorio):
+        self.dados = os.path.join(diretorio, 'pgdata')
+        self.log = os.path.join(diretorio, 'postgres.log')
+        self.porta = _porta_livre()
+
+    def __enter__(self):
+        subprocess.run([_binario_postgres('initdb'), '-D', self.dados, '-U', 'bench', '--auth=trust',
+                        '-E', 'UTF8', '--no-locale'], check=True, capture_output=True)
+        subprocess.run([_binario_postgres('pg_ctl'), '-D', self.dados, '-l', self.log, '-w',
+                        '-o', f"-p {self.porta} -c listen_addresses=127.0.0.1 -k ''", 'start'],
+                       check=True, capture_output=True)
+        subprocess.run([_binario_postgres('createdb'), '-h', '127.0.0.1', '-p', str(self.porta),
+                        '-U', 'bench', 'financeiro_bench'], check=True, capture_output=True)
+        self.url = f"postgresql://bench@127.0.0.1:{self.porta}/financeiro_bench"
+        return self
+
+    def __exit__(self, *exc):
+        subprocess.run([_binario_postgres('pg_ctl'), '-D', self.dados, '-m', 'fast', '-w', 'stop'],
+                       capture_output=True)
+
+
+def aplicar_schema_postgres(url):
+    import psycopg2
+    with open(SCHEMA_POSTGRES, encoding='utf-8') as f:
+        schema = f.read()
+    conn = psycopg2.connect(url)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(schema)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def rodar_backend(backend, args, diretorio):
+    env = dict(os.environ)
+    for variavel in ('DATABASE_URL', 'SQLITE_FILE'):
+        env.pop(variavel, None)
+    comando = [sys.executable, '-m', 'app.bench', '--interno', '--linhas', str(args.linhas),
+               '--seed', str(args.seed), '--repeticoes', str(args.repeticoes)]
+    if args.casos:
+        comando += ['--casos', *args.casos]
+    if args.instrumentar:
+        comando.append('--instrumentar')
+
+    def executar():
+        print(f"[{backend}] {args.linhas} lançamentos", file=sys.stderr)
+        saida = subprocess.run(comando, env=env, cwd=ROOT_DIR, check=True, stdout=subprocess.PIPE).stdout
+        return json.loads(saida)
+
+    if backend == 'sqlite':
+        env['SQLITE_FILE'] = os.path.join(diretorio, 'bench.db')
+        env['DATABASE_URL'] = 'sqlite:///' + env['SQLITE_FILE']
+        return executar()
+
+    if args.postgres_url:
+        env['DATABASE_URL'] = args.postgres_url
+        aplicar_schema_postgres(args.postgres_url)
+        return executar()
+    with PostgresTemporario(diretorio) as pg:
+        env['DATABASE_URL'] = pg.url
+        aplicar_schema_postgres(pg.url)
+        return executar()
+
+
+def metadados(args):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR, check=True,
+                                capture_output=True, text=True).stdout.strip()
+        sujo = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT_DIR,
+                                   capture_output=True, text=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        commit, sujo = None, None
+    return {
+        'commit': commit,
+        'alteracoes_locais': sujo,
+        'data': datetime.now().isoformat(timespec='seconds'),
+        'linhas': args.linhas,
+        'seed': args.seed,
+        'repeticoes': args.repeticoes,
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'plataforma': platform.platform(),
+    }
+
+
+def comparar(atual, anterior):
+    """Imprime a razão das medianas (atual / anterior) de cada caso presente nos dois."""
+    print(f"\n{'backend/caso':<52}{'anterior':>12}{'atual':>12}{'razão':>9}")
+    for backend, dados in atual['backends'].items():
+        base = anterior.get('backends', {}).get(backend, {}).get('resultados', {})
+        for nome, medida in dados['resultados'].items():
+            if nome not in base:
+                continue
+            antes, agora = base[nome]['mediana_ms'], medida['mediana_ms']
+            razao = agora / antes if antes else float('inf')
+            marca = '  <-' if razao > 1.2 else ''
+            print(f"{backend + '/' + nome:<52}{antes:>12.3f}{agora:>12.3f}{razao:>8.2f}x{marca}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m app.bench',
+                                     description="Benchmarks das funções do banco e dos fluxos da interface.")
+    parser.add_argument('--backend', nargs='+', choices=('sqlite', 'postgres'), default=['sqlite'])
+    parser.add_argument('--tamanho', choices=sorted(TAMANHOS), default='10k')
+    parser.add_argument('--linhas', type=int, help="quantidade exata de lançamentos (substitui --tamanho)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--repeticoes', type=int, default=20, help="repetições de cada caso (padrão: 20)")
+    parser.add_argument('--casos', nargs='+', help="mede só estes casos")
+    parser.add_argument('--saida', help="arquivo JSON com os resultados (padrão: saída padrão)")
+    parser.add_argument('--comparar', metavar='JSON', help="resultado anterior para comparar")
+    parser.add_argument('--instrumentar', action='store_true',
+                        help="inclui os contadores de consultas (app.instrumentacao) de cada caso")
+    parser.add_argument('--postgres-url', help="banco PostgreSQL vazio e descartável (em vez de subir um local)")
+    parser.add_argument('--interno', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    args.linhas = args.linhas or TAMANHOS[args.tamanho]
+
+    if args.interno:
+        rodar_interno(args)
+        return 0
+
+    relatorio = {'meta': metadados(args), 'backends': {}}
+    for backend in args.backend:
+        with tempfile.TemporaryDirectory(prefix=f'bench_{backend}_') as diretorio:
+            relatorio['backends'][backend] = rodar_backend(backend, args, diretorio)
+
+    texto = json.dumps(relatorio, indent=2, ensure_ascii=False)
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            f.write(texto + '\n')
+        print(f"Resultados gravados em {args.saida}", file=sys.stderr)
+    else:
+        print(texto)
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as f:
+            comparar(relatorio, json.load(f))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
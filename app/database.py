@@ -1,41 +1,175 @@
 import os
+import re
+import sys
 import sqlite3
+import atexit
+import calendar
+import gzip
+import threading
+import time
 import configparser
+import unicodedata
 import urllib.parse
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from .instrumentacao import Coletor, Medicao, origem_atual
 
 ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 
-# Arquivo de banco sqlite padrão (no root do projeto)
-SQLITE_FILE = os.environ.get('SQLITE_FILE') or os.path.join(ROOT_DIR, 'financeiro.db')
+# Arquivo de banco sqlite padrão (relativo ao diretório de execução, como sempre foi)
+SQLITE_FILE = os.environ.get('SQLITE_FILE') or 'financeiro.db'
 
 # Detecta se há uma URL de banco de dados PostgreSQL configurada (prefere variáveis de ambiente)
 DATABASE_URL = os.environ.get('DATABASE_URL')
 
-# Se não houver env var, tenta ler um arquivo de configuração `config.ini` no root do projeto
+# Lê o arquivo de configuração `config.ini` no root do projeto (se existir)
 config_path = os.path.join(ROOT_DIR, 'config.ini')
-if not DATABASE_URL and os.path.exists(config_path):
-    cfg = configparser.ConfigParser()
-    cfg.read(config_path)
-    if 'database' in cfg:
-        dbcfg = cfg['database']
-        # Se o usuário forneceu uma URL completa, usa ela
-        if dbcfg.get('url'):
-            DATABASE_URL = dbcfg.get('url')
+cfg = configparser.ConfigParser()
+cfg.read(config_path)
+
+if not DATABASE_URL and 'database' in cfg:
+    dbcfg = cfg['database']
+    # Se o usuário forneceu uma URL completa, usa ela
+    if dbcfg.get('url'):
+        DATABASE_URL = dbcfg.get('url')
+    else:
+        driver = dbcfg.get('driver', '').lower()
+        if driver in ('postgres', 'postgresql') or dbcfg.get('host'):
+            # Monta a URL do Postgres a partir dos campos
+            user = dbcfg.get('user', '')
+            pwd = dbcfg.get('password', '')
+            host = dbcfg.get('host', 'localhost')
+            port = dbcfg.get('port', '5432')
+            dbname = dbcfg.get('dbname') or dbcfg.get('database') or ''
+            if pwd:
+                pwd = urllib.parse.quote_plus(pwd)
+            DATABASE_URL = f"postgresql://{user}:{pwd}@{host}:{port}/{dbname}"
+        elif driver in ('sqlite', '') or dbcfg.get('file'):
+            # Permite especificar arquivo sqlite no config
+            SQLITE_FILE = dbcfg.get('file', SQLITE_FILE)
+
+
+def _config_int(secao, chave, env, padrao):
+    """Lê um inteiro da variável de ambiente `env` ou de `config.ini` [secao] chave."""
+    valor = os.environ.get(env)
+    if not valor and secao in cfg:
+        valor = cfg[secao].get(chave)
+    try:
+        return int(valor) if valor else padrao
+    except ValueError:
+        return padrao
+
+
+def _config_str(secao, chave, env, padrao, validos=None):
+    """Como `_config_int`, para textos; valores fora de `validos` caem no padrão."""
+    valor = os.environ.get(env)
+    if not valor and secao in cfg:
+        valor = cfg[secao].get(chave)
+    valor = (valor or '').strip()
+    if not valor:
+        return padrao
+    if validos is not None:
+        valor = valor.upper()
+        if valor not in validos:
+            return padrao
+    return valor
+
+
+# --- Configuração do pool de conexões ---
+# Número máximo de conexões abertas simultaneamente
+POOL_SIZE = _config_int('database', 'pool_size', 'DB_POOL_SIZE', 5)
+# Segundos aguardando uma conexão livre antes de desistir
+POOL_TIMEOUT = _config_int('database', 'pool_timeout', 'DB_POOL_TIMEOUT', 30)
+# Conexões ociosas há mais que isso (segundos) são testadas antes de reutilizar
+POOL_PING_INTERVAL = _config_int('database', 'pool_ping_interval', 'DB_POOL_PING_INTERVAL', 30)
+
+# --- Instruções preparadas (PostgreSQL) ---
+# Execuções de uma mesma consulta, no processo, a partir das quais ela passa a
+# ser preparada no servidor (PREPARE/EXECUTE); 0 desliga
+PREPARAR_APOS = _config_int('database', 'preparar_apos', 'DB_PREPARAR_APOS', 5)
+# Instruções preparadas mantidas em cada conexão (as usadas há mais tempo são liberadas)
+MAX_PREPARADAS = _config_int('database', 'max_preparadas', 'DB_MAX_PREPARADAS', 100)
+
+# --- Instrumentação das consultas (ver app/instrumentacao.py) ---
+# Desligada por padrão; `instrumentar()` liga/desliga em tempo de execução
+INSTRUMENTACAO = bool(_config_int('database', 'instrumentacao', 'DB_INSTRUMENTACAO', 0))
+# Comandos a partir desta duração (ms) entram no log de consultas lentas
+LIMITE_LENTO_MS = _config_int('database', 'limite_lento_ms', 'DB_LIMITE_LENTO_MS', 200)
+# Anexa o plano (EXPLAIN / EXPLAIN QUERY PLAN) às consultas lentas
+EXPLICAR_LENTAS = bool(_config_int('database', 'explain', 'DB_EXPLAIN', 0))
+
+# --- Recorrências ---
+# Meses à frente (a partir de hoje) até onde as recorrências sem fim têm
+# lançamentos gerados; `expandir_recorrencias()` avança esse horizonte
+RECORRENCIA_MESES = _config_int('database', 'recorrencia_meses', 'DB_RECORRENCIA_MESES', 12)
+
+# --- Backups (ver `fazer_backup`) ---
+# Pasta dos backups; padrão: "backups" ao lado do arquivo SQLite
+BACKUP_DIR = _config_str('backup', 'diretorio', 'DB_BACKUP_DIR',
+                         os.path.join(os.path.dirname(os.path.abspath(SQLITE_FILE)), 'backups'))
+# Backups mantidos na pasta; os mais antigos são apagados a cada novo backup (0 mantém todos)
+BACKUP_MANTER = _config_int('backup', 'manter', 'DB_BACKUP_MANTER', 10)
+# Cópia online do SQLite: páginas copiadas por passo e pausa (ms) entre os passos,
+# quando o arquivo fica livre para as outras conexões
+BACKUP_PAGINAS = _config_int('backup', 'paginas_por_passo', 'DB_BACKUP_PAGINAS', 1000)
+BACKUP_PAUSA_MS = _config_int('backup', 'pausa_ms', 'DB_BACKUP_PAUSA_MS', 5)
+
+# --- Perfil de desempenho do SQLite ---
+# Valores medidos com scripts/benchmark_sqlite_perfis.py. O perfil escolhido em
+# [sqlite] perfil (ou SQLITE_PERFIL) pode ter cada item sobrescrito pela chave
+# de mesmo nome em [sqlite] ou pela variável SQLITE_<CHAVE>.
+#
+# - seguro: WAL com synchronous=FULL, nenhuma transação confirmada se perde
+#   nem em queda de energia.
+# - rapido: WAL com synchronous=NORMAL (uma queda de energia pode desfazer as
+#   últimas transações, sem corromper o arquivo), cache e mmap maiores;
+#   indicado para livros-caixa de vários GB.
+PERFIS_SQLITE = {
+    'seguro': {
+        'journal_mode': 'WAL',
+        'synchronous': 'FULL',
+        'cache_size': -16_000,          # KiB (negativo) ou páginas (positivo)
+        'mmap_size': 0,                 # bytes
+        'temp_store': 'DEFAULT',
+        'busy_timeout': 20_000,         # ms
+        'checkpoint_interval': 60,      # s entre checkpoints do WAL (0 desativa)
+    },
+    'rapido': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -256_000,
+        'mmap_size': 1 << 30,
+        # temp_store=MEMORY foi medido e deixou a importação em lote ~2x mais
+        # lenta (diários de instrução dos triggers em memória); fica o padrão
+        'temp_store': 'DEFAULT',
+        'busy_timeout': 20_000,
+        'checkpoint_interval': 30,
+    },
+}
+_ALIASES_PERFIL = {'safe': 'seguro', 'fast': 'rapido', 'rápido': 'rapido'}
+_VALORES_PRAGMA = {
+    'journal_mode': ('DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF'),
+    'synchronous': ('OFF', 'NORMAL', 'FULL', 'EXTRA'),
+    'temp_store': ('DEFAULT', 'FILE', 'MEMORY'),
+}
+
+
+def _config_sqlite():
+    perfil = _config_str('sqlite', 'perfil', 'SQLITE_PERFIL', 'seguro').lower()
+    perfil = _ALIASES_PERFIL.get(perfil, perfil)
+    config = dict(PERFIS_SQLITE.get(perfil, PERFIS_SQLITE['seguro']))
+    for chave, padrao in config.items():
+        env = 'SQLITE_' + chave.upper()
+        if chave in _VALORES_PRAGMA:
+            config[chave] = _config_str('sqlite', chave, env, padrao, _VALORES_PRAGMA[chave])
         else:
-            driver = dbcfg.get('driver', '').lower()
-            if driver in ('postgres', 'postgresql') or dbcfg.get('host'):
-                # Monta a URL do Postgres a partir dos campos
-                user = dbcfg.get('user', '')
-                pwd = dbcfg.get('password', '')
-                host = dbcfg.get('host', 'localhost')
-                port = dbcfg.get('port', '5432')
-                dbname = dbcfg.get('dbname') or dbcfg.get('database') or ''
-                if pwd:
-                    pwd = urllib.parse.quote_plus(pwd)
-                DATABASE_URL = f"postgresql://{user}:{pwd}@{host}:{port}/{dbname}"
-            elif driver in ('sqlite', '') or dbcfg.get('file'):
-                # Permite especificar arquivo sqlite no config
-                SQLITE_FILE = dbcfg.get('file', SQLITE_FILE)
+            config[chave] = _config_int('sqlite', chave, env, padrao)
+    return config
+
+
+SQLITE_CONFIG = _config_sqlite()
 
 USE_POSTGRES = False
 _psycopg2 = None
@@ -59,6 +193,7 @@ if USE_POSTGRES:
     T_BANCOS = "banco"
     T_CARTOES = "cartao"
     T_LANCAMENTOS = "lancamento"
+    T_RECORRENCIAS = "recorrencia"
     # Mapeamento de colunas para a tabela de lançamento
     C_LANC_ID = "id"
     C_LANC_DATA = "data_lancamento" # Postgres usa 'date', SQLite usa dia/mes/ano
@@ -68,217 +203,1233 @@ if USE_POSTGRES:
     C_LANC_ID_CATEGORIA = "id_categoria" # Postgres usa 'id_categoria'
     C_LANC_ID_BANCO = "id_banco"
     C_LANC_ID_CARTAO = "id_cartao"
+    C_LANC_ID_RECORRENCIA = "id_recorrencia"
+    # Colunas da tabela de agregados mensais
+    C_AGR_ID_CATEGORIA = "id_categoria"
+    C_AGR_ID_BANCO = "id_banco"
 else:
     # Nomes para o schema SQLite (plural)
     T_CATEGORIAS = "categorias"
     T_BANCOS = "bancos"
     T_CARTOES = "cartoes"
     T_LANCAMENTOS = "lancamentos"
+    T_RECORRENCIAS = "recorrencias"
+    C_AGR_ID_CATEGORIA = "categoria_id"
+    C_AGR_ID_BANCO = "banco_id"
     
 T_LANCAMENTOS_BACKUP = "lancamentos_backup"
+# Totais por (ano, mes, categoria, banco), mantidos por triggers em lançamentos
+T_AGREGADO = "agregado_mensal"
+# Índice FTS5 das descrições (SQLite); no Postgres é a coluna C_LANC_BUSCA
+T_BUSCA = "lancamentos_busca"
+C_LANC_BUSCA = "descricao_busca"
+
+
+# --- Valores monetários ---
+# A aplicação trata dinheiro como centavos (int) de ponta a ponta: a interface
+# e a importação convertem o texto digitado em centavos, as funções deste
+# módulo recebem e devolvem centavos e a formatação parte deles. No SQLite as
+# colunas guardam os centavos (INTEGER, migração 6), então somas e comparações
+# são exatas e dispensam conversão. No PostgreSQL as colunas continuam
+# NUMERIC(_, 2), também exatas; a conversão é feita na consulta, uma vez por
+# valor lido ou por total (nunca dentro das somas).
+
+def _centavos(expr):
+    """SQL que lê `expr` (coluna ou soma de colunas de valor) em centavos."""
+    return f"CAST({expr} * 100 AS BIGINT)" if USE_POSTGRES else expr
+
+
+def _valor_banco(centavos):
+    """Parâmetro para gravar ou comparar `centavos` com uma coluna de valor."""
+    if centavos is None:
+        return None
+    return Decimal(int(centavos)).scaleb(-2) if USE_POSTGRES else int(centavos)
 
 
-class RowProxy:
-    """Objeto que imita sqlite3.Row (acesso por índice e por nome).
+class Linha(tuple):
+    """Linha de resultado acessível por índice e por nome, como sqlite3.Row.
 
-    Usado para normalizar linhas retornadas pelo psycopg2 para que o restante
-    do código (GUI, lógica) continue funcionando sem alterações.
+    É a própria tupla devolvida pelo driver (sem cópia para listas ou dicts);
+    o mapa nome -> índice fica na classe e é compartilhado por todas as linhas
+    do mesmo resultado. Use `_classe_linha(colunas)` para obter a subclasse.
     """
-    def __init__(self, columns, values):
-        self._cols = list(columns)
-        self._vals = list(values)
-        self._map = {c: self._vals[i] for i, c in enumerate(self._cols)}
+    __slots__ = ()
+    _indices = {}
 
-    def __getitem__(self, key):
-        if isinstance(key, int):
-            return self._vals[key]
-        return self._map[key]
+    def __getitem__(self, chave):
+        # Acesso por nome é o caso comum; índices e fatias caem no except
+        try:
+            return tuple.__getitem__(self, self._indices[chave])
+        except (KeyError, TypeError):
+            if isinstance(chave, str):
+                raise KeyError(chave) from None
+            return tuple.__getitem__(self, chave)
 
-    def __iter__(self):
-        return iter(self._vals)
+    def keys(self):
+        return list(self._indices)
+
+    def __repr__(self):
+        return f"Linha({dict(zip(self._indices, self))!r})"
+
+
+_classes_linha = {}
+
+
+def _classe_linha(colunas):
+    """Subclasse de `Linha` para as colunas dadas (criada uma vez por conjunto de colunas)."""
+    colunas = tuple(colunas)
+    classe = _classes_linha.get(colunas)
+    if classe is None:
+        indices = {}
+        for i, nome in enumerate(colunas):
+            # Em nomes repetidos vale o primeiro, como no sqlite3.Row
+            indices.setdefault(nome, i)
+        classe = type('Linha', (Linha,), {'__slots__': (), '_indices': indices})
+        _classes_linha[colunas] = classe
+    return classe
+
+
+# --- Instruções preparadas (PostgreSQL) ---
+#
+# As consultas deste módulo são montadas como texto com '?' e o psycopg2 manda
+# cada execução como texto: o servidor analisa e planeja tudo de novo a cada
+# chamada. O registro traduz cada consulta distinta uma única vez e, quando ela
+# passa de `PREPARAR_APOS` execuções, prepara a instrução em cada conexão do
+# pool na primeira vez que a conexão a executa (`PREPARE instrucao_N AS ...`);
+# daí em diante a conexão manda só `EXECUTE instrucao_N (parâmetros)`. Cada
+# conexão guarda até `MAX_PREPARADAS` instruções e libera (DEALLOCATE) as
+# usadas há mais tempo. `estatisticas_instrucoes()` mostra a taxa de acerto.
+#
+# No SQLite não há o que fazer aqui: o módulo sqlite3 já mantém um cache de
+# instruções compiladas por conexão.
+
+# Consultas distintas guardadas no registro; além disso (listas IN de tamanhos
+# muito variados, por exemplo) as novas são só traduzidas, a cada execução
+_LIMITE_INSTRUCOES = 2000
+_PARAMETRO = re.compile(r'\?')
+
+
+class _Instrucao:
+    """Uma consulta distinta: o texto para o psycopg2 e, depois de quente, o da instrução preparada."""
+    __slots__ = ('sql', 'nome', 'parametros', 'preparavel', 'execucoes', 'preparadas', 'preparos', 'falhas')
+
+    def __init__(self, sql, nome):
+        self.sql = sql.replace('?', '%s')
+        self.nome = nome
+        self.parametros = sql.count('?')
+        primeira = sql.lstrip().split(None, 1)[:1]
+        self.preparavel = nome is not None and bool(primeira) and primeira[0].upper() in _COMANDOS_EXPLICAVEIS
+        self.execucoes = self.preparadas = self.preparos = self.falhas = 0
+
+    def sql_preparar(self, sql_original):
+        numeros = iter(range(1, self.parametros + 1))
+        return f"PREPARE {self.nome} AS " + _PARAMETRO.sub(lambda _: f"${next(numeros)}", sql_original)
+
+    def sql_executar(self):
+        if not self.parametros:
+            return f"EXECUTE {self.nome}"
+        return f"EXECUTE {self.nome} ({', '.join(['%s'] * self.parametros)})"
+
+
+class _RegistroInstrucoes:
+    """Consultas distintas executadas no PostgreSQL (thread-safe)."""
+
+    def __init__(self):
+        self._instrucoes = {}
+        self._lock = threading.Lock()
+        self.liberadas = 0
+
+    def obter(self, sql):
+        instrucao = self._instrucoes.get(sql)
+        if instrucao is None:
+            with self._lock:
+                instrucao = self._instrucoes.get(sql)
+                if instrucao is None:
+                    if len(self._instrucoes) >= _LIMITE_INSTRUCOES:
+                        return _Instrucao(sql, None)
+                    instrucao = _Instrucao(sql, f"instrucao_{len(self._instrucoes) + 1}")
+                    self._instrucoes[sql] = instrucao
+        return instrucao
+
+    def traduzir(self, conn, sql):
+        """(texto para o psycopg2, instrução preparada usada ou None) para executar `sql` em `conn`."""
+        instrucao = self.obter(sql)
+        instrucao.execucoes += 1
+        if not (PREPARAR_APOS and instrucao.preparavel and instrucao.execucoes > PREPARAR_APOS):
+            return instrucao.sql, None
+        preparadas = conn.preparadas
+        if instrucao.nome in preparadas:
+            preparadas.move_to_end(instrucao.nome)
+        elif not self._preparar(conn, instrucao, sql):
+            return instrucao.sql, None
+        instrucao.preparadas += 1
+        return instrucao.sql_executar(), instrucao
+
+    def _preparar(self, conn, instrucao, sql):
+        if conn.info.transaction_status == _psycopg2.extensions.TRANSACTION_STATUS_INERROR:
+            return False  # o comando vai falhar de qualquer jeito; prepara numa próxima vez
+        preparadas = conn.preparadas
+        cursor = conn.cursor()
+        try:
+            # Um PREPARE que falhe não pode abortar a transação de quem chamou
+            cursor.execute("SAVEPOINT preparar_instrucao")
+            try:
+                while len(preparadas) >= max(1, MAX_PREPARADAS):
+                    antiga, _ = preparadas.popitem(last=False)
+                    cursor.execute(f"DEALLOCATE {antiga}")
+                    self.liberadas += 1
+                cursor.execute(instrucao.sql_preparar(sql))
+            except _psycopg2.errors.DuplicatePreparedStatement:
+                # Já existia na sessão (o controle local se perdeu num erro anterior)
+                cursor.execute("ROLLBACK TO SAVEPOINT preparar_instrucao")
+            except _psycopg2.Error:
+                cursor.execute("ROLLBACK TO SAVEPOINT preparar_instrucao")
+                # Tipo de parâmetro que o servidor não deduz, por exemplo: fica sem preparar
+                instrucao.preparavel = False
+                instrucao.falhas += 1
+                return False
+            finally:
+                cursor.execute("RELEASE SAVEPOINT preparar_instrucao")
+        finally:
+            cursor.close()
+        preparadas[instrucao.nome] = None
+        instrucao.preparos += 1
+        return True
 
-    def __len__(self):
-        return len(self._vals)
+    def estatisticas(self):
+        with self._lock:
+            instrucoes = list(self._instrucoes.values())
+        execucoes = sum(i.execucoes for i in instrucoes)
+        preparadas = sum(i.preparadas for i in instrucoes)
+        return {
+            'distintas': len(instrucoes),
+            'preparaveis': sum(i.preparavel for i in instrucoes),
+            'execucoes': execucoes,
+            'execucoes_preparadas': preparadas,
+            'taxa_acerto': preparadas / execucoes if execucoes else 0.0,
+            'preparos': sum(i.preparos for i in instrucoes),
+            'falhas': sum(i.falhas for i in instrucoes),
+            'liberadas': self.liberadas,
+        }
+
+    def zerar(self):
+        """Zera os contadores (as instruções já preparadas continuam valendo)."""
+        with self._lock:
+            for instrucao in self._instrucoes.values():
+                instrucao.execucoes = instrucao.preparadas = instrucao.preparos = instrucao.falhas = 0
+            self.liberadas = 0
+
+
+_instrucoes = _RegistroInstrucoes()
+
+
+def estatisticas_instrucoes(zerar=False):
+    """Uso das instruções preparadas no PostgreSQL (dict; contadores zerados no SQLite).
+
+    'taxa_acerto' é a fração das execuções que foram `EXECUTE` de uma
+    instrução já preparada na conexão; 'preparos' conta os PREPARE feitos
+    (um por instrução quente em cada conexão do pool) e 'falhas' as consultas
+    que o servidor não aceitou preparar (executadas como texto).
+    """
+    estatisticas = _instrucoes.estatisticas()
+    if zerar:
+        _instrucoes.zerar()
+    return estatisticas
 
-    def keys(self):
-        return self._cols
 
+if _psycopg2 is not None:
+    class _ConexaoPg(_psycopg2.extensions.connection):
+        """Conexão psycopg2 que lembra as instruções preparadas nela (nomes, da usada há mais tempo à mais recente)."""
 
-def _wrap_rows(cursor, rows):
-    if not USE_POSTGRES:
-        return rows
-    if rows is None:
-        return rows
-    cols = [d[0] for d in cursor.description]
-    wrapped = []
-    for r in rows:
-        # r pode ser tuple ou dict dependendo do cursor
-        if isinstance(r, dict):
-            vals = [r.get(c) for c in cols]
-        else:
-            vals = list(r)
-        wrapped.append(RowProxy(cols, vals))
-    return wrapped
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.preparadas = OrderedDict()
 
+    class _CursorLinhas(_psycopg2.extensions.cursor):
+        """Cursor psycopg2 que devolve `Linha` em vez de tuplas simples."""
 
-def _wrap_row(cursor, row):
-    if not USE_POSTGRES:
-        return row
-    if row is None:
+        def _classe(self):
+            return _classe_linha(d[0] for d in self.description)
+
+        def fetchone(self):
+            linha = super().fetchone()
+            return None if linha is None else self._classe()(linha)
+
+        def fetchmany(self, size=None):
+            linhas = super().fetchmany(self.arraysize if size is None else size)
+            return list(map(self._classe(), linhas)) if linhas else linhas
+
+        def fetchall(self):
+            linhas = super().fetchall()
+            return list(map(self._classe(), linhas)) if linhas else linhas
+
+        def __iter__(self):
+            it = super().__iter__()
+            try:
+                primeira = next(it)
+            except StopIteration:
+                return
+            classe = self._classe()
+            yield classe(primeira)
+            for linha in it:
+                yield classe(linha)
+
+    class _CursorCompat(_CursorLinhas):
+        """`_CursorLinhas` que aceita os placeholders '?' usados nas queries do projeto.
+
+        A tradução passa pelo registro de instruções: consultas quentes são
+        executadas como instruções preparadas na conexão.
+        """
+
+        def execute(self, query, params=None):
+            sql, instrucao = _instrucoes.traduzir(self.connection, query)
+            if instrucao is None:
+                return super().execute(sql, params)
+            try:
+                return super().execute(sql, params)
+            except _psycopg2.errors.InvalidSqlStatementName:
+                # A sessão não tem mais a instrução: prepara de novo na próxima execução
+                self.connection.preparadas.pop(instrucao.nome, None)
+                raise
+
+        def executemany(self, query, params_seq):
+            return super().executemany(_instrucoes.obter(query).sql, params_seq)
+
+
+# --- Instrumentação ---
+_coletor = Coletor(LIMITE_LENTO_MS, EXPLICAR_LENTAS) if INSTRUMENTACAO else None
+_GLOBAIS = globals()
+_COMANDOS_EXPLICAVEIS = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE')
+
+
+def instrumentar(coletor):
+    """Liga a medição das consultas, entregando cada `Medicao` a `coletor`; None desliga.
+
+    Vale para as conexões obtidas por `conectar()` depois da chamada. Retorna o
+    coletor anterior.
+    """
+    global _coletor
+    anterior, _coletor = _coletor, coletor
+    return anterior
+
+
+def coletor_consultas():
+    """O coletor ativo (`instrumentacao.Coletor` por padrão) ou None se desligado."""
+    return _coletor
+
+
+def _chamador():
+    """(função pública do módulo que originou o comando, origem da chamada)."""
+    publica = privada = None
+    frame = sys._getframe(2)
+    while frame is not None and frame.f_globals is _GLOBAIS:
+        codigo = frame.f_code
+        if getattr(_GLOBAIS.get(codigo.co_name), '__code__', None) is codigo:
+            if codigo.co_name.startswith('_'):
+                privada = codigo.co_name
+            else:
+                publica = codigo.co_name
+        frame = frame.f_back
+    origem = origem_atual()
+    if origem is None and frame is not None:
+        origem = f"{frame.f_globals.get('__name__')}.{frame.f_code.co_name}"
+    return publica or privada, origem
+
+
+def _explicar(conn, sql, args):
+    """Plano de execução de `sql` em texto, ou None se o comando não admite EXPLAIN."""
+    if sql.lstrip().split(None, 1)[0].upper() not in _COMANDOS_EXPLICAVEIS:
         return None
-    cols = [d[0] for d in cursor.description]
-    if isinstance(row, dict):
-        vals = [row.get(c) for c in cols]
-    else:
-        vals = list(row)
-    return RowProxy(cols, vals)
+    cursor = conn.cursor()
+    try:
+        if USE_POSTGRES:
+            # Um EXPLAIN que falhe não pode abortar a transação de quem chamou
+            cursor.execute("SAVEPOINT explicar_consulta")
+            try:
+                cursor.execute("EXPLAIN " + sql.replace('?', '%s'), *args)
+                plano = "\n".join(linha[0] for linha in cursor.fetchall())
+            except Exception:
+                cursor.execute("ROLLBACK TO SAVEPOINT explicar_consulta")
+                raise
+            finally:
+                cursor.execute("RELEASE SAVEPOINT explicar_consulta")
+            return plano
+        cursor.execute("EXPLAIN QUERY PLAN " + sql, *args)
+        niveis = {0: -1}
+        linhas = []
+        for id_no, pai, _, detalhe in cursor.fetchall():
+            niveis[id_no] = niveis.get(pai, -1) + 1
+            linhas.append("  " * niveis[id_no] + detalhe)
+        return "\n".join(linhas)
+    except Exception as e:
+        return f"(plano indisponível: {e})"
+    finally:
+        cursor.close()
+
+
+class _CursorMedido:
+    """Mistura para cursores que medem cada comando e entregam a `Medicao` ao coletor.
+
+    A medição de um comando começa no `execute` e termina no próximo
+    `execute`, no `close()` do cursor ou no da conexão; só o tempo gasto dentro
+    do `execute` e dos fetches conta (não o do chamador entre um fetch e outro).
+    """
+    _medicao = None  # [sql, args, segundos, linhas, função, origem, erro]
+
+    def _medir(self, executar, sql, args):
+        self._encerrar_medicao()
+        funcao, origem = _chamador()
+        inicio = time.perf_counter()
+        try:
+            resultado = executar(sql, *args)
+        except Exception as e:
+            self._medicao = [sql, None, time.perf_counter() - inicio, 0, funcao, origem, type(e).__name__]
+            self._encerrar_medicao()
+            raise
+        self._medicao = [sql, args, time.perf_counter() - inicio, 0, funcao, origem, None]
+        return resultado
+
+    def execute(self, sql, *args):
+        return self._medir(super().execute, sql, args)
+
+    def executemany(self, sql, params_seq):
+        resultado = self._medir(super().executemany, sql, (params_seq,))
+        self._medicao[1] = None  # sem EXPLAIN para lotes
+        return resultado
+
+    def _contar(self, inicio, linhas):
+        medicao = self._medicao
+        if medicao is not None:
+            medicao[2] += time.perf_counter() - inicio
+            medicao[3] += linhas
+
+    def fetchone(self):
+        inicio = time.perf_counter()
+        linha = super().fetchone()
+        self._contar(inicio, linha is not None)
+        return linha
+
+    def fetchmany(self, *args):
+        inicio = time.perf_counter()
+        linhas = super().fetchmany(*args)
+        self._contar(inicio, len(linhas))
+        return linhas
+
+    def fetchall(self):
+        inicio = time.perf_counter()
+        linhas = super().fetchall()
+        self._contar(inicio, len(linhas))
+        return linhas
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        linha = self.fetchone()
+        if linha is None:
+            raise StopIteration
+        return linha
+
+    def close(self):
+        self._encerrar_medicao()
+        super().close()
+
+    def _encerrar_medicao(self):
+        medicao, self._medicao = self._medicao, None
+        coletor = _coletor
+        if medicao is None or coletor is None:
+            return
+        sql, args, segundos, linhas, funcao, origem, erro = medicao
+        if not linhas and erro is None:
+            # Sem linhas lidas: INSERT/UPDATE/DELETE informam as afetadas
+            linhas = max(self.rowcount, 0)
+        resultado = Medicao(sql, segundos * 1000, linhas, funcao, origem, erro)
+        if args is not None and coletor.deve_explicar(resultado):
+            resultado.plano = _explicar(self.connection, sql, args)
+        coletor.registrar(resultado)
+
+
+class _CursorSqliteMedido(_CursorMedido, sqlite3.Cursor):
+    pass
+
+
+if _psycopg2 is not None:
+    class _CursorCompatMedido(_CursorMedido, _CursorCompat):
+        pass
+
+
+def _conexao_saudavel(conn):
+    """Verifica se uma conexão ociosa ainda responde (usado pelo pool)."""
+    if USE_POSTGRES and conn.closed:
+        return False
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT 1")
+        cur.fetchone()
+        cur.close()
+        conn.rollback()
+        return True
+    except Exception:
+        return False
+
+
+def _fechar_silenciosamente(conn):
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+class PoolConexoes:
+    """Pool thread-safe de conexões reutilizáveis (SQLite ou PostgreSQL).
+
+    As conexões ociosas ficam numa pilha (a mais recente é reutilizada primeiro).
+    Uma conexão ociosa há mais de `intervalo_ping` segundos é testada com
+    `SELECT 1` antes de ser entregue e recriada se não responder. Quando todas
+    as `tamanho` conexões estão em uso, `obter()` aguarda até `timeout` segundos.
+    """
+
+    def __init__(self, fabrica, tamanho=5, timeout=30, intervalo_ping=30):
+        self._fabrica = fabrica
+        self.tamanho = max(1, tamanho)
+        self.timeout = timeout
+        self.intervalo_ping = intervalo_ping
+        self._ociosas = []  # pilha de (conexão, instante da devolução)
+        self._criadas = 0
+        self._cond = threading.Condition()
+
+    def _criar(self):
+        # A vaga já foi reservada em `_criadas`; libera se a conexão falhar
+        try:
+            return self._fabrica()
+        except Exception:
+            with self._cond:
+                self._criadas -= 1
+                self._cond.notify()
+            raise
+
+    def obter(self):
+        prazo = time.monotonic() + self.timeout
+        with self._cond:
+            while True:
+                if self._ociosas:
+                    conn, devolvida_em = self._ociosas.pop()
+                    break
+                if self._criadas < self.tamanho:
+                    self._criadas += 1
+                    conn = None
+                    break
+                restante = prazo - time.monotonic()
+                if restante <= 0:
+                    raise TimeoutError("Tempo esgotado aguardando uma conexão livre no pool.")
+                self._cond.wait(restante)
+
+        if conn is None:
+            return self._criar()
+        if time.monotonic() - devolvida_em >= self.intervalo_ping and not _conexao_saudavel(conn):
+            _fechar_silenciosamente(conn)
+            return self._criar()
+        return conn
+
+    def devolver(self, conn):
+        # Descarta qualquer transação pendente para a próxima pessoa receber a conexão limpa
+        try:
+            conn.rollback()
+            reutilizavel = not (USE_POSTGRES and conn.closed)
+        except Exception:
+            reutilizavel = False
+        with self._cond:
+            if reutilizavel:
+                self._ociosas.append((conn, time.monotonic()))
+            else:
+                self._criadas -= 1
+            self._cond.notify()
+        if not reutilizavel:
+            _fechar_silenciosamente(conn)
+
+    def obter_ociosa(self):
+        """Empresta uma conexão ociosa, sem esperar nem abrir outra (None se não houver)."""
+        with self._cond:
+            return self._ociosas.pop()[0] if self._ociosas else None
+
+    def fechar(self):
+        """Fecha todas as conexões ociosas (as emprestadas são fechadas ao voltar)."""
+        with self._cond:
+            ociosas, self._ociosas = self._ociosas, []
+            self._criadas -= len(ociosas)
+        for conn, _ in ociosas:
+            _fechar_silenciosamente(conn)
+
+
+class ConexaoPool:
+    """Conexão emprestada do pool.
+
+    Repassa tudo para a conexão real, exceto `close()`, que devolve a conexão
+    ao pool. Assim o padrão `conn, cursor = conectar() ... conn.close()` usado
+    em todo o módulo continua funcionando sem alterações.
+    """
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, nome):
+        conn = self.__dict__.get('_conn')
+        if conn is None:
+            raise AttributeError(f"Conexão já devolvida ao pool (atributo '{nome}').")
+        return getattr(conn, nome)
+
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._conn.__exit__(*exc)
+
+    def close(self):
+        cursor = self.__dict__.pop('_cursor_medido', None)
+        if cursor is not None:
+            cursor._encerrar_medicao()
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            self._pool.devolver(conn)
+
+    def __del__(self):
+        # Garante que uma conexão esquecida sem close() volte ao pool
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+def _nova_conexao():
+    if USE_POSTGRES:
+        return _psycopg2.connect(DATABASE_URL, connection_factory=_ConexaoPg)
+    # check_same_thread=False: a conexão pode ser emprestada a threads diferentes,
+    # mas o pool garante que apenas uma por vez a utilize
+    conn = sqlite3.connect(SQLITE_FILE, timeout=SQLITE_CONFIG['busy_timeout'] / 1000,
+                           check_same_thread=False)
+    conn.row_factory = sqlite3.Row  # Permite acessar colunas pelo nome
+    _aplicar_pragmas(conn)
+    return conn
+
+
+def _aplicar_pragmas(conn):
+    """Aplica o perfil de desempenho (`SQLITE_CONFIG`) a uma conexão SQLite."""
+    conn.execute(f"PRAGMA journal_mode = {SQLITE_CONFIG['journal_mode']}")
+    conn.execute(f"PRAGMA synchronous = {SQLITE_CONFIG['synchronous']}")
+    conn.execute(f"PRAGMA cache_size = {int(SQLITE_CONFIG['cache_size'])}")
+    conn.execute(f"PRAGMA mmap_size = {int(SQLITE_CONFIG['mmap_size'])}")
+    conn.execute(f"PRAGMA temp_store = {SQLITE_CONFIG['temp_store']}")
+
+
+class CheckpointWal(threading.Thread):
+    """Faz checkpoints PASSIVE periódicos do WAL numa conexão própria.
+
+    Sem isso o checkpoint acontece dentro do commit que ultrapassa o limite
+    automático, e esse commit paga a cópia das páginas para o banco.
+    """
+
+    def __init__(self, intervalo):
+        super().__init__(name='checkpoint-wal', daemon=True)
+        self.intervalo = intervalo
+        self._parar = threading.Event()
+
+    def run(self):
+        conn = None
+        try:
+            while not self._parar.wait(self.intervalo):
+                if conn is None:
+                    conn = sqlite3.connect(SQLITE_FILE, timeout=SQLITE_CONFIG['busy_timeout'] / 1000,
+                                           check_same_thread=False)
+                try:
+                    conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+                except sqlite3.Error:
+                    pass  # banco ocupado/bloqueado: tenta de novo no próximo intervalo
+        finally:
+            if conn is not None:
+                conn.close()
+
+    def parar(self):
+        self._parar.set()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_checkpoint = None
+
+
+def obter_pool():
+    """Retorna o pool de conexões do processo, criando-o no primeiro uso."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = PoolConexoes(_nova_conexao, POOL_SIZE, POOL_TIMEOUT, POOL_PING_INTERVAL)
+                _iniciar_checkpoint()
+    return _pool
+
+
+def _iniciar_checkpoint():
+    global _checkpoint
+    if (not USE_POSTGRES and SQLITE_CONFIG['journal_mode'] == 'WAL'
+            and SQLITE_CONFIG['checkpoint_interval'] > 0):
+        _checkpoint = CheckpointWal(SQLITE_CONFIG['checkpoint_interval'])
+        _checkpoint.start()
+
+
+def _otimizar_ao_encerrar():
+    """PRAGMA optimize e checkpoint final (SQLite), para o próximo início achar o WAL vazio."""
+    conn = _pool.obter_ociosa()
+    if conn is None:
+        return
+    try:
+        conn.execute("PRAGMA optimize")
+        if SQLITE_CONFIG['journal_mode'] == 'WAL':
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+    except sqlite3.Error:
+        pass
+    finally:
+        _pool.devolver(conn)
+
+
+def fechar_conexoes():
+    """Fecha as conexões ociosas do pool (chamado automaticamente ao sair).
+
+    No SQLite também encerra o checkpoint de fundo e roda `PRAGMA optimize`.
+    """
+    global _checkpoint
+    if _checkpoint is not None:
+        _checkpoint.parar()
+        _checkpoint = None
+    if _pool is not None:
+        if not USE_POSTGRES:
+            _otimizar_ao_encerrar()
+        _pool.fechar()
+
+
+atexit.register(fechar_conexoes)
+
+
+def _relatar_instrumentacao():
+    if _coletor is not None and _coletor.contadores():
+        print("Consultas por origem e função:\n" + _coletor.relatorio(), file=sys.stderr)
+        if USE_POSTGRES:
+            e = estatisticas_instrucoes()
+            print(f"Instruções preparadas: {e['execucoes_preparadas']} de {e['execucoes']} execuções "
+                  f"({e['taxa_acerto']:.1%}), {e['preparos']} PREPARE, {e['falhas']} recusadas", file=sys.stderr)
+
+
+if INSTRUMENTACAO:
+    # Ligada pela configuração: o resumo sai no stderr ao fechar a aplicação
+    atexit.register(_relatar_instrumentacao)
 
 
 def conectar():
     """Retorna uma conexão e cursor compatíveis com o restante do código.
 
+    A conexão vem do pool do processo (`obter_pool()`) e `conn.close()` a
+    devolve ao pool, evitando um novo handshake a cada operação.
+
     Se `DATABASE_URL` aponta para um PostgreSQL e o pacote estiver instalado,
     conecta ao Postgres e adapta a execução de queries (substitui '?' por '%s')
     para compatibilidade com as queries existentes no projeto.
     Caso contrário, mantém o comportamento original com sqlite3.
     """
-    if USE_POSTGRES:
-        conn = _psycopg2.connect(DATABASE_URL)
-        cursor = conn.cursor(cursor_factory=_psycopg2.extras.RealDictCursor)
-
-        # Ajusta o método execute para substituir placeholders '?' por '%s'
-        orig_execute = cursor.execute
+    pool = obter_pool()
+    conn = ConexaoPool(pool, pool.obter())
 
-        def execute(query, params=None):
-            q = query.replace('?', '%s')
-            if params is None:
-                return orig_execute(q)
-            return orig_execute(q, params)
+    if _coletor is not None:
+        # Com a instrumentação ligada o cursor mede cada comando; o que estiver
+        # em andamento é registrado no conn.close()
+        if USE_POSTGRES:
+            cursor = conn.cursor(cursor_factory=_CursorCompatMedido)
+        else:
+            cursor = conn.cursor(_CursorSqliteMedido)
+        conn._cursor_medido = cursor
+        return conn, cursor
 
-        cursor.execute = execute
+    if USE_POSTGRES:
+        cursor = conn.cursor(cursor_factory=_CursorCompat)
         return conn, cursor
 
-    # Fall back para SQLite
-    conn = sqlite3.connect('financeiro.db', timeout=20)
-    conn.row_factory = sqlite3.Row  # Permite acessar colunas pelo nome
     return conn, conn.cursor()
 
 
-def criar_tabelas():
-    """Cria as tabelas do banco de dados se não existirem."""
-    # Se estivermos usando PostgreSQL assumimos que a estrutura
-    # já foi criada pelo usuário/admin. Não tentamos aplicar DDL
-    # que foi escrito para SQLite (ex: AUTOINCREMENT, sqlite_master etc.).
-    if USE_POSTGRES:
-        return
+def _sql_agregado_sqlite(linha, sinal, projetado=True):
+    """Expressões (chave, deltas) de um lançamento NEW/OLD para os triggers do SQLite."""
+    chave = (f"{linha}.ano, {linha}.mes, COALESCE({linha}.categoria_id, 0), "
+             f"COALESCE({linha}.banco_id, 0)")
+    deltas = (f"{sinal}1, "
+              f"{sinal}(CASE WHEN COALESCE({linha}.valor_pago, 0) != 0 THEN 1 ELSE 0 END), "
+              f"{sinal}(CASE WHEN {linha}.valor_pago > 0 THEN {linha}.valor_pago ELSE 0 END), "
+              f"{sinal}(CASE WHEN {linha}.valor_pago < 0 THEN {linha}.valor_pago ELSE 0 END), "
+              f"{sinal}COALESCE({linha}.valor_previsto, 0), "
+              f"{sinal}COALESCE({linha}.valor_pago, 0)")
+    colunas = "qtd, qtd_pago, entradas, saidas, previsto, pago"
+    soma_projetado = ""
+    if projetado:
+        deltas += f", {sinal}COALESCE({linha}.valor_pago, {linha}.valor_previsto, 0)"
+        colunas += ", projetado"
+        soma_projetado = ",\n            projetado = projetado + excluded.projetado"
+    return f"""
+        INSERT INTO {T_AGREGADO}
+            (ano, mes, categoria_id, banco_id, {colunas})
+        VALUES ({chave}, {deltas})
+        ON CONFLICT (ano, mes, categoria_id, banco_id) DO UPDATE SET
+            qtd = qtd + excluded.qtd,
+            qtd_pago = qtd_pago + excluded.qtd_pago,
+            entradas = entradas + excluded.entradas,
+            saidas = saidas + excluded.saidas,
+            previsto = previsto + excluded.previsto,
+            pago = pago + excluded.pago{soma_projetado};
+        DELETE FROM {T_AGREGADO}
+        WHERE (ano, mes, categoria_id, banco_id) = ({chave}) AND qtd <= 0;
+    """
 
-    conn, cursor = conectar()
-    
-    # Verificar se existe backup para restaurar
-    cursor.execute("""
-        SELECT name FROM sqlite_master 
-        WHERE type='table' AND name=?;
+
+def _criar_agregados_sqlite(cursor, tipo_valor, projetado=True):
+    """Cria a tabela de agregados mensais e os triggers que a mantêm atualizada.
+
+    `tipo_valor` é o tipo das colunas de valor: REAL nas migrações 2 e 5, como
+    foram publicadas, e INTEGER (centavos) a partir da migração 6. A migração 2
+    é anterior à coluna `projetado` (`projetado=False`); a 5 a acrescenta.
+    """
+    coluna_projetado = (f"projetado {tipo_valor} NOT NULL DEFAULT 0,  -- pago, ou previsto enquanto não pago"
+                        if projetado else "")
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {T_AGREGADO}
+        (
+            ano INTEGER NOT NULL,
+            mes INTEGER NOT NULL,
+            categoria_id INTEGER NOT NULL DEFAULT 0,  -- 0 = sem categoria
+            banco_id INTEGER NOT NULL DEFAULT 0,      -- 0 = sem banco
+            qtd INTEGER NOT NULL DEFAULT 0,           -- lançamentos no grupo
+            qtd_pago INTEGER NOT NULL DEFAULT 0,      -- lançamentos com valor pago != 0
+            entradas {tipo_valor} NOT NULL DEFAULT 0,
+            saidas {tipo_valor} NOT NULL DEFAULT 0,
+            previsto {tipo_valor} NOT NULL DEFAULT 0,
+            pago {tipo_valor} NOT NULL DEFAULT 0,
+            {coluna_projetado}
+            PRIMARY KEY (ano, mes, categoria_id, banco_id)
+        ) WITHOUT ROWID
     """)
-    tem_backup = cursor.fetchone() is not None
-
-    # --- Tabelas de pré-cadastro ---
-    cursor.execute('''
-                   CREATE TABLE IF NOT EXISTS categorias
-                   (
-                       id
-                       INTEGER
-                       PRIMARY
-                       KEY
-                       AUTOINCREMENT,
-                       nome
-                       TEXT
-                       NOT
-                       NULL
-                       UNIQUE
-                   )
-                   ''')
-    cursor.execute('''
-                   CREATE TABLE IF NOT EXISTS bancos
-                   (
-                       id
-                       INTEGER
-                       PRIMARY
-                       KEY
-                       AUTOINCREMENT,
-                       nome
-                       TEXT
-                       NOT
-                       NULL
-                       UNIQUE
-                   )
-                   ''')
-    cursor.execute('''
-                   CREATE TABLE IF NOT EXISTS cartoes
-                   (
-                       id
-                       INTEGER
-                       PRIMARY
-                       KEY
-                       AUTOINCREMENT,
-                       nome
-                       TEXT
-                       NOT
-                       NULL
-                       UNIQUE
-                   )
-                   ''')
-
-    # --- Tabela principal de lançamentos ---
-    # Primeiro, vamos fazer backup da tabela existente se ela existir
     cursor.execute(f"""
-        CREATE TABLE IF NOT EXISTS lancamentos_backup AS
-        SELECT * FROM {T_LANCAMENTOS};
+        CREATE TRIGGER IF NOT EXISTS trg_{T_LANCAMENTOS}_agregado_ins
+        AFTER INSERT ON {T_LANCAMENTOS}
+        BEGIN {_sql_agregado_sqlite('NEW', '+', projetado)} END
     """)
-    
-    # Agora podemos dropar a tabela antiga
-    cursor.execute(f"DROP TABLE IF EXISTS {T_LANCAMENTOS};")
-    
-    # E criar a nova tabela com a estrutura correta
-    cursor.execute('''
-                   CREATE TABLE lancamentos
-                   (
-                       id INTEGER PRIMARY KEY AUTOINCREMENT,
-                       dia INTEGER NOT NULL,
-                       mes INTEGER NOT NULL,
-                       ano INTEGER NOT NULL,
-                       descricao TEXT NOT NULL,
-                       valor_previsto REAL DEFAULT NULL,
-                       valor_pago REAL DEFAULT NULL,
-                       categoria_id INTEGER,
-                       banco_id INTEGER,
-                       cartao_id INTEGER,
-                       FOREIGN
-                       KEY
-                   (
-                       categoria_id
-                   ) REFERENCES categorias
-                   (
-                       id
-                   ),
-                       FOREIGN KEY
-                   (
-                       banco_id
-                   ) REFERENCES bancos
-                   (
-                       id
-                   ),
-                       FOREIGN KEY
-                   (
-                       cartao_id
-                   ) REFERENCES cartoes
-                   (
-                       id
-                   )
-                       )
-                   ''')
-
-    conn.commit()
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_{T_LANCAMENTOS}_agregado_upd
+        AFTER UPDATE ON {T_LANCAMENTOS}
+        BEGIN {_sql_agregado_sqlite('OLD', '-', projetado)} {_sql_agregado_sqlite('NEW', '+', projetado)} END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_{T_LANCAMENTOS}_agregado_del
+        AFTER DELETE ON {T_LANCAMENTOS}
+        BEGIN {_sql_agregado_sqlite('OLD', '-', projetado)} END
+    """)
+
+
+# --- Migrações do schema (SQLite) ---
+#
+# Cada migração roda uma única vez: a versão aplicada fica em
+# `PRAGMA user_version`. Numa inicialização normal só essa versão é lida, sem
+# DDL nem cópia de dados. Para mudar o schema, acrescente uma nova função ao
+# final de MIGRACOES_SQLITE (nunca altere uma migração já publicada).
+#
+# No PostgreSQL a estrutura é criada/atualizada pelo administrador com
+# scripts/schema_postgres.sql; não aplicamos DDL escrito para SQLite.
+
+_SQL_LANCAMENTOS_SQLITE = """
+    CREATE TABLE {nome}
+    (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        dia INTEGER NOT NULL,
+        mes INTEGER NOT NULL,
+        ano INTEGER NOT NULL,
+        descricao TEXT NOT NULL,
+        valor_previsto REAL DEFAULT NULL,
+        valor_pago REAL DEFAULT NULL,
+        categoria_id INTEGER,
+        banco_id INTEGER,
+        cartao_id INTEGER,
+        FOREIGN KEY (categoria_id) REFERENCES categorias(id),
+        FOREIGN KEY (banco_id) REFERENCES bancos(id),
+        FOREIGN KEY (cartao_id) REFERENCES cartoes(id)
+    )
+"""
+
+
+def _tabela_existe(cursor, nome):
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?;", (nome,))
+    return cursor.fetchone() is not None
+
+
+def _coluna_existe(cursor, tabela, coluna):
+    cursor.execute(f"PRAGMA table_info({tabela})")
+    return any(col['name'] == coluna for col in cursor.fetchall())
+
+
+def _migracao_1_schema_inicial(cursor):
+    """Tabelas base; absorve as antigas rotinas de inicialização.
+
+    Bancos criados por versões anteriores podem ter `valor_previsto`/
+    `valor_pago` NOT NULL (recriamos a tabela permitindo nulos, como fazia
+    `migrar_estrutura_lancamentos`) ou ter os dados apenas em
+    `lancamentos_backup` (copiados de volta uma última vez). A tabela de backup
+    antiga não é apagada; pode ser removida manualmente depois de conferida.
+    """
+    for tabela in (T_CATEGORIAS, T_BANCOS, T_CARTOES):
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {tabela}
+            (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                nome TEXT NOT NULL UNIQUE
+            )
+        """)
+
+    if not _tabela_existe(cursor, T_LANCAMENTOS):
+        cursor.execute(_SQL_LANCAMENTOS_SQLITE.format(nome=T_LANCAMENTOS))
+    else:
+        cursor.execute(f"PRAGMA table_info({T_LANCAMENTOS})")
+        valores_not_null = any(col['name'] in ('valor_previsto', 'valor_pago') and col['notnull']
+                               for col in cursor.fetchall())
+        if valores_not_null:
+            cursor.execute(f"ALTER TABLE {T_LANCAMENTOS} RENAME TO lancamentos_old;")
+            cursor.execute(_SQL_LANCAMENTOS_SQLITE.format(nome=T_LANCAMENTOS))
+            cursor.execute(f"""
+                INSERT INTO {T_LANCAMENTOS}
+                SELECT id, dia, mes, ano, descricao, valor_previsto, valor_pago,
+                       categoria_id, banco_id, cartao_id
+                FROM lancamentos_old
+            """)
+            cursor.execute("DROP TABLE lancamentos_old;")
+
+    cursor.execute(f"SELECT COUNT(*) FROM {T_LANCAMENTOS};")
+    if cursor.fetchone()[0] == 0 and _tabela_existe(cursor, T_LANCAMENTOS_BACKUP):
+        cursor.execute(f"""
+            INSERT INTO {T_LANCAMENTOS}
+            SELECT id, dia, mes, ano, descricao, valor_previsto, valor_pago,
+                   categoria_id, banco_id, cartao_id
+            FROM {T_LANCAMENTOS_BACKUP}
+        """)
+
+
+def _migracao_2_agregados_e_indice_listagem(cursor):
+    """Agregados mensais (com triggers) e índice da ordem da listagem."""
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{T_LANCAMENTOS}_data ON {T_LANCAMENTOS}(ano, mes, dia, id);")
+    _criar_agregados_sqlite(cursor, 'REAL', projetado=False)
+    _reconstruir_agregados(cursor, _COLUNAS_AGREGADO[:-1])
+
+
+def _fts5_disponivel(cursor):
+    try:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        if cursor.fetchone()[0]:
+            return True
+        # Pode vir como módulo carregado à parte: tenta criar uma tabela temporária
+        cursor.execute("CREATE VIRTUAL TABLE temp.teste_fts5 USING fts5(x)")
+        cursor.execute("DROP TABLE temp.teste_fts5")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+def _migracao_3_busca_textual(cursor):
+    """Índice FTS5 das descrições (mantido por triggers) para `buscar_lancamentos`.
+
+    Tabela de conteúdo externo: guarda só o índice, o texto continua em
+    lançamentos. `remove_diacritics` faz "salario" achar "Salário" e os índices
+    de prefixo de 2 e 3 letras atendem a busca enquanto o usuário digita. Sem
+    FTS5 na biblioteca SQLite a migração não cria nada e a busca usa LIKE.
+    """
+    if not _fts5_disponivel(cursor):
+        return
+    cursor.execute(f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS {T_BUSCA} USING fts5(
+            descricao, content='{T_LANCAMENTOS}', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3')
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_{T_BUSCA}_insert AFTER INSERT ON {T_LANCAMENTOS} BEGIN
+            INSERT INTO {T_BUSCA}(rowid, descricao) VALUES (NEW.id, NEW.descricao);
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_{T_BUSCA}_delete AFTER DELETE ON {T_LANCAMENTOS} BEGIN
+            INSERT INTO {T_BUSCA}({T_BUSCA}, rowid, descricao) VALUES ('delete', OLD.id, OLD.descricao);
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_{T_BUSCA}_update AFTER UPDATE OF descricao ON {T_LANCAMENTOS} BEGIN
+            INSERT INTO {T_BUSCA}({T_BUSCA}, rowid, descricao) VALUES ('delete', OLD.id, OLD.descricao);
+            INSERT INTO {T_BUSCA}(rowid, descricao) VALUES (NEW.id, NEW.descricao);
+        END
+    """)
+    cursor.execute(f"INSERT INTO {T_BUSCA}({T_BUSCA}) VALUES ('rebuild')")
+
+
+def _migracao_4_indices_filtros(cursor):
+    """Índices para os filtros por categoria, banco e cartão (`FiltroLancamentos`).
+
+    Cada um termina na ordem da listagem, então a página filtrada sai do
+    índice já ordenada, sem ler o resto da tabela nem ordenar.
+    """
+    for cadastro in ('categoria', 'banco', 'cartao'):
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{T_LANCAMENTOS}_{cadastro} "
+                       f"ON {T_LANCAMENTOS}({cadastro}_id, ano, mes, dia, id)")
+
+
+def _migracao_5_saldos(cursor):
+    """Saldo inicial dos bancos e total projetado nos agregados (saldo corrido).
+
+    `projetado` soma o valor pago, ou o previsto enquanto não há pagamento; com
+    ele o saldo projetado antes de um mês sai dos agregados, sem somar o
+    histórico. Os triggers dos agregados são recriados com a nova coluna.
+    """
+    if not _coluna_existe(cursor, T_BANCOS, 'saldo_inicial'):
+        cursor.execute(f"ALTER TABLE {T_BANCOS} ADD COLUMN saldo_inicial REAL NOT NULL DEFAULT 0")
+    cursor.execute(f"ALTER TABLE {T_AGREGADO} ADD COLUMN projetado REAL NOT NULL DEFAULT 0")
+    for operacao in ('ins', 'upd', 'del'):
+        cursor.execute(f"DROP TRIGGER IF EXISTS trg_{T_LANCAMENTOS}_agregado_{operacao}")
+    _criar_agregados_sqlite(cursor, 'REAL')
+    _reconstruir_agregados(cursor)
+
+
+_SQL_LANCAMENTOS_CENTAVOS_SQLITE = """
+    CREATE TABLE {nome}
+    (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        dia INTEGER NOT NULL,
+        mes INTEGER NOT NULL,
+        ano INTEGER NOT NULL,
+        descricao TEXT NOT NULL,
+        valor_previsto INTEGER DEFAULT NULL,  -- centavos
+        valor_pago INTEGER DEFAULT NULL,      -- centavos
+        categoria_id INTEGER,
+        banco_id INTEGER,
+        cartao_id INTEGER,
+        FOREIGN KEY (categoria_id) REFERENCES categorias(id),
+        FOREIGN KEY (banco_id) REFERENCES bancos(id),
+        FOREIGN KEY (cartao_id) REFERENCES cartoes(id)
+    )
+"""
+
+_SQL_BANCOS_SQLITE = """
+    CREATE TABLE {nome}
+    (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nome TEXT NOT NULL UNIQUE,
+        saldo_inicial INTEGER NOT NULL DEFAULT 0  -- centavos
+    )
+"""
+
+
+def _sql_em_centavos(coluna):
+    # CAST AS REAL também lê valores gravados como texto por versões antigas
+    return f"CAST(ROUND(CAST({coluna} AS REAL) * 100) AS INTEGER)"
+
+
+def _recriar_tabela(cursor, tabela, sql_tabela, colunas):
+    """Recria `tabela` com `sql_tabela` copiando os dados (`colunas`: nome -> expressão).
+
+    É o procedimento do SQLite para mudar o tipo de colunas: tabela nova, cópia,
+    troca de nome. Índices e triggers da tabela são recriados com o SQL
+    original e a sequência do AUTOINCREMENT é preservada.
+    """
+    cursor.execute("SELECT sql FROM sqlite_master WHERE tbl_name = ? AND type IN ('index', 'trigger') "
+                   "AND sql IS NOT NULL", (tabela,))
+    objetos = [linha['sql'] for linha in cursor.fetchall()]
+    cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (tabela,))
+    sequencia = cursor.fetchone()
+    nova = f"{tabela}_nova"
+    cursor.execute(sql_tabela.format(nome=nova))
+    cursor.execute(f"INSERT INTO {nova} ({', '.join(colunas)}) "
+                   f"SELECT {', '.join(colunas.values())} FROM {tabela}")
+    cursor.execute(f"DROP TABLE {tabela}")
+    cursor.execute(f"ALTER TABLE {nova} RENAME TO {tabela}")
+    for sql in objetos:
+        cursor.execute(sql)
+    if sequencia is not None:
+        cursor.execute("DELETE FROM sqlite_sequence WHERE name = ?", (tabela,))
+        cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (tabela, sequencia['seq']))
+
+
+def _migracao_6_valores_em_centavos(cursor):
+    """Valores monetários em centavos (INTEGER) em vez de REAL.
+
+    Com REAL as somas acumulavam erro de ponto flutuante (0,10 + 0,20 não dá
+    0,30) e valores gravados como texto exigiam CAST em cada leitura. As
+    tabelas são recriadas porque uma coluna REAL converteria os centavos de
+    volta para ponto flutuante; os agregados são recalculados em centavos.
+    """
+    _recriar_tabela(cursor, T_LANCAMENTOS, _SQL_LANCAMENTOS_CENTAVOS_SQLITE, {
+        'id': 'id', 'dia': 'dia', 'mes': 'mes', 'ano': 'ano', 'descricao': 'descricao',
+        'valor_previsto': _sql_em_centavos('valor_previsto'), 'valor_pago': _sql_em_centavos('valor_pago'),
+        'categoria_id': 'categoria_id', 'banco_id': 'banco_id', 'cartao_id': 'cartao_id'})
+    _recriar_tabela(cursor, T_BANCOS, _SQL_BANCOS_SQLITE, {
+        'id': 'id', 'nome': 'nome', 'saldo_inicial': _sql_em_centavos('saldo_inicial')})
+    cursor.execute(f"DROP TABLE {T_AGREGADO}")
+    _criar_agregados_sqlite(cursor, 'INTEGER')
+    _reconstruir_agregados(cursor)
+
+
+_SQL_RECORRENCIAS_SQLITE = """
+    CREATE TABLE IF NOT EXISTS {nome}
+    (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        descricao TEXT NOT NULL,
+        frequencia TEXT NOT NULL CHECK (frequencia IN ('mensal', 'anual')),
+        parcelado INTEGER NOT NULL DEFAULT 0,
+        dia INTEGER NOT NULL,   -- primeira ocorrência
+        mes INTEGER NOT NULL,
+        ano INTEGER NOT NULL,
+        quantidade INTEGER,     -- NULL = sem fim
+        valor INTEGER NOT NULL, -- centavos; nas parcelas, o total
+        categoria_id INTEGER REFERENCES categorias(id),
+        banco_id INTEGER REFERENCES bancos(id),
+        cartao_id INTEGER REFERENCES cartoes(id),
+        geradas INTEGER NOT NULL DEFAULT 0
+    )
+"""
+
+
+def _migracao_7_recorrencias(cursor):
+    """Regras de recorrência e parcelamento (`criar_recorrencia`).
+
+    Os lançamentos gerados por uma regra guardam `recorrencia_id` e o número
+    da ocorrência (`parcela`); o índice único nesse par impede que a mesma
+    ocorrência seja gerada duas vezes por clientes expandindo ao mesmo tempo.
+    """
+    cursor.execute(_SQL_RECORRENCIAS_SQLITE.format(nome=T_RECORRENCIAS))
+    if not _coluna_existe(cursor, T_LANCAMENTOS, 'recorrencia_id'):
+        cursor.execute(f"ALTER TABLE {T_LANCAMENTOS} ADD COLUMN recorrencia_id INTEGER "
+                       f"REFERENCES {T_RECORRENCIAS}(id)")
+    if not _coluna_existe(cursor, T_LANCAMENTOS, 'parcela'):
+        cursor.execute(f"ALTER TABLE {T_LANCAMENTOS} ADD COLUMN parcela INTEGER")
+    cursor.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS idx_{T_LANCAMENTOS}_recorrencia "
+                   f"ON {T_LANCAMENTOS}(recorrencia_id, parcela)")
+
+
+def _migracao_8_ciclo_cartoes(cursor):
+    """Dias de fechamento e de vencimento dos cartões (`obter_faturas`).
+
+    Os totais por fatura usam o índice (cartao_id, ano, mes, dia, id) da
+    migração 4: a consulta lê só o intervalo de datas do cartão.
+    """
+    for coluna in ('dia_fechamento', 'dia_vencimento'):
+        if not _coluna_existe(cursor, T_CARTOES, coluna):
+            cursor.execute(f"ALTER TABLE {T_CARTOES} ADD COLUMN {coluna} INTEGER "
+                           f"CHECK ({coluna} BETWEEN 1 AND 31)")
+
+
+MIGRACOES_SQLITE = [
+    (1, _migracao_1_schema_inicial),
+    (2, _migracao_2_agregados_e_indice_listagem),
+    (3, _migracao_3_busca_textual),
+    (4, _migracao_4_indices_filtros),
+    (5, _migracao_5_saldos),
+    (6, _migracao_6_valores_em_centavos),
+    (7, _migracao_7_recorrencias),
+    (8, _migracao_8_ciclo_cartoes),
+]
+
+
+def versao_schema():
+    """Versão do schema SQLite aplicada (PRAGMA user_version); None no PostgreSQL."""
+    if USE_POSTGRES:
+        return None
+    conn, cursor = conectar()
+    cursor.execute("PRAGMA user_version")
+    versao = cursor.fetchone()[0]
     conn.close()
+    return versao
+
+
+def aplicar_migracoes():
+    """Aplica as migrações pendentes do schema SQLite, cada uma em sua transação.
+
+    Retorna a lista dos números das migrações aplicadas (vazia quando o banco
+    já está atualizado, o caso de toda inicialização normal).
+    """
+    if USE_POSTGRES:
+        return []
+
+    conn, cursor = conectar()
+    try:
+        cursor.execute("PRAGMA user_version")
+        versao = cursor.fetchone()[0]
+        aplicadas = []
+        for numero, migracao in MIGRACOES_SQLITE:
+            if numero <= versao:
+                continue
+            cursor.execute("BEGIN")
+            try:
+                migracao(cursor)
+                cursor.execute(f"PRAGMA user_version = {int(numero)}")
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            aplicadas.append(numero)
+        return aplicadas
+    finally:
+        conn.close()
+
+
+# --- Cache dos cadastros (categorias, bancos, cartões) ---
+#
+# Os cadastros são poucos e mudam raramente; ficam em memória (id -> nome) e
+# são recarregados quando `adicionar_item_cadastro`/a importação criam itens,
+# ou quando aparece um id desconhecido (item criado por outro processo).
+
+_cadastros = {}
+_cadastros_lock = threading.Lock()
+TABELAS_CADASTRO = (T_CATEGORIAS, T_BANCOS, T_CARTOES)
+
+
+def _carregar_cadastros(tabelas):
+    conn, cursor = conectar()
+    try:
+        carregados = {}
+        for tabela in tabelas:
+            cursor.execute(f"SELECT id, nome FROM {tabela}")
+            carregados[tabela] = {int(item['id']): item['nome'] for item in cursor.fetchall()}
+    finally:
+        conn.close()
+    with _cadastros_lock:
+        _cadastros.update(carregados)
+    return carregados
+
+
+def nomes_cadastro(tabela):
+    """Mapa id -> nome de um cadastro, do cache (não altere o dict retornado)."""
+    nomes = _cadastros.get(tabela)
+    if nomes is None:
+        # Carrega de uma vez todos os cadastros ainda fora do cache
+        faltando = [t for t in TABELAS_CADASTRO if t not in _cadastros] or [tabela]
+        nomes = _carregar_cadastros(faltando)[tabela]
+    return nomes
+
+
+def invalidar_cadastros(tabela=None):
+    """Descarta o cache de um cadastro (ou de todos); o próximo acesso recarrega."""
+    with _cadastros_lock:
+        if tabela is None:
+            _cadastros.clear()
+        else:
+            _cadastros.pop(tabela, None)
+
+
+def _mapas_nomes(ids_por_tabela):
+    """Mapas id -> nome das tabelas, recarregando (uma vez) as que têm ids desconhecidos."""
+    mapas = {tabela: nomes_cadastro(tabela) for tabela in ids_por_tabela}
+    desatualizadas = [tabela for tabela, ids in ids_por_tabela.items()
+                      if any(i is not None and i not in mapas[tabela] for i in ids)]
+    if desatualizadas:
+        mapas.update(_carregar_cadastros(desatualizadas))
+    return mapas
 
 
 # --- Funções CRUD para Cadastros (genéricas) ---
@@ -288,6 +1439,7 @@ def adicionar_item_cadastro(tabela, nome):
         conn, cursor = conectar()
         cursor.execute(f"INSERT INTO {tabela} (nome) VALUES (?)", (nome, ))
         conn.commit()
+        invalidar_cadastros(tabela)
     except Exception as e:
         # Normaliza erro de unicidade para o frontend
         msg = str(e).lower()
@@ -299,139 +1451,46 @@ def adicionar_item_cadastro(tabela, nome):
 
 
 def listar_itens_cadastro(tabela):
-    conn, cursor = conectar()
-    cursor.execute(f"SELECT * FROM {tabela} ORDER BY nome")
-    itens = cursor.fetchall()
-    itens = _wrap_rows(cursor, itens)
-    conn.close()
-    return itens
+    """Itens do cadastro (linhas com 'id' e 'nome') em ordem de nome, vindos do cache."""
+    linha = _classe_linha(('id', 'nome'))
+    return [linha(item) for item in sorted(nomes_cadastro(tabela).items(), key=lambda item: item[1])]
 
 
-# --- Funções CRUD para Lançamentos ---
+def obter_saldos_iniciais():
+    """Saldo inicial de cada banco ({id: valor}): o saldo da conta antes do primeiro lançamento."""
+    conn, cursor = conectar()
+    try:
+        if not _colunas_saldo(cursor)[0]:
+            return {}
+        cursor.execute(f"SELECT id, {_centavos('saldo_inicial')} as saldo_inicial FROM {T_BANCOS}")
+        return {linha['id']: linha['saldo_inicial'] for linha in cursor.fetchall()}
+    finally:
+        conn.close()
 
-def restaurar_backup():
-    """Restaura os dados do backup."""
-    # Esta operação foi implementada originalmente para SQLite
-    # (manipula arquivo DB). Para PostgreSQL não fazemos restauração
-    # automática aqui — assume-se que o banco está pronto.
-    if USE_POSTGRES:
-        return True
 
-    with sqlite3.connect('financeiro.db', timeout=20) as conn:
-        cursor = conn.cursor()
-        try:
-            cursor.execute("BEGIN TRANSACTION")
-            
-            # Primeiro, vamos limpar a tabela atual
-            cursor.execute(f"DELETE FROM {T_LANCAMENTOS};")
-            
-            # Agora vamos copiar os dados do backup
-            cursor.execute(f"""
-                INSERT INTO {T_LANCAMENTOS} 
-                SELECT id, dia, mes, ano, descricao, 
-                       valor_previsto,
-                       valor_pago,
-                       categoria_id, banco_id, cartao_id
-                FROM lancamentos_backup
-            """)
-            
-            cursor.execute("COMMIT")
-            return True
-        except:
-            cursor.execute("ROLLBACK")
-            raise
+def definir_saldo_inicial(id_banco, valor):
+    """Define o saldo inicial do banco (base do saldo corrido da listagem)."""
+    conn, cursor = conectar()
+    try:
+        if not _colunas_saldo(cursor)[0]:
+            raise RuntimeError(f"A coluna '{T_BANCOS}.saldo_inicial' não existe. "
+                               "Aplique a seção de saldos de scripts/schema_postgres.sql.")
+        cursor.execute(f"UPDATE {T_BANCOS} SET saldo_inicial = ? WHERE id = ?", (_valor_banco(valor or 0), id_banco))
+        conn.commit()
+    finally:
+        conn.close()
+    _lancamentos_alterados()
 
-def migrar_estrutura_lancamentos():
-    """Migra a estrutura da tabela lancamentos para permitir valores nulos."""
-    import os
-    import shutil
-    from datetime import datetime
-    
-    # Criar backup do banco de dados antes de qualquer alteração
-    db_path = 'financeiro.db'
-    backup_path = f'financeiro_backup_{datetime.now().strftime("%Y%m%d_%H%M%S")}.db'
-    
-    # Fazer backup do arquivo original
-    shutil.copy2(db_path, backup_path)
-    
-    if USE_POSTGRES:
-        # Migração específica de arquivo/PRAGMA não aplicável a PostgreSQL
-        return
 
-    with sqlite3.connect(db_path, timeout=20) as conn:
-        cursor = conn.cursor()
-        
-        # Verificar se existem dados na tabela
-        cursor.execute(f"SELECT COUNT(*) FROM {T_LANCAMENTOS};")
-        count = cursor.fetchone()[0]
-        
-        if count > 0:
-            # Se houver dados, vamos alterar a tabela mantendo os dados
-            cursor.execute("PRAGMA foreign_keys=off")
-            
-            try:
-                cursor.execute("BEGIN TRANSACTION")
-                
-                # Primeiro, vamos renomear a tabela atual para backup
-                cursor.execute(f'ALTER TABLE {T_LANCAMENTOS} RENAME TO lancamentos_old;')
-                
-                # Criar nova tabela com a estrutura correta
-                cursor.execute('''
-                    CREATE TABLE lancamentos
-                    (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        dia INTEGER NOT NULL,
-                        mes INTEGER NOT NULL,
-                        ano INTEGER NOT NULL,
-                        descricao TEXT NOT NULL,
-                        valor_previsto REAL DEFAULT NULL,
-                        valor_pago REAL DEFAULT NULL,
-                        categoria_id INTEGER,
-                        banco_id INTEGER,
-                        cartao_id INTEGER,
-                        FOREIGN KEY (categoria_id) REFERENCES categorias(id),
-                        FOREIGN KEY (banco_id) REFERENCES bancos(id),
-                        FOREIGN KEY (cartao_id) REFERENCES cartoes(id)
-                    )
-                ''')
-                
-                # Copiar dados da tabela antiga para a nova
-                cursor.execute(f'''
-                    INSERT INTO {T_LANCAMENTOS} 
-                    SELECT id, dia, mes, ano, descricao, 
-                           valor_previsto,
-                           valor_pago,
-                           categoria_id, banco_id, cartao_id
-                    FROM lancamentos_old
-                ''')
-                
-                # Verificar se a cópia foi bem sucedida
-                cursor.execute(f"SELECT COUNT(*) FROM {T_LANCAMENTOS};")
-                new_count = cursor.fetchone()[0]
-                
-                if new_count == count:
-                    # Se a cópia foi bem sucedida, podemos remover a tabela antiga
-                    cursor.execute('DROP TABLE lancamentos_old;')
-                    cursor.execute("COMMIT")
-                else:
-                    # Se algo deu errado, fazemos rollback
-                    raise Exception("Erro na migração: contagem de registros não confere")
-                    
-            except Exception as e:
-                cursor.execute("ROLLBACK")
-                # Restaurar tabela original se algo deu errado
-                cursor.execute(f'DROP TABLE IF EXISTS {T_LANCAMENTOS};')
-                cursor.execute(f'ALTER TABLE lancamentos_old RENAME TO {T_LANCAMENTOS};')
-                raise e
-            finally:
-                cursor.execute("PRAGMA foreign_keys=on")
+# --- Funções CRUD para Lançamentos ---
 
 def adicionar_lancamento(dados):
+    """Insere um lançamento e retorna a linha criada no formato da listagem."""
     conn, cursor = conectar()
     try:
         # Garantir que os valores podem ser nulos
-        valor_previsto = dados.get('valor_previsto')
-        valor_pago = dados.get('valor_pago')
+        valor_previsto = _valor_banco(dados.get('valor_previsto'))
+        valor_pago = _valor_banco(dados.get('valor_pago'))
         
         if USE_POSTGRES:
             from datetime import date
@@ -440,6 +1499,7 @@ def adicionar_lancamento(dados):
                 INSERT INTO {T_LANCAMENTOS} 
                     ({C_LANC_DATA}, {C_LANC_DESCRICAO}, {C_LANC_ID_CATEGORIA}, {C_LANC_ID_BANCO}, {C_LANC_ID_CARTAO}, {C_LANC_VLR_PREVISTO}, {C_LANC_VLR_PAGO})
                 VALUES (?, ?, ?, ?, ?, ?, ?)
+                RETURNING {C_LANC_ID} as id
             """
             params = (data_lanc, dados['descricao'], dados['categoria_id'], dados['banco_id'], dados['cartao_id'], valor_previsto, valor_pago)
         else:
@@ -452,7 +1512,14 @@ def adicionar_lancamento(dados):
                       dados['banco_id'], dados['cartao_id'], valor_previsto, valor_pago)
 
         cursor.execute(query, params)
+        if USE_POSTGRES:
+            novo_id = cursor.fetchone()['id']
+        else:
+            novo_id = cursor.lastrowid
+        lancamento = _obter_lancamento(cursor, novo_id)
         conn.commit()
+        _lancamentos_alterados()
+        return lancamento
     except Exception as e:
         raise e
     finally:
@@ -460,11 +1527,12 @@ def adicionar_lancamento(dados):
 
 
 def atualizar_lancamento(id_lancamento, dados):
+    """Atualiza um lançamento e retorna a linha resultante no formato da listagem."""
     conn, cursor = conectar()
     try:
         # Garantir que os valores podem ser nulos
-        valor_previsto = dados.get('valor_previsto')
-        valor_pago = dados.get('valor_pago')
+        valor_previsto = _valor_banco(dados.get('valor_previsto'))
+        valor_pago = _valor_banco(dados.get('valor_pago'))
 
         if USE_POSTGRES:
             from datetime import date
@@ -488,7 +1556,10 @@ def atualizar_lancamento(id_lancamento, dados):
                       dados['banco_id'], dados['cartao_id'], valor_previsto, valor_pago, id_lancamento)
 
         cursor.execute(query, params)
+        lancamento = _obter_lancamento(cursor, id_lancamento)
         conn.commit()
+        _lancamentos_alterados()
+        return lancamento
     except Exception as e:
         raise e
     finally:
@@ -496,32 +1567,710 @@ def atualizar_lancamento(id_lancamento, dados):
 
 
 def excluir_lancamento(id_lancamento):
+    """Exclui o lançamento e retorna a linha como estava (None se não existia)."""
     conn, cursor = conectar()
-    if USE_POSTGRES:
-        id_col = C_LANC_ID
-    else:
-        id_col = "id"
-    cursor.execute(f"DELETE FROM {T_LANCAMENTOS} WHERE {id_col}=?;", (id_lancamento,))
-    conn.commit()
-    conn.close()
+    try:
+        if USE_POSTGRES:
+            id_col = C_LANC_ID
+        else:
+            id_col = "id"
+        lancamento = _obter_lancamento(cursor, id_lancamento)
+        cursor.execute(f"DELETE FROM {T_LANCAMENTOS} WHERE {id_col}=?;", (id_lancamento,))
+        conn.commit()
+    finally:
+        conn.close()
+    _lancamentos_alterados()
+    return lancamento
+
+
+def _obter_lancamento(cursor, id_lancamento):
+    id_col = C_LANC_ID if USE_POSTGRES else "id"
+    query, _, _ = _sql_listagem()
+    cursor.execute(query + f" WHERE l.{id_col} = ?", (id_lancamento,))
+    lancamento = cursor.fetchone()
+    return lancamento and _resolver_nomes([lancamento])[0]
 
 
-def listar_lancamentos_filtrados(mes=None, ano=None, somente_previsto=False):
+def obter_lancamento(id_lancamento):
+    """Retorna um lançamento no formato da listagem (com nomes dos cadastros), ou None."""
     conn, cursor = conectar()
+    try:
+        return _obter_lancamento(cursor, id_lancamento)
+    finally:
+        conn.close()
+
 
+# --- Importação em lote ---
+
+def _mapear_nomes_cadastro(cursor, tabela, nomes, mapa):
+    """Completa `mapa` (nome -> id) com os `nomes` de `tabela`, criando os que faltam.
+
+    Retorna True se algum item foi criado, False caso contrário. São no máximo
+    três comandos por chamada (busca, inserção dos novos e busca dos ids
+    criados), não importa quantos nomes o lote traga.
+    """
+    faltando = sorted({nome for nome in nomes if nome and nome not in mapa})
+    if not faltando:
+        return False
+    marcadores = ", ".join("?" * len(faltando))
+    cursor.execute(f"SELECT id, nome FROM {tabela} WHERE nome IN ({marcadores})", faltando)
+    for item in cursor.fetchall():
+        mapa[item['nome']] = item['id']
+
+    novos = [nome for nome in faltando if nome not in mapa]
+    if novos:
+        cursor.executemany(f"INSERT INTO {tabela} (nome) VALUES (?)", [(nome,) for nome in novos])
+        marcadores = ", ".join("?" * len(novos))
+        cursor.execute(f"SELECT id, nome FROM {tabela} WHERE nome IN ({marcadores})", novos)
+        for item in cursor.fetchall():
+            mapa[item['nome']] = item['id']
+        return True
+    return False
+
+
+def _inserir_lote(conn, cursor, linhas):
+    """Insere as linhas (tuplas já com ids resolvidos) com um único comando."""
     if USE_POSTGRES:
-        query = f"""
-            SELECT l.{C_LANC_ID} as id,
-                   EXTRACT(DAY FROM l.{C_LANC_DATA}) as dia,
-                   EXTRACT(MONTH FROM l.{C_LANC_DATA}) as mes,
-                   EXTRACT(YEAR FROM l.{C_LANC_DATA}) as ano,
-                   l.{C_LANC_DESCRICAO} as descricao,
-                   c.nome as categoria,
-                   b.nome as banco,
-                   cr.nome as cartao,
-                   l.{C_LANC_VLR_PREVISTO} as valor_previsto,
-                   l.{C_LANC_VLR_PAGO} as valor_pago
-            FROM {T_LANCAMENTOS} l
+        # execute_values monta um único INSERT ... VALUES (...), (...) por página.
+        # Usa um cursor sem o adaptador de '?' (os valores já vão no SQL final).
+        bruto = conn.cursor()
+        _psycopg2.extras.execute_values(bruto, f"""
+            INSERT INTO {T_LANCAMENTOS}
+                ({C_LANC_DATA}, {C_LANC_DESCRICAO}, {C_LANC_ID_CATEGORIA}, {C_LANC_ID_BANCO},
+                 {C_LANC_ID_CARTAO}, {C_LANC_VLR_PREVISTO}, {C_LANC_VLR_PAGO})
+            VALUES %s
+        """, linhas, page_size=len(linhas))
+        bruto.close()
+    else:
+        cursor.executemany(f"""
+            INSERT INTO {T_LANCAMENTOS}
+                (dia, mes, ano, descricao, categoria_id, banco_id, cartao_id, valor_previsto, valor_pago)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, linhas)
+
+
+def importar_lancamentos(registros, tamanho_lote=1000, ao_progredir=None):
+    """Importa lançamentos em lote, numa única transação.
+
+    `registros` é qualquer iterável (pode ser um gerador lendo um arquivo) de
+    dicts com 'data' (date), 'descricao', 'valor_previsto', 'valor_pago' e,
+    opcionalmente, os nomes 'categoria', 'banco' e 'cartao' (criados se não
+    existirem) e 'linha' (posição no arquivo, para as mensagens). Um dict com a
+    chave 'erro' representa uma linha que o leitor do arquivo já rejeitou.
+
+    Os registros são gravados em lotes de `tamanho_lote` (executemany no
+    SQLite, execute_values no PostgreSQL), cada um protegido por um SAVEPOINT:
+    se o lote falha, ele é refeito linha a linha e só as linhas com problema
+    ficam de fora. `ao_progredir(lidos, inseridos, erros)` é chamado após cada
+    lote.
+
+    Retorna um dict com 'lidos', 'inseridos' e 'erros' (lista de (linha, mensagem)).
+    """
+    resultado = {'lidos': 0, 'inseridos': 0, 'erros': []}
+    # Começa com os cadastros já em cache: só nomes novos vão ao banco
+    mapas = {tabela: {nome: id_ for id_, nome in nomes_cadastro(tabela).items()}
+             for tabela in TABELAS_CADASTRO}
+    criados = set()
+
+    conn, cursor = conectar()
+    try:
+        if not USE_POSTGRES and not conn.in_transaction:
+            cursor.execute("BEGIN")
+
+        def gravar(lote):
+            for tabela, campo in ((T_CATEGORIAS, 'categoria'), (T_BANCOS, 'banco'), (T_CARTOES, 'cartao')):
+                if _mapear_nomes_cadastro(cursor, tabela, [reg.get(campo) for reg in lote], mapas[tabela]):
+                    criados.add(tabela)
+
+            def como_linha(reg):
+                ids = (mapas[T_CATEGORIAS].get(reg.get('categoria')),
+                       mapas[T_BANCOS].get(reg.get('banco')),
+                       mapas[T_CARTOES].get(reg.get('cartao')))
+                valores = (_valor_banco(reg.get('valor_previsto')), _valor_banco(reg.get('valor_pago')))
+                if USE_POSTGRES:
+                    return (reg['data'], reg['descricao']) + ids + valores
+                data = reg['data']
+                return (data.day, data.month, data.year, reg['descricao']) + ids + valores
+
+            linhas = [como_linha(reg) for reg in lote]
+            cursor.execute("SAVEPOINT importacao_lote")
+            try:
+                _inserir_lote(conn, cursor, linhas)
+                cursor.execute("RELEASE SAVEPOINT importacao_lote")
+                resultado['inseridos'] += len(linhas)
+                return
+            except Exception:
+                cursor.execute("ROLLBACK TO SAVEPOINT importacao_lote")
+                cursor.execute("RELEASE SAVEPOINT importacao_lote")
+
+            # O lote falhou: refaz linha a linha para isolar as linhas inválidas
+            for reg, linha in zip(lote, linhas):
+                cursor.execute("SAVEPOINT importacao_linha")
+                try:
+                    _inserir_lote(conn, cursor, [linha])
+                    cursor.execute("RELEASE SAVEPOINT importacao_linha")
+                    resultado['inseridos'] += 1
+                except Exception as e:
+                    cursor.execute("ROLLBACK TO SAVEPOINT importacao_linha")
+                    cursor.execute("RELEASE SAVEPOINT importacao_linha")
+                    resultado['erros'].append((reg.get('linha'), str(e).strip()))
+
+        lote = []
+        for reg in registros:
+            resultado['lidos'] += 1
+            if 'erro' in reg:
+                resultado['erros'].append((reg.get('linha'), reg['erro']))
+                continue
+            lote.append(reg)
+            if len(lote) >= tamanho_lote:
+                gravar(lote)
+                lote = []
+                if ao_progredir:
+                    ao_progredir(resultado['lidos'], resultado['inseridos'], len(resultado['erros']))
+        if lote:
+            gravar(lote)
+        conn.commit()
+        _lancamentos_alterados()
+        for tabela in criados:
+            invalidar_cadastros(tabela)
+        if ao_progredir:
+            ao_progredir(resultado['lidos'], resultado['inseridos'], len(resultado['erros']))
+        return resultado
+    finally:
+        conn.close()
+
+
+# --- Recorrências e parcelamentos ---
+#
+# Uma conta mensal ou uma compra parcelada é guardada uma vez, como regra
+# (frequência, primeira data, quantidade e valor), e suas ocorrências viram
+# lançamentos comuns, gerados num único INSERT em lote na mesma transação que
+# grava a regra. Assim a listagem, o saldo corrido, a busca e os relatórios
+# (via agregados) as enxergam sem nenhum tratamento à parte. Regras sem fim
+# são geradas até RECORRENCIA_MESES à frente; `expandir_recorrencias()`
+# avança esse horizonte.
+
+FREQUENCIAS = {'mensal': 1, 'anual': 12}
+# Ocorrências de uma regra com quantidade definida (todas geradas na criação)
+MAX_OCORRENCIAS = 600
+
+
+def _somar_meses(inicio, meses):
+    """`inicio` deslocado de `meses`, no mesmo dia ou no último dia do mês, se ele for mais curto."""
+    total = inicio.year * 12 + inicio.month - 1 + meses
+    ano, mes = divmod(total, 12)
+    return date(ano, mes + 1, min(inicio.day, calendar.monthrange(ano, mes + 1)[1]))
+
+
+def _horizonte_recorrencias():
+    hoje = date.today()
+    return _somar_meses(hoje.replace(day=1), RECORRENCIA_MESES + 1) - timedelta(days=1)
+
+
+def _valor_ocorrencia(regra, numero):
+    """Valor (centavos) da ocorrência `numero`; nas parcelas a primeira leva os centavos da divisão."""
+    if not regra['parcelado']:
+        return regra['valor']
+    parcela, resto = divmod(abs(regra['valor']), regra['quantidade'])
+    if numero == 1:
+        parcela += resto
+    return parcela if regra['valor'] >= 0 else -parcela
+
+
+def _ocorrencias(regra, ate):
+    """Linhas (prontas para `_inserir_ocorrencias`) das ocorrências ainda não geradas da regra.
+
+    Regras com quantidade são geradas até o fim; as sem fim, até a data `ate`.
+    """
+    inicio = date(regra['ano'], regra['mes'], regra['dia'])
+    passo = FREQUENCIAS[regra['frequencia']]
+    linhas = []
+    numero = regra['geradas'] + 1
+    while regra['quantidade'] is None or numero <= regra['quantidade']:
+        data = _somar_meses(inicio, (numero - 1) * passo)
+        if regra['quantidade'] is None and data > ate:
+            break
+        descricao = regra['descricao']
+        if regra['parcelado']:
+            descricao = f"{descricao} ({numero}/{regra['quantidade']})"
+        # Ocorrências nascem previstas: o valor pago é informado ao editar cada uma
+        valores = (regra['categoria_id'], regra['banco_id'], regra['cartao_id'],
+                   _valor_banco(_valor_ocorrencia(regra, numero)), None, regra['id'], numero)
+        if USE_POSTGRES:
+            linhas.append((data, descricao) + valores)
+        else:
+            linhas.append((data.day, data.month, data.year, descricao) + valores)
+        numero += 1
+    return linhas
+
+
+def _inserir_ocorrencias(conn, cursor, linhas):
+    """Insere as ocorrências com um único comando; as que já existem são ignoradas."""
+    if not linhas:
+        return
+    if USE_POSTGRES:
+        bruto = conn.cursor()
+        _psycopg2.extras.execute_values(bruto, f"""
+            INSERT INTO {T_LANCAMENTOS}
+                ({C_LANC_DATA}, {C_LANC_DESCRICAO}, {C_LANC_ID_CATEGORIA}, {C_LANC_ID_BANCO},
+                 {C_LANC_ID_CARTAO}, {C_LANC_VLR_PREVISTO}, {C_LANC_VLR_PAGO}, {C_LANC_ID_RECORRENCIA}, parcela)
+            VALUES %s
+            ON CONFLICT DO NOTHING
+        """, linhas, page_size=len(linhas))
+        bruto.close()
+    else:
+        cursor.executemany(f"""
+            INSERT OR IGNORE INTO {T_LANCAMENTOS}
+                (dia, mes, ano, descricao, categoria_id, banco_id, cartao_id, valor_previsto, valor_pago,
+                 recorrencia_id, parcela)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, linhas)
+
+
+def _sql_recorrencias():
+    """SELECT das regras com as colunas com os mesmos nomes nos dois bancos (valor em centavos)."""
+    if USE_POSTGRES:
+        return f"""
+            SELECT id, descricao, frequencia, parcelado,
+                   CAST(EXTRACT(DAY FROM data_inicio) AS INTEGER) as dia,
+                   CAST(EXTRACT(MONTH FROM data_inicio) AS INTEGER) as mes,
+                   CAST(EXTRACT(YEAR FROM data_inicio) AS INTEGER) as ano,
+                   quantidade, {_centavos('valor')} as valor,
+                   id_categoria as categoria_id, id_banco as banco_id, id_cartao as cartao_id, geradas
+            FROM {T_RECORRENCIAS}
+        """
+    return f"""
+        SELECT id, descricao, frequencia, parcelado, dia, mes, ano, quantidade, valor,
+               categoria_id, banco_id, cartao_id, geradas
+        FROM {T_RECORRENCIAS}
+    """
+
+
+def _gerar_ocorrencias(conn, cursor, regras, ate):
+    """Gera as ocorrências pendentes das `regras` até `ate` e atualiza o contador delas.
+
+    Um INSERT em lote para todas as regras e um UPDATE; roda na transação de
+    quem chama. Retorna o número de ocorrências geradas.
+    """
+    linhas = []
+    geradas = []
+    for regra in regras:
+        novas = _ocorrencias(regra, ate)
+        if novas:
+            linhas.extend(novas)
+            geradas.append((regra['geradas'] + len(novas), regra['id']))
+    _inserir_ocorrencias(conn, cursor, linhas)
+    maior = "GREATEST" if USE_POSTGRES else "MAX"
+    cursor.executemany(f"UPDATE {T_RECORRENCIAS} SET geradas = {maior}(geradas, ?) WHERE id = ?", geradas)
+    return len(linhas)
+
+
+_tem_recorrencias_pg = None
+
+
+def _usa_recorrencias(cursor):
+    """Indica se a tabela de recorrências existe (no SQLite, sempre: migração 7).
+
+    No PostgreSQL ela vem da seção de recorrências de scripts/schema_postgres.sql;
+    bancos criados com versões antigas do script continuam funcionando sem ela.
+    """
+    global _tem_recorrencias_pg
+    if not USE_POSTGRES:
+        return True
+    if _tem_recorrencias_pg is None:
+        cursor.execute("SELECT to_regclass(?) IS NOT NULL AS existe", (T_RECORRENCIAS,))
+        _tem_recorrencias_pg = bool(cursor.fetchone()['existe'])
+    return _tem_recorrencias_pg
+
+
+def _exigir_recorrencias(cursor):
+    if not _usa_recorrencias(cursor):
+        raise RuntimeError(f"A tabela '{T_RECORRENCIAS}' não existe. "
+                           "Aplique a seção de recorrências de scripts/schema_postgres.sql.")
+
+
+def recorrencias_disponiveis():
+    """Indica se o banco tem a tabela de recorrências (ver `_usa_recorrencias`)."""
+    conn, cursor = conectar()
+    try:
+        return _usa_recorrencias(cursor)
+    finally:
+        conn.close()
+
+
+def criar_recorrencia(dados, frequencia='mensal', quantidade=None, parcelado=False):
+    """Grava uma regra de recorrência e gera seus lançamentos, numa única transação.
+
+    `dados` tem os campos de `adicionar_lancamento`, com a data da primeira
+    ocorrência; o valor (centavos) é o previsto, ou o pago se não houver
+    previsto, e as ocorrências são gravadas como previstas. `frequencia` é
+    'mensal' ou 'anual' e `quantidade` o número de ocorrências (None = sem
+    fim, geradas até RECORRENCIA_MESES à frente). Com `parcelado=True` o valor
+    é o total da compra, dividido em `quantidade` parcelas numeradas na
+    descrição ("Geladeira (3/10)").
+
+    Retorna um dict com o `id` da regra e o número de `lancamentos` gerados.
+    """
+    if frequencia not in FREQUENCIAS:
+        raise ValueError(f"frequência inválida: {frequencia!r}")
+    if quantidade is not None and not 1 <= quantidade <= MAX_OCORRENCIAS:
+        raise ValueError(f"a quantidade deve estar entre 1 e {MAX_OCORRENCIAS}")
+    if parcelado and quantidade is None:
+        raise ValueError("um parcelamento precisa da quantidade de parcelas")
+    valor = dados.get('valor_previsto')
+    if valor is None:
+        valor = dados.get('valor_pago')
+    if valor is None:
+        raise ValueError("informe o valor da recorrência")
+    regra = {'descricao': dados['descricao'], 'frequencia': frequencia, 'parcelado': bool(parcelado),
+             'dia': dados['dia'], 'mes': dados['mes'], 'ano': dados['ano'], 'quantidade': quantidade,
+             'valor': valor, 'categoria_id': dados['categoria_id'], 'banco_id': dados['banco_id'],
+             'cartao_id': dados['cartao_id'], 'geradas': 0}
+
+    conn, cursor = conectar()
+    try:
+        _exigir_recorrencias(cursor)
+        if USE_POSTGRES:
+            cursor.execute(f"""
+                INSERT INTO {T_RECORRENCIAS}
+                    (descricao, frequencia, parcelado, data_inicio, quantidade, valor,
+                     id_categoria, id_banco, id_cartao)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                RETURNING id
+            """, (regra['descricao'], frequencia, regra['parcelado'], date(regra['ano'], regra['mes'], regra['dia']),
+                  quantidade, _valor_banco(valor), regra['categoria_id'], regra['banco_id'], regra['cartao_id']))
+            regra['id'] = cursor.fetchone()['id']
+        else:
+            cursor.execute(f"""
+                INSERT INTO {T_RECORRENCIAS}
+                    (descricao, frequencia, parcelado, dia, mes, ano, quantidade, valor,
+                     categoria_id, banco_id, cartao_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (regra['descricao'], frequencia, int(regra['parcelado']), regra['dia'], regra['mes'],
+                  regra['ano'], quantidade, valor, regra['categoria_id'], regra['banco_id'], regra['cartao_id']))
+            regra['id'] = cursor.lastrowid
+        gerados = _gerar_ocorrencias(conn, cursor, [regra], _horizonte_recorrencias())
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    _lancamentos_alterados()
+    return {'id': regra['id'], 'lancamentos': gerados}
+
+
+def expandir_recorrencias(ate=None):
+    """Gera as ocorrências das regras sem fim até `ate` (padrão: RECORRENCIA_MESES à frente).
+
+    Tudo numa transação, com um único INSERT em lote; ocorrências já geradas
+    (inclusive por outro cliente) não são duplicadas. Retorna quantos
+    lançamentos foram criados (0, sem nada a fazer, se o banco não tem a
+    tabela de recorrências).
+    """
+    ate = ate or _horizonte_recorrencias()
+    conn, cursor = conectar()
+    try:
+        if not _usa_recorrencias(cursor):
+            return 0
+        cursor.execute(_sql_recorrencias() + " WHERE quantidade IS NULL OR geradas < quantidade")
+        regras = cursor.fetchall()
+        gerados = _gerar_ocorrencias(conn, cursor, regras, ate)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    if gerados:
+        _lancamentos_alterados()
+    return gerados
+
+
+def listar_recorrencias():
+    """Regras de recorrência (valor em centavos), das mais recentes para as mais antigas."""
+    conn, cursor = conectar()
+    try:
+        if not _usa_recorrencias(cursor):
+            return []
+        cursor.execute(_sql_recorrencias() + " ORDER BY id DESC")
+        return cursor.fetchall()
+    finally:
+        conn.close()
+
+
+def encerrar_recorrencia(id_recorrencia, a_partir_de=None):
+    """Encerra a regra: não gera mais ocorrências e apaga as ainda sem pagamento a partir de `a_partir_de`.
+
+    `a_partir_de` (date, padrão hoje) preserva o histórico; ocorrências já
+    pagas nunca são apagadas. Retorna quantos lançamentos foram removidos.
+    """
+    a_partir_de = a_partir_de or date.today()
+    if USE_POSTGRES:
+        recorrencia, pago = C_LANC_ID_RECORRENCIA, C_LANC_VLR_PAGO
+        condicao_data, params = f"{C_LANC_DATA} >= ?", [a_partir_de]
+    else:
+        recorrencia, pago = 'recorrencia_id', 'valor_pago'
+        condicao_data = "(ano, mes, dia) >= (?, ?, ?)"
+        params = [a_partir_de.year, a_partir_de.month, a_partir_de.day]
+    conn, cursor = conectar()
+    try:
+        _exigir_recorrencias(cursor)
+        cursor.execute(f"UPDATE {T_RECORRENCIAS} SET quantidade = geradas WHERE id = ?", (id_recorrencia,))
+        cursor.execute(f"""
+            DELETE FROM {T_LANCAMENTOS}
+            WHERE {recorrencia} = ? AND {condicao_data} AND ({pago} IS NULL OR {pago} = 0)
+        """, [id_recorrencia] + params)
+        removidos = cursor.rowcount
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    _lancamentos_alterados()
+    return removidos
+
+
+def _intervalo_periodo(mes=None, ano=None, data_inicio=None, data_fim=None):
+    """Converte (mes, ano) e/ou um intervalo explícito em datas meio-abertas.
+
+    Retorna `(inicio, fim)` com `inicio` inclusivo e `fim` exclusivo (qualquer um
+    pode ser None). `data_fim` é inclusiva, como o usuário a informa. Um `mes`
+    sem `ano` não vira intervalo (retorna (None, None) para essa parte).
+    """
+    inicio = fim = None
+    if ano:
+        if mes:
+            inicio = date(ano, mes, 1)
+            fim = date(ano + 1, 1, 1) if mes == 12 else date(ano, mes + 1, 1)
+        else:
+            inicio, fim = date(ano, 1, 1), date(ano + 1, 1, 1)
+    if data_inicio and (inicio is None or data_inicio > inicio):
+        inicio = data_inicio
+    if data_fim:
+        fim_exclusivo = data_fim + timedelta(days=1)
+        if fim is None or fim_exclusivo < fim:
+            fim = fim_exclusivo
+    return inicio, fim
+
+
+def _filtro_periodo(alias='l.', mes=None, ano=None, data_inicio=None, data_fim=None):
+    """Monta as condições de período (lista de SQL, lista de parâmetros).
+
+    No PostgreSQL o período vira `data >= inicio AND data < fim`, que usa o
+    índice em `data_lancamento` (um `EXTRACT(...) = ?` obrigaria a ler a tabela
+    inteira). No SQLite compara as colunas ano/mes/dia diretamente.
+    """
+    conditions = []
+    params = []
+    if USE_POSTGRES:
+        inicio, fim = _intervalo_periodo(mes, ano, data_inicio, data_fim)
+        if inicio:
+            conditions.append(f"{alias}{C_LANC_DATA} >= ?")
+            params.append(inicio)
+        if fim:
+            conditions.append(f"{alias}{C_LANC_DATA} < ?")
+            params.append(fim)
+        if mes and not ano:
+            # Mesmo mês de todos os anos: não há intervalo contínuo possível
+            conditions.append(f"EXTRACT(MONTH FROM {alias}{C_LANC_DATA}) = ?")
+            params.append(mes)
+        return conditions, params
+
+    if mes:
+        conditions.append(f"{alias}mes = ?")
+        params.append(mes)
+    if ano:
+        conditions.append(f"{alias}ano = ?")
+        params.append(ano)
+    if data_inicio or data_fim:
+        inicio, fim = _intervalo_periodo(data_inicio=data_inicio, data_fim=data_fim)
+        if inicio:
+            conditions.append(f"({alias}ano, {alias}mes, {alias}dia) >= (?, ?, ?)")
+            params.extend((inicio.year, inicio.month, inicio.day))
+        if fim:
+            conditions.append(f"({alias}ano, {alias}mes, {alias}dia) < (?, ?, ?)")
+            params.extend((fim.year, fim.month, fim.day))
+    return conditions, params
+
+
+class FiltroLancamentos:
+    """Filtros da listagem de lançamentos, compilados para SQL de cada banco.
+
+    - `mes`, `ano`, `data_inicio`, `data_fim` (inclusiva): período, como nos
+      parâmetros avulsos das funções de listagem;
+    - `categorias`, `bancos`, `cartoes`: conjuntos de ids aceitos (None no
+      conjunto aceita também o lançamento sem categoria/banco/cartão);
+    - `valor_min`, `valor_max` (inclusivos, em centavos): sobre o valor pago,
+      ou o previsto quando ainda não há pagamento;
+    - `pago`: True só os pagos (valor pago diferente de zero), False só os
+      ainda sem pagamento (o antigo `somente_previsto`), None ambos.
+
+    É imutável: `com(...)` devolve uma cópia com alguns campos trocados, para
+    compor um filtro a partir de outro. As funções de listagem aceitam
+    `filtro=` junto dos parâmetros avulsos, que têm precedência.
+    """
+    __slots__ = ('mes', 'ano', 'data_inicio', 'data_fim', 'categorias', 'bancos', 'cartoes',
+                 'valor_min', 'valor_max', 'pago')
+
+    def __init__(self, mes=None, ano=None, data_inicio=None, data_fim=None, categorias=None, bancos=None,
+                 cartoes=None, valor_min=None, valor_max=None, pago=None):
+        valores = dict(mes=mes, ano=ano, data_inicio=data_inicio, data_fim=data_fim,
+                       categorias=self._ids(categorias), bancos=self._ids(bancos), cartoes=self._ids(cartoes),
+                       valor_min=valor_min, valor_max=valor_max, pago=pago)
+        for campo, valor in valores.items():
+            object.__setattr__(self, campo, valor)
+
+    @staticmethod
+    def _ids(ids):
+        if ids is None:
+            return None
+        return frozenset(None if i is None else int(i) for i in ids)
+
+    def __setattr__(self, campo, valor):
+        raise AttributeError("FiltroLancamentos é imutável; use com(...)")
+
+    def com(self, **alteracoes):
+        """Cópia do filtro com os campos informados trocados."""
+        valores = {campo: getattr(self, campo) for campo in self.__slots__}
+        valores.update(alteracoes)
+        return FiltroLancamentos(**valores)
+
+    def __eq__(self, outro):
+        if not isinstance(outro, FiltroLancamentos):
+            return NotImplemented
+        return all(getattr(self, c) == getattr(outro, c) for c in self.__slots__)
+
+    def __hash__(self):
+        return hash(tuple(getattr(self, c) for c in self.__slots__))
+
+    def __repr__(self):
+        campos = ", ".join(f"{c}={getattr(self, c)!r}" for c in self.__slots__ if getattr(self, c) is not None)
+        return f"FiltroLancamentos({campos})"
+
+    def somente_periodo(self):
+        """Indica se só há filtro de período (o que os agregados mensais atendem)."""
+        return all(getattr(self, c) is None for c in self.__slots__[4:])
+
+    def somente_conta(self):
+        """Indica se só há filtro de período e de bancos (o saldo corrido é o das contas)."""
+        return all(getattr(self, c) is None for c in ('categorias', 'cartoes', 'valor_min', 'valor_max', 'pago'))
+
+    def condicoes(self, alias='l.'):
+        """Condições SQL (lista) e parâmetros (lista) do filtro, no dialeto em uso."""
+        conditions, params = _filtro_periodo(alias, self.mes, self.ano, self.data_inicio, self.data_fim)
+        if USE_POSTGRES:
+            colunas = {'categorias': C_LANC_ID_CATEGORIA, 'bancos': C_LANC_ID_BANCO, 'cartoes': C_LANC_ID_CARTAO}
+            previsto, pago = C_LANC_VLR_PREVISTO, C_LANC_VLR_PAGO
+        else:
+            colunas = {'categorias': 'categoria_id', 'bancos': 'banco_id', 'cartoes': 'cartao_id'}
+            previsto, pago = 'valor_previsto', 'valor_pago'
+
+        for campo, coluna in colunas.items():
+            ids = getattr(self, campo)
+            if ids is None:
+                continue
+            validos = sorted(i for i in ids if i is not None)
+            partes = []
+            if validos:
+                # Um único id vira igualdade, que o planejador casa melhor com o índice
+                if len(validos) == 1:
+                    partes.append(f"{alias}{coluna} = ?")
+                else:
+                    partes.append(f"{alias}{coluna} IN ({', '.join('?' * len(validos))})")
+                params.extend(validos)
+            if None in ids:
+                partes.append(f"{alias}{coluna} IS NULL")
+            # Conjunto vazio: nenhum lançamento
+            conditions.append(" OR ".join(partes).join("()") if len(partes) > 1 else (partes or ["1 = 0"])[0])
+
+        if self.valor_min is not None or self.valor_max is not None:
+            valor = f"COALESCE({alias}{pago}, {alias}{previsto})"
+            if self.valor_min is not None:
+                conditions.append(f"{valor} >= ?")
+                params.append(_valor_banco(self.valor_min))
+            if self.valor_max is not None:
+                conditions.append(f"{valor} <= ?")
+                params.append(_valor_banco(self.valor_max))
+
+        if self.pago is True:
+            conditions.append(f"{alias}{pago} <> 0")
+        elif self.pago is False:
+            conditions.append(f"({alias}{pago} IS NULL OR {alias}{pago} = 0)")
+        return conditions, params
+
+
+def _combinar_filtro(filtro=None, mes=None, ano=None, somente_previsto=False, data_inicio=None, data_fim=None):
+    """`FiltroLancamentos` com os parâmetros avulsos das funções de listagem aplicados por cima de `filtro`."""
+    avulsos = {campo: valor for campo, valor in (('mes', mes), ('ano', ano), ('data_inicio', data_inicio),
+                                                   ('data_fim', data_fim)) if valor}
+    if somente_previsto:
+        avulsos['pago'] = False
+    if filtro is None:
+        return FiltroLancamentos(**avulsos)
+    return filtro.com(**avulsos) if avulsos else filtro
+
+
+# Resolver os nomes dos cadastros pelo cache, em vez de LEFT JOIN nas três
+# tabelas, vale a pena no PostgreSQL (menos trabalho e menos bytes por linha
+# vindos do servidor). No SQLite o JOIN é local e barato, e refazer as linhas
+# em Python custa mais do que ele (ver scripts/benchmark_cadastros.py).
+# Ajustável por [database] nomes_no_cliente = 0/1 ou DB_NOMES_NO_CLIENTE.
+NOMES_NO_CLIENTE = bool(_config_int('database', 'nomes_no_cliente', 'DB_NOMES_NO_CLIENTE',
+                                    1 if USE_POSTGRES else 0))
+
+COLUNAS_LISTAGEM = ('id', 'dia', 'mes', 'ano', 'descricao', 'categoria', 'banco', 'cartao',
+                    'valor_previsto', 'valor_pago')
+# Acrescentadas à listagem com `com_saldo=True`: saldo corrido após cada linha
+COLUNAS_SALDO = ('saldo_pago', 'saldo_projetado')
+
+
+def _sql_listagem(mes=None, ano=None, somente_previsto=False, data_inicio=None, data_fim=None, filtro=None,
+                  saldo=None):
+    """SELECT da listagem de lançamentos e suas condições.
+
+    Com `NOMES_NO_CLIENTE` as colunas categoria/banco/cartao trazem os ids, e
+    as linhas precisam passar por `_resolver_nomes`. Com `saldo` (pago,
+    projetado) antes da primeira linha, acrescenta as colunas `COLUNAS_SALDO`
+    (ver `_sql_saldo_corrido`); os parâmetros delas vêm antes dos das condições.
+    """
+    saldo_sql, saldo_params = _sql_saldo_corrido(saldo) if saldo is not None else ("", [])
+    if NOMES_NO_CLIENTE:
+        if USE_POSTGRES:
+            query = f"""
+                SELECT l.{C_LANC_ID} as id,
+                       EXTRACT(DAY FROM l.{C_LANC_DATA}) as dia,
+                       EXTRACT(MONTH FROM l.{C_LANC_DATA}) as mes,
+                       EXTRACT(YEAR FROM l.{C_LANC_DATA}) as ano,
+                       l.{C_LANC_DESCRICAO} as descricao,
+                       l.{C_LANC_ID_CATEGORIA} as categoria,
+                       l.{C_LANC_ID_BANCO} as banco,
+                       l.{C_LANC_ID_CARTAO} as cartao,
+                       {_centavos('l.' + C_LANC_VLR_PREVISTO)} as valor_previsto,
+                       {_centavos('l.' + C_LANC_VLR_PAGO)} as valor_pago{saldo_sql}
+                FROM {T_LANCAMENTOS} l
+            """
+        else:
+            query = f"""
+                SELECT l.id, l.dia, l.mes, l.ano, l.descricao,
+                       l.categoria_id as categoria, l.banco_id as banco, l.cartao_id as cartao,
+                       l.valor_previsto, l.valor_pago{saldo_sql}
+                FROM {T_LANCAMENTOS} l
+            """
+    elif USE_POSTGRES:
+        query = f"""
+            SELECT l.{C_LANC_ID} as id,
+                   EXTRACT(DAY FROM l.{C_LANC_DATA}) as dia,
+                   EXTRACT(MONTH FROM l.{C_LANC_DATA}) as mes,
+                   EXTRACT(YEAR FROM l.{C_LANC_DATA}) as ano,
+                   l.{C_LANC_DESCRICAO} as descricao,
+                   c.nome as categoria,
+                   b.nome as banco,
+                   cr.nome as cartao,
+                   {_centavos('l.' + C_LANC_VLR_PREVISTO)} as valor_previsto,
+                   {_centavos('l.' + C_LANC_VLR_PAGO)} as valor_pago{saldo_sql}
+            FROM {T_LANCAMENTOS} l
                  LEFT JOIN {T_CATEGORIAS} c ON l.{C_LANC_ID_CATEGORIA} = c.id
                  LEFT JOIN {T_BANCOS} b ON l.{C_LANC_ID_BANCO} = b.id
                  LEFT JOIN {T_CARTOES} cr ON l.{C_LANC_ID_CARTAO} = cr.id
@@ -530,131 +2279,1257 @@ def listar_lancamentos_filtrados(mes=None, ano=None, somente_previsto=False):
         query = f"""
                 SELECT l.id, l.dia, l.mes, l.ano, l.descricao,
                        c.nome as categoria, b.nome as banco, cr.nome as cartao,
-                       l.valor_previsto, l.valor_pago
+                       l.valor_previsto, l.valor_pago{saldo_sql}
                 FROM {T_LANCAMENTOS} l
                          LEFT JOIN {T_CATEGORIAS} c ON l.categoria_id = c.id
                          LEFT JOIN {T_BANCOS} b ON l.banco_id = b.id
                          LEFT JOIN {T_CARTOES} cr ON l.cartao_id = cr.id
                 """
 
-    conditions = []
-    params = []
+    conditions, params = _filtro_listagem(mes, ano, somente_previsto, data_inicio, data_fim, filtro)
+    return query, conditions, saldo_params + params
+
+
+def _resolver_nomes(linhas):
+    """Troca os ids de categoria/banco/cartão pelos nomes (se `NOMES_NO_CLIENTE`)."""
+    if not NOMES_NO_CLIENTE or not linhas:
+        return linhas
+    mapas = _mapas_nomes({T_CATEGORIAS: {l[5] for l in linhas}, T_BANCOS: {l[6] for l in linhas},
+                          T_CARTOES: {l[7] for l in linhas}})
+    categoria, banco, cartao = mapas[T_CATEGORIAS].get, mapas[T_BANCOS].get, mapas[T_CARTOES].get
+    if len(linhas[0]) > len(COLUNAS_LISTAGEM):
+        linha = _classe_linha(COLUNAS_LISTAGEM + COLUNAS_SALDO)
+        return [linha((l[0], l[1], l[2], l[3], l[4], categoria(l[5]), banco(l[6]), cartao(l[7]), l[8], l[9],
+                       l[10], l[11]))
+                for l in linhas]
+    linha = _classe_linha(COLUNAS_LISTAGEM)
+    return [linha((l[0], l[1], l[2], l[3], l[4], categoria(l[5]), banco(l[6]), cartao(l[7]), l[8], l[9]))
+            for l in linhas]
+
+
+def _filtro_listagem(mes=None, ano=None, somente_previsto=False, data_inicio=None, data_fim=None, filtro=None):
+    return _combinar_filtro(filtro, mes, ano, somente_previsto, data_inicio, data_fim).condicoes('l.')
+
+
+# Ordem da listagem; é também a chave da paginação (keyset) e casa com os
+# índices idx_lancamentos_data (SQLite) e idx_lancamento_data_id (PostgreSQL)
+ORDEM_LISTAGEM = f"l.{C_LANC_DATA}, l.{C_LANC_ID}" if USE_POSTGRES else "l.ano, l.mes, l.dia, l.id"
 
-    if mes:
-        conditions.append(f"EXTRACT(MONTH FROM l.{C_LANC_DATA}) = ?" if USE_POSTGRES else "l.mes = ?")
-        params.append(mes)
-    if ano:
-        conditions.append(f"EXTRACT(YEAR FROM l.{C_LANC_DATA}) = ?" if USE_POSTGRES else "l.ano = ?")
-        params.append(ano)
-    if somente_previsto:
-        vlr_pago_col = C_LANC_VLR_PAGO if USE_POSTGRES else "valor_pago"
-        conditions.append(f"(l.{vlr_pago_col} IS NULL OR l.{vlr_pago_col} = 0)")
 
+def listar_lancamentos_filtrados(mes=None, ano=None, somente_previsto=False, data_inicio=None, data_fim=None,
+                                 filtro=None, com_saldo=False):
+    """Todos os lançamentos da listagem com esses filtros (ver `FiltroLancamentos`).
+
+    Com `com_saldo=True` cada linha traz também o saldo corrido (`COLUNAS_SALDO`).
+    """
+    conn, cursor = conectar()
+
+    saldo = None
+    if com_saldo:
+        saldo = _saldo_anterior(cursor, _combinar_filtro(filtro, mes, ano, somente_previsto, data_inicio, data_fim))
+    query, conditions, params = _sql_listagem(mes, ano, somente_previsto, data_inicio, data_fim, filtro, saldo)
     if conditions:
         query += " WHERE " + " AND ".join(conditions)
 
+    query += f" ORDER BY {ORDEM_LISTAGEM}"
+
+    cursor.execute(query, tuple(params))
+    lancamentos = cursor.fetchall()
+    conn.close()
+    return _resolver_nomes(lancamentos)
+
+
+def iterar_lancamentos(mes=None, ano=None, somente_previsto=False, data_inicio=None, data_fim=None,
+                       tamanho_lote=2000, filtro=None, com_saldo=False):
+    """Gera os lançamentos da listagem um a um, com memória constante.
+
+    Mesmas linhas e ordem de `listar_lancamentos_filtrados`, mas sem
+    `fetchall()`: no PostgreSQL usa um cursor nomeado (do lado do servidor),
+    que traz `tamanho_lote` linhas por ida ao banco; no SQLite percorre o
+    próprio cursor. Serve para exportações de qualquer tamanho. A conexão fica
+    emprestada até o gerador terminar (ou ser fechado). `com_saldo` como em
+    `listar_lancamentos_filtrados`.
+    """
+    conn, cursor = conectar()
+    try:
+        saldo = None
+        if com_saldo:
+            saldo = _saldo_anterior(cursor, _combinar_filtro(filtro, mes, ano, somente_previsto,
+                                                             data_inicio, data_fim))
+        query, conditions, params = _sql_listagem(mes, ano, somente_previsto, data_inicio, data_fim, filtro,
+                                                  saldo)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += f" ORDER BY {ORDEM_LISTAGEM}"
+
+        if USE_POSTGRES:
+            # Cursor nomeado não passa pelo adaptador de '?' de conectar()
+            cursor = conn.cursor(name='iterar_lancamentos', cursor_factory=_CursorLinhas)
+            cursor.itersize = tamanho_lote
+            cursor.execute(query.replace('?', '%s'), tuple(params))
+        else:
+            cursor.execute(query, tuple(params))
+        if NOMES_NO_CLIENTE:
+            # Os nomes são resolvidos por lote, sem perder a memória constante
+            while True:
+                lote = cursor.fetchmany(tamanho_lote)
+                if not lote:
+                    break
+                yield from _resolver_nomes(lote)
+        else:
+            cursor.arraysize = tamanho_lote
+            yield from cursor
+        cursor.close()
+    finally:
+        conn.close()
+
+
+def chave_lancamento(lanc):
+    """Chave de ordenação/paginação de uma linha da listagem: (ano, mes, dia, id)."""
+    return (int(lanc['ano']), int(lanc['mes']), int(lanc['dia']), int(lanc['id']))
+
+
+def listar_lancamentos_pagina(mes=None, ano=None, somente_previsto=False, data_inicio=None, data_fim=None,
+                              apos=None, limite=200, filtro=None, com_saldo=False, saldo_anterior=None):
+    """Retorna uma página da listagem, na mesma ordem de `listar_lancamentos_filtrados`.
+
+    Paginação por chave (keyset): `apos` é a `chave_lancamento` da última linha
+    da página anterior (None para a primeira página). Cada página custa o
+    mesmo, não importa quão longe se esteja na listagem, porque o banco
+    continua a varredura do índice a partir da chave em vez de pular OFFSET
+    linhas. Uma página com menos de `limite` linhas indica o fim.
+
+    Com `com_saldo=True` cada linha traz também o saldo corrido
+    (`COLUNAS_SALDO`). Nas páginas seguintes passe em `saldo_anterior` o
+    (saldo_pago, saldo_projetado) da última linha da página anterior; sem ele
+    o saldo até `apos` é somado pelo banco.
+    """
+    conn, cursor = conectar()
+
+    saldo = None
+    if com_saldo:
+        saldo = saldo_anterior
+        if saldo is None:
+            saldo = _saldo_anterior(cursor, _combinar_filtro(filtro, mes, ano, somente_previsto,
+                                                             data_inicio, data_fim), apos)
+    query, conditions, params = _sql_listagem(mes, ano, somente_previsto, data_inicio, data_fim, filtro, saldo)
+    if apos is not None:
+        ano_k, mes_k, dia_k, id_k = apos
+        if USE_POSTGRES:
+            conditions.append(f"(l.{C_LANC_DATA}, l.{C_LANC_ID}) > (?, ?)")
+            params.extend((date(ano_k, mes_k, dia_k), id_k))
+        else:
+            conditions.append("(l.ano, l.mes, l.dia, l.id) > (?, ?, ?, ?)")
+            params.extend((ano_k, mes_k, dia_k, id_k))
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+
+    query += f" ORDER BY {ORDEM_LISTAGEM} LIMIT ?"
+    params.append(limite)
+
+    cursor.execute(query, tuple(params))
+    lancamentos = cursor.fetchall()
+    conn.close()
+    return _resolver_nomes(lancamentos)
+
+
+def contar_lancamentos(mes=None, ano=None, somente_previsto=False, data_inicio=None, data_fim=None, filtro=None):
+    """Quantidade de lançamentos que a listagem com esses filtros retornaria."""
+    filtro = _combinar_filtro(filtro, mes, ano, somente_previsto, data_inicio, data_fim)
+    conn, cursor = conectar()
+    if filtro.somente_periodo() and _usa_agregados(cursor, filtro.data_inicio, filtro.data_fim):
+        # Meses inteiros: basta somar as contagens dos agregados mensais
+        where, params = _filtro_periodo_agregado(filtro.mes, filtro.ano)
+        query = f"SELECT COALESCE(SUM(a.qtd), 0) as total FROM {T_AGREGADO} a WHERE {where}"
+    else:
+        conditions, params = filtro.condicoes('l.')
+        query = f"SELECT COUNT(*) as total FROM {T_LANCAMENTOS} l"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+    cursor.execute(query, tuple(params))
+    total = cursor.fetchone()['total']
+    conn.close()
+    return int(total)
+
+
+# --- Saldo corrido ---
+#
+# A listagem pode trazer, em cada linha, o saldo acumulado até ela: pago (só
+# valores pagos) e projetado (o pago, ou o previsto enquanto não há
+# pagamento). A soma acumulada é uma função de janela
+# (`SUM(...) OVER (ORDER BY <ordem da listagem>)`) somada ao saldo anterior à
+# primeira linha; o banco percorre o índice da listagem sem ordenar, então uma
+# página continua custando uma página. O saldo anterior vem do saldo inicial
+# dos bancos e, para meses inteiros, dos agregados mensais (coluna
+# `projetado`), sem somar o histórico. A paginação passa adiante o saldo da
+# última linha (`saldo_anterior`).
+#
+# Só período e bancos filtrados = saldo da conta (com o saldo inicial dos
+# bancos). Com outros filtros (categoria, valor...) é o acumulado das linhas
+# listadas, desde o início do histórico.
+
+_colunas_saldo_pg = None
+
+
+def _colunas_saldo(cursor):
+    """(bancos têm `saldo_inicial`, agregados têm `projetado`).
+
+    No SQLite, sempre (migração 5); no PostgreSQL dependem da versão aplicada
+    de scripts/schema_postgres.sql, e sem elas o saldo é calculado dos lançamentos.
+    """
+    global _colunas_saldo_pg
+    if not USE_POSTGRES:
+        return True, True
+    if _colunas_saldo_pg is None:
+        cursor.execute("SELECT table_name FROM information_schema.columns "
+                       "WHERE (table_name = ? AND column_name = 'saldo_inicial') "
+                       "OR (table_name = ? AND column_name = 'projetado')", (T_BANCOS, T_AGREGADO))
+        tabelas = {linha['table_name'] for linha in cursor.fetchall()}
+        _colunas_saldo_pg = (T_BANCOS in tabelas, T_AGREGADO in tabelas)
+    return _colunas_saldo_pg
+
+
+def _exprs_saldo(alias='l.'):
+    """Expressões SQL do valor pago e do projetado de um lançamento."""
     if USE_POSTGRES:
-        query += f" ORDER BY l.{C_LANC_DATA}"
+        pago, previsto = C_LANC_VLR_PAGO, C_LANC_VLR_PREVISTO
     else:
-        query += " ORDER BY l.ano, l.mes, l.dia"
+        pago, previsto = 'valor_pago', 'valor_previsto'
+    return f"COALESCE({alias}{pago}, 0)", f"COALESCE({alias}{pago}, {alias}{previsto}, 0)"
+
+
+def _sql_saldo_corrido(saldo):
+    """Colunas `COLUNAS_SALDO` da listagem (SQL, parâmetros) a partir do saldo anterior (pago, projetado)."""
+    pago, projetado = _exprs_saldo('l.')
+    # ROWS: a ordem da listagem termina no id, não há empates a agrupar
+    janela = f"OVER (ORDER BY {ORDEM_LISTAGEM} ROWS UNBOUNDED PRECEDING)"
+    sql = (f",\n                       ? + {_centavos(f'SUM({pago}) {janela}')} as saldo_pago"
+           f",\n                       ? + {_centavos(f'SUM({projetado}) {janela}')} as saldo_projetado")
+    return sql, [saldo[0], saldo[1]]
+
+
+def _condicao_ids(coluna, ids):
+    if not ids:
+        return "1 = 0", []
+    return f"{coluna} IN ({', '.join('?' * len(ids))})", list(ids)
+
+
+def _saldo_anterior(cursor, filtro, apos=None):
+    """(pago, projetado) acumulados antes da primeira linha da listagem de
+    `filtro`, ou até a linha de chave `apos` (inclusive), numa única consulta."""
+    tem_saldo_inicial, tem_projetado = _colunas_saldo(cursor)
+    pago, projetado = _exprs_saldo('l.')
+    conta = filtro.somente_conta()
+    partes = []
+    params = []
+
+    if conta and tem_saldo_inicial:
+        where = ""
+        if filtro.bancos is not None:
+            condicao, ids = _condicao_ids("b.id", sorted(i for i in filtro.bancos if i is not None))
+            where = f" WHERE {condicao}"
+            params.extend(ids)
+        partes.append(f"SELECT COALESCE(SUM(b.saldo_inicial), 0) as pago, "
+                      f"COALESCE(SUM(b.saldo_inicial), 0) as projetado FROM {T_BANCOS} b{where}")
+
+    # Lançamentos anteriores ao período. Um mês sem ano não é um intervalo
+    # contínuo: o "antes" é o mesmo mês dos anos anteriores
+    contiguo = not (filtro.mes and not filtro.ano)
+    inicio, _ = _intervalo_periodo(filtro.mes, filtro.ano, filtro.data_inicio, filtro.data_fim)
+    if inicio is not None:
+        anteriores = filtro.com(mes=None if contiguo else filtro.mes, ano=None, data_inicio=None, data_fim=None)
+        desde = None
+        if conta and contiguo and tem_projetado:
+            # Meses inteiros dos agregados; do mês de `inicio`, só os dias antes dele
+            conditions = ["(a.ano, a.mes) < (?, ?)"]
+            params.extend((inicio.year, inicio.month))
+            if filtro.bancos is not None:
+                # Nos agregados, "sem banco" é o id 0
+                condicao, ids = _condicao_ids(f"a.{C_AGR_ID_BANCO}",
+                                              sorted({0 if i is None else i for i in filtro.bancos}))
+                conditions.append(condicao)
+                params.extend(ids)
+            partes.append(f"SELECT COALESCE(SUM(a.pago), 0) as pago, COALESCE(SUM(a.projetado), 0) as projetado "
+                          f"FROM {T_AGREGADO} a WHERE {' AND '.join(conditions)}")
+            desde = inicio.replace(day=1)
+        if desde != inicio:
+            conditions, params_anteriores = anteriores.condicoes('l.')
+            if USE_POSTGRES:
+                if desde:
+                    conditions.append(f"l.{C_LANC_DATA} >= ?")
+                    params_anteriores.append(desde)
+                conditions.append(f"l.{C_LANC_DATA} < ?")
+                params_anteriores.append(inicio)
+            else:
+                if desde:
+                    conditions.append("(l.ano, l.mes, l.dia) >= (?, ?, ?)")
+                    params_anteriores.extend((desde.year, desde.month, desde.day))
+                conditions.append("(l.ano, l.mes, l.dia) < (?, ?, ?)")
+                params_anteriores.extend((inicio.year, inicio.month, inicio.day))
+            partes.append(f"SELECT COALESCE(SUM({pago}), 0) as pago, COALESCE(SUM({projetado}), 0) as projetado "
+                          f"FROM {T_LANCAMENTOS} l WHERE {' AND '.join(conditions)}")
+            params.extend(params_anteriores)
+
+    # Linhas do período até `apos`
+    if apos is not None:
+        conditions, params_periodo = filtro.condicoes('l.')
+        ano_k, mes_k, dia_k, id_k = apos
+        if USE_POSTGRES:
+            conditions.append(f"(l.{C_LANC_DATA}, l.{C_LANC_ID}) <= (?, ?)")
+            params_periodo.extend((date(ano_k, mes_k, dia_k), id_k))
+        else:
+            conditions.append("(l.ano, l.mes, l.dia, l.id) <= (?, ?, ?, ?)")
+            params_periodo.extend((ano_k, mes_k, dia_k, id_k))
+        partes.append(f"SELECT COALESCE(SUM({pago}), 0) as pago, COALESCE(SUM({projetado}), 0) as projetado "
+                      f"FROM {T_LANCAMENTOS} l WHERE {' AND '.join(conditions)}")
+        params.extend(params_periodo)
+
+    if not partes:
+        return 0, 0
+    cursor.execute(f"SELECT {_centavos('SUM(s.pago)')} as pago, {_centavos('SUM(s.projetado)')} as projetado "
+                   f"FROM ({' UNION ALL '.join(partes)}) s", tuple(params))
+    linha = cursor.fetchone()
+    return linha['pago'], linha['projetado']
+
+
+def obter_saldo_anterior(mes=None, ano=None, somente_previsto=False, data_inicio=None, data_fim=None,
+                         filtro=None, apos=None):
+    """Saldo antes da primeira linha da listagem com esses filtros.
+
+    Com `apos` (uma `chave_lancamento`), o saldo logo após essa linha. Retorna
+    um dict com 'pago' e 'projetado'. É o ponto de partida das colunas
+    `COLUNAS_SALDO` (`com_saldo=True` nas funções de listagem).
+    """
+    filtro = _combinar_filtro(filtro, mes, ano, somente_previsto, data_inicio, data_fim)
+    conn, cursor = conectar()
+    try:
+        pago, projetado = _saldo_anterior(cursor, filtro, apos)
+    finally:
+        conn.close()
+    return {'pago': pago, 'projetado': projetado}
+
+
+# --- Busca textual ---
+#
+# SQLite: tabela FTS5 `T_BUSCA` (migração 3). PostgreSQL: coluna tsvector
+# `C_LANC_BUSCA` gerada a partir da descrição, com índice GIN (ver
+# scripts/schema_postgres.sql). Nos dois a descrição é indexada em minúsculas e
+# sem acentos, e cada palavra digitada casa como prefixo.
+
+_tem_busca_fts = None
+# No SQLite a relevância (bm25) é calculada só para os lançamentos mais
+# recentes que casam com o termo: ranquear todos custa ~250 ms num livro de 1
+# milhão de linhas quando o prefixo é comum ("m", "merc"), contra ~20 ms assim
+# (o FTS5 entrega os candidatos em ordem de rowid, sem ordenar)
+CANDIDATOS_BUSCA = 1000
 
+
+def _palavras_busca(termo):
+    """Palavras de `termo` em minúsculas e sem acentos, como estão no índice."""
+    texto = unicodedata.normalize('NFKD', termo.lower())
+    return re.findall(r'\w+', ''.join(c for c in texto if not unicodedata.combining(c)))
+
+
+def _usa_busca_fts(cursor):
+    """Indica se o índice de busca existe (schemas antigos caem no LIKE)."""
+    global _tem_busca_fts
+    if _tem_busca_fts is None:
+        if USE_POSTGRES:
+            cursor.execute("SELECT 1 FROM information_schema.columns WHERE table_name = ? AND column_name = ?",
+                           (T_LANCAMENTOS, C_LANC_BUSCA))
+            _tem_busca_fts = cursor.fetchone() is not None
+        else:
+            _tem_busca_fts = _tabela_existe(cursor, T_BUSCA)
+    return _tem_busca_fts
+
+
+def buscar_lancamentos(termo, mes=None, ano=None, somente_previsto=False, data_inicio=None, data_fim=None,
+                       limite=100, filtro=None):
+    """Lançamentos cuja descrição tem palavras começando com cada palavra de `termo`.
+
+    Retorna até `limite` linhas no formato da listagem, das mais relevantes
+    para as menos (e, no empate, das mais recentes), já restritas aos filtros
+    de período. Acentos e maiúsculas são ignorados: "farm sal" acha
+    "Farmácia Salário". Um termo sem palavras retorna lista vazia. No SQLite
+    são ranqueados os `CANDIDATOS_BUSCA` lançamentos mais recentes que casam.
+    """
+    palavras = _palavras_busca(termo)
+    if not palavras:
+        return []
+    conn, cursor = conectar()
+
+    query, conditions, params = _sql_listagem(mes, ano, somente_previsto, data_inicio, data_fim, filtro)
+    recentes = (f"l.{C_LANC_DATA} DESC, l.{C_LANC_ID} DESC" if USE_POSTGRES
+                else "l.ano DESC, l.mes DESC, l.dia DESC, l.id DESC")
+    if not _usa_busca_fts(cursor):
+        # Sem o índice: varre a tabela, sem relevância
+        operador = "ILIKE" if USE_POSTGRES else "LIKE"
+        descricao = f"l.{C_LANC_DESCRICAO}" if USE_POSTGRES else "l.descricao"
+        for p in palavras:
+            conditions.append(f"{descricao} {operador} ?")
+            params.append(f"%{p}%")
+        query += " WHERE " + " AND ".join(conditions) + f" ORDER BY {recentes}"
+    elif USE_POSTGRES:
+        consulta = " & ".join(f"{p}:*" for p in palavras)
+        conditions.insert(0, f"l.{C_LANC_BUSCA} @@ to_tsquery('simple', ?)")
+        params = [consulta, *params, consulta]
+        query += (" WHERE " + " AND ".join(conditions) +
+                  f" ORDER BY ts_rank(l.{C_LANC_BUSCA}, to_tsquery('simple', ?)) DESC, {recentes}")
+    else:
+        # Cada palavra entre aspas (nenhuma sintaxe FTS5 vem do usuário), seguida de * (prefixo)
+        consulta = " ".join(f'"{p}"*' for p in palavras)
+        candidatos = (f"SELECT l.id, f.rank as relevancia FROM {T_LANCAMENTOS} l "
+                      f"JOIN {T_BUSCA} f ON f.rowid = l.id "
+                      "WHERE " + " AND ".join(["f.descricao MATCH ?", *conditions]) +
+                      " ORDER BY f.rowid DESC LIMIT ?")
+        params = [consulta, *params, CANDIDATOS_BUSCA]
+        query += f" JOIN ({candidatos}) m ON m.id = l.id ORDER BY m.relevancia, {recentes}"
+
+    query += " LIMIT ?"
+    params.append(limite)
     cursor.execute(query, tuple(params))
     lancamentos = cursor.fetchall()
-    lancamentos = _wrap_rows(cursor, lancamentos)
     conn.close()
-    return lancamentos
+    return _resolver_nomes(lancamentos)
 
 
 # --- Funções de Análise ---
+#
+# Períodos de meses inteiros (mes/ano, só ano ou tudo) são lidos da tabela de
+# agregados mensais, mantida pelos triggers de lançamentos: o custo passa a ser
+# proporcional ao número de grupos (categoria x banco x mês), não de lançamentos.
+# Intervalos arbitrários de datas continuam somando os lançamentos.
+
+_tem_agregado_pg = None
+
+
+def _usa_agregados(cursor, data_inicio=None, data_fim=None):
+    """Indica se o período pode ser respondido pela tabela de agregados."""
+    global _tem_agregado_pg
+    if data_inicio or data_fim:
+        return False
+    if not USE_POSTGRES:
+        return True
+    # No PostgreSQL a tabela vem do scripts/schema_postgres.sql; bancos criados
+    # com versões antigas do script continuam funcionando sem ela
+    if _tem_agregado_pg is None:
+        cursor.execute("SELECT to_regclass(?) IS NOT NULL AS existe", (T_AGREGADO,))
+        _tem_agregado_pg = bool(cursor.fetchone()['existe'])
+    return _tem_agregado_pg
+
+
+def _filtro_periodo_agregado(mes=None, ano=None):
+    conditions = []
+    params = []
+    if mes:
+        conditions.append("a.mes = ?")
+        params.append(mes)
+    if ano:
+        conditions.append("a.ano = ?")
+        params.append(ano)
+    return " AND ".join(conditions) or "1=1", params
 
-def obter_soma_por_categoria(mes, ano):
-    """Retorna a soma dos valores pagos agrupados por categoria para um dado mês e ano."""
+
+def listar_anos():
+    """Anos que têm lançamentos, em ordem crescente (para os filtros da interface)."""
     conn, cursor = conectar()
-    if USE_POSTGRES:
+    if _usa_agregados(cursor):
+        cursor.execute(f"SELECT DISTINCT a.ano FROM {T_AGREGADO} a ORDER BY a.ano")
+    else:
+        cursor.execute(f"SELECT DISTINCT EXTRACT(YEAR FROM l.{C_LANC_DATA}) as ano "
+                       f"FROM {T_LANCAMENTOS} l ORDER BY ano")
+    anos = [int(linha[0]) for linha in cursor.fetchall()]
+    conn.close()
+    return anos
+
+
+def _obter_soma_agrupada(tabela, col_lanc, col_agr, mes, ano, data_inicio, data_fim):
+    """Soma dos valores pagos agrupada pelo cadastro `tabela` (categoria/banco).
+
+    O agrupamento é pelo id; os nomes vêm do cache dos cadastros.
+    """
+    conn, cursor = conectar()
+    if _usa_agregados(cursor, data_inicio, data_fim):
+        where, params = _filtro_periodo_agregado(mes, ano)
         query = f"""
-            SELECT c.nome, SUM(l.{C_LANC_VLR_PAGO}) as total
-            FROM {T_LANCAMENTOS} l
-            JOIN {T_CATEGORIAS} c ON l.{C_LANC_ID_CATEGORIA} = c.id
-            WHERE EXTRACT(MONTH FROM l.{C_LANC_DATA}) = ? AND EXTRACT(YEAR FROM l.{C_LANC_DATA}) = ? 
-              AND l.{C_LANC_VLR_PAGO} IS NOT NULL AND l.{C_LANC_VLR_PAGO} != 0
-            GROUP BY c.nome
-            ORDER BY total DESC
+            SELECT a.{col_agr} as id, {_centavos('SUM(a.pago)')} as total
+            FROM {T_AGREGADO} a
+            WHERE {where}
+            GROUP BY a.{col_agr}
+            HAVING SUM(a.qtd_pago) > 0
         """
     else:
+        periodo, params = _filtro_periodo('l.', mes, ano, data_inicio, data_fim)
+        where = " AND ".join(periodo) or "1=1"
+        pago = f"l.{C_LANC_VLR_PAGO}" if USE_POSTGRES else "l.valor_pago"
         query = f"""
-            SELECT c.nome, SUM(CAST(l.valor_pago AS REAL)) as total
+            SELECT l.{col_lanc} as id, {_centavos(f'SUM({pago})')} as total
             FROM {T_LANCAMENTOS} l
-            JOIN {T_CATEGORIAS} c ON l.categoria_id = c.id
-            WHERE l.mes = ? AND l.ano = ? AND l.valor_pago IS NOT NULL AND l.valor_pago != 0
-            GROUP BY c.nome
-            ORDER BY total DESC
+            WHERE {where} AND {pago} IS NOT NULL AND {pago} != 0
+            GROUP BY l.{col_lanc}
         """
-    cursor.execute(query, (mes, ano))
-    resultado = cursor.fetchall()
-    resultado = _wrap_rows(cursor, resultado)
+    cursor.execute(query, tuple(params))
+    grupos = cursor.fetchall()
     conn.close()
+
+    nomes = _mapas_nomes({tabela: {g['id'] for g in grupos if g['id']}})[tabela]
+    linha = _classe_linha(('nome', 'total'))
+    # Sem cadastro (id nulo/0) fica de fora, como fazia o JOIN
+    resultado = [linha((nomes[g['id']], g['total'])) for g in grupos if g['id'] in nomes]
+    resultado.sort(key=lambda item: item[1], reverse=True)
     return resultado
 
 
-def obter_soma_por_banco(mes, ano):
-    """Retorna a soma dos valores pagos agrupados por banco para um dado mês e ano."""
+def obter_soma_por_categoria(mes=None, ano=None, data_inicio=None, data_fim=None):
+    """Retorna a soma dos valores pagos agrupados por categoria para um dado mês e ano.
+
+    Aceita também um intervalo explícito (`data_inicio`/`data_fim`, inclusivos).
+    """
+    col_lanc = C_LANC_ID_CATEGORIA if USE_POSTGRES else "categoria_id"
+    return _obter_soma_agrupada(T_CATEGORIAS, col_lanc, C_AGR_ID_CATEGORIA,
+                                mes, ano, data_inicio, data_fim)
+
+
+def obter_soma_por_banco(mes=None, ano=None, data_inicio=None, data_fim=None):
+    """Retorna a soma dos valores pagos agrupados por banco para um dado mês e ano.
+
+    Aceita também um intervalo explícito (`data_inicio`/`data_fim`, inclusivos).
+    """
+    col_lanc = C_LANC_ID_BANCO if USE_POSTGRES else "banco_id"
+    return _obter_soma_agrupada(T_BANCOS, col_lanc, C_AGR_ID_BANCO,
+                                mes, ano, data_inicio, data_fim)
+
+
+def obter_entradas_saidas_saldo(mes=None, ano=None, data_inicio=None, data_fim=None):
+    """Calcula o total de entradas, saídas e o saldo para um dado mês e ano.
+
+    Aceita também um intervalo explícito (`data_inicio`/`data_fim`, inclusivos).
+    """
     conn, cursor = conectar()
-    if USE_POSTGRES:
+    if _usa_agregados(cursor, data_inicio, data_fim):
+        where, params = _filtro_periodo_agregado(mes, ano)
         query = f"""
-            SELECT b.nome, SUM(l.{C_LANC_VLR_PAGO}) as total
-            FROM {T_LANCAMENTOS} l
-            JOIN {T_BANCOS} b ON l.{C_LANC_ID_BANCO} = b.id
-            WHERE EXTRACT(MONTH FROM l.{C_LANC_DATA}) = ? AND EXTRACT(YEAR FROM l.{C_LANC_DATA}) = ? 
-              AND l.{C_LANC_VLR_PAGO} IS NOT NULL AND l.{C_LANC_VLR_PAGO} != 0
-            GROUP BY b.nome
-            ORDER BY total DESC
+            SELECT {_centavos('SUM(a.entradas)')} as entradas, {_centavos('SUM(a.saidas)')} as saidas
+            FROM {T_AGREGADO} a
+            WHERE {where}
         """
     else:
+        periodo, params = _filtro_periodo('', mes, ano, data_inicio, data_fim)
+        where = " AND ".join(periodo) or "1=1"
+        pago = C_LANC_VLR_PAGO if USE_POSTGRES else "valor_pago"
         query = f"""
-            SELECT b.nome, SUM(CAST(l.valor_pago AS REAL)) as total
+            SELECT
+                {_centavos(f'SUM(CASE WHEN {pago} > 0 THEN {pago} ELSE 0 END)')} as entradas,
+                {_centavos(f'SUM(CASE WHEN {pago} < 0 THEN {pago} ELSE 0 END)')} as saidas
+            FROM {T_LANCAMENTOS}
+            WHERE {where} AND {pago} IS NOT NULL AND {pago} != 0
+        """
+    cursor.execute(query, tuple(params))
+    resultado = cursor.fetchone()
+    conn.close()
+
+    entradas = resultado['entradas'] or 0
+    saidas = resultado['saidas'] or 0
+    saldo = entradas + saidas # Saídas já são negativas
+    return {'entradas': entradas, 'saidas': saidas, 'saldo': saldo}
+
+
+def obter_resumo_mensal(mes=None, ano=None, data_inicio=None, data_fim=None):
+    """Resumo completo do período (entradas/saídas/saldo, por categoria e por banco).
+
+    Substitui as três chamadas `obter_entradas_saidas_saldo`,
+    `obter_soma_por_categoria` e `obter_soma_por_banco` por uma única consulta:
+    os lançamentos do período são lidos uma vez e agrupados no grão mais fino
+    (categoria x banco); os totais de cada visão são consolidados aqui, a partir
+    desses poucos grupos.
+
+    Retorna um dict com as chaves 'entradas', 'saidas', 'saldo',
+    'por_categoria' e 'por_banco' (listas de (nome, total) em ordem
+    decrescente de total), pronto para a janela de análise.
+    """
+    conn, cursor = conectar()
+    if _usa_agregados(cursor, data_inicio, data_fim):
+        where, params = _filtro_periodo_agregado(mes, ano)
+        query = f"""
+            SELECT a.{C_AGR_ID_CATEGORIA} as categoria, a.{C_AGR_ID_BANCO} as banco,
+                   {_centavos('SUM(a.entradas)')} as entradas, {_centavos('SUM(a.saidas)')} as saidas
+            FROM {T_AGREGADO} a
+            WHERE {where}
+            GROUP BY a.{C_AGR_ID_CATEGORIA}, a.{C_AGR_ID_BANCO}
+            HAVING SUM(a.qtd_pago) > 0
+        """
+    else:
+        periodo, params = _filtro_periodo('l.', mes, ano, data_inicio, data_fim)
+        where = " AND ".join(periodo) or "1=1"
+        if USE_POSTGRES:
+            categoria, banco, pago = C_LANC_ID_CATEGORIA, C_LANC_ID_BANCO, f"l.{C_LANC_VLR_PAGO}"
+        else:
+            categoria, banco, pago = "categoria_id", "banco_id", "l.valor_pago"
+        query = f"""
+            SELECT l.{categoria} as categoria, l.{banco} as banco,
+                   {_centavos(f'SUM(CASE WHEN {pago} > 0 THEN {pago} ELSE 0 END)')} as entradas,
+                   {_centavos(f'SUM(CASE WHEN {pago} < 0 THEN {pago} ELSE 0 END)')} as saidas
             FROM {T_LANCAMENTOS} l
-            JOIN {T_BANCOS} b ON l.banco_id = b.id
-            WHERE l.mes = ? AND l.ano = ? AND l.valor_pago IS NOT NULL AND l.valor_pago != 0
-            GROUP BY b.nome
-            ORDER BY total DESC
+            WHERE {where} AND {pago} IS NOT NULL AND {pago} != 0
+            GROUP BY l.{categoria}, l.{banco}
         """
-    cursor.execute(query, (mes, ano))
-    resultado = cursor.fetchall()
-    resultado = _wrap_rows(cursor, resultado)
+    cursor.execute(query, tuple(params))
+    grupos = cursor.fetchall()
     conn.close()
+    return _consolidar_resumo(grupos)
+
+
+def _consolidar_resumo(grupos):
+    """Consolida linhas (categoria, banco, entradas, saidas), com os ids dos
+    cadastros, no formato de `obter_resumo_mensal` (com os nomes)."""
+    mapas = _mapas_nomes({T_CATEGORIAS: {g['categoria'] for g in grupos if g['categoria']},
+                          T_BANCOS: {g['banco'] for g in grupos if g['banco']}})
+    categorias, bancos = mapas[T_CATEGORIAS], mapas[T_BANCOS]
+    entradas = saidas = 0
+    por_categoria = {}
+    por_banco = {}
+    for grupo in grupos:
+        ent = grupo['entradas'] or 0
+        sai = grupo['saidas'] or 0
+        entradas += ent
+        saidas += sai
+        # Lançamentos sem categoria/banco entram no resumo, mas não nas tabelas
+        # (mesmo comportamento de obter_soma_por_categoria/banco)
+        categoria = categorias.get(grupo['categoria'])
+        if categoria is not None:
+            por_categoria[categoria] = por_categoria.get(categoria, 0) + ent + sai
+        banco = bancos.get(grupo['banco'])
+        if banco is not None:
+            por_banco[banco] = por_banco.get(banco, 0) + ent + sai
+
+    def ordenar(totais):
+        return sorted(totais.items(), key=lambda item: item[1], reverse=True)
+
+    return {
+        'entradas': entradas,
+        'saidas': saidas,
+        'saldo': entradas + saidas,  # Saídas já são negativas
+        'por_categoria': ordenar(por_categoria),
+        'por_banco': ordenar(por_banco),
+    }
+
+
+# --- Tendência mensal ---
+#
+# Séries de vários meses (entradas, saídas e saldo mês a mês) saem de uma única
+# consulta agrupada por (ano, mes) e ficam em cache: a janela de análise pede a
+# mesma série a cada troca de aba. Toda gravação de lançamentos feita por este
+# processo descarta o cache; no PostgreSQL, onde outros clientes gravam no
+# mesmo banco, as séries também expiram após TTL_TENDENCIA segundos (0 = só a
+# invalidação local).
+TTL_TENDENCIA = _config_int('database', 'ttl_tendencia', 'DB_TTL_TENDENCIA', 60 if USE_POSTGRES else 0)
+
+_tendencias = {}
+_tendencias_lock = threading.Lock()
+# Incrementada a cada gravação: uma série calculada durante uma gravação
+# concorrente não entra no cache
+_geracao_lancamentos = 0
+
+
+def _lancamentos_alterados():
+    """Chamada após cada commit que altera lançamentos."""
+    global _geracao_lancamentos
+    with _tendencias_lock:
+        _geracao_lancamentos += 1
+        _tendencias.clear()
+        _faturas_fechadas.clear()
+
+
+def _meses_intervalo(ano_inicio, mes_inicio, ano_fim, mes_fim):
+    inicio = ano_inicio * 12 + mes_inicio - 1
+    fim = ano_fim * 12 + mes_fim - 1
+    return [(i // 12, i % 12 + 1) for i in range(inicio, fim + 1)]
+
+
+def obter_tendencia_mensal(ano_inicio, ano_fim=None, mes_inicio=1, mes_fim=12, por_categoria=False):
+    """Entradas, saídas e saldo (valores pagos) de cada mês de
+    mes_inicio/ano_inicio a mes_fim/ano_fim, inclusive.
+
+    Uma única consulta agrupada por mês (e por categoria, com
+    `por_categoria=True`) no lugar de uma chamada a
+    `obter_entradas_saidas_saldo` por mês. Retorna um dict com:
+
+      'meses': lista de (ano, mes) com todos os meses do intervalo, inclusive
+               os sem lançamentos;
+      'entradas', 'saidas', 'saldo': listas alinhadas com 'meses';
+      'saldo_acumulado', 'projetado_acumulado': saldo corrido ao fim de cada
+               mês (pago e projetado, com o saldo inicial dos bancos), também
+               alinhados com 'meses';
+      'por_categoria': lista de (nome, [saldo de cada mês]), em ordem
+               decrescente do total absoluto (só com `por_categoria=True`).
+
+    O resultado vem do cache e é compartilhado entre as chamadas: não altere.
+    """
+    ano_fim = ano_fim or ano_inicio
+    if (ano_fim, mes_fim) < (ano_inicio, mes_inicio):
+        raise ValueError("O fim do intervalo é anterior ao início.")
+    chave = (ano_inicio, mes_inicio, ano_fim, mes_fim, bool(por_categoria))
+    with _tendencias_lock:
+        item = _tendencias.get(chave)
+        geracao = _geracao_lancamentos
+    if item is not None and (not TTL_TENDENCIA or time.monotonic() - item[0] < TTL_TENDENCIA):
+        return item[1]
+
+    resultado = _calcular_tendencia(ano_inicio, mes_inicio, ano_fim, mes_fim, por_categoria)
+    with _tendencias_lock:
+        if geracao == _geracao_lancamentos:
+            _tendencias[chave] = (time.monotonic(), resultado)
     return resultado
 
 
-def obter_entradas_saidas_saldo(mes, ano):
-    """Calcula o total de entradas, saídas e o saldo para um dado mês e ano."""
+def _calcular_tendencia(ano_inicio, mes_inicio, ano_fim, mes_fim, por_categoria):
     conn, cursor = conectar()
-    if USE_POSTGRES:
+    # Saldo acumulado: o anterior ao intervalo mais a soma corrida dos meses
+    # (com categorias, a janela ordenada só por mês inclui os demais grupos do
+    # mesmo mês, então cada linha traz o acumulado até o fim do seu mês)
+    anterior = _saldo_anterior(cursor, FiltroLancamentos(mes=mes_inicio, ano=ano_inicio))
+    if _usa_agregados(cursor) and _colunas_saldo(cursor)[1]:
+        coluna = f"a.{C_AGR_ID_CATEGORIA}"
         query = f"""
-            SELECT
-                SUM(CASE WHEN {C_LANC_VLR_PAGO} > 0 THEN {C_LANC_VLR_PAGO} ELSE 0 END) as entradas,
-                SUM(CASE WHEN {C_LANC_VLR_PAGO} < 0 THEN {C_LANC_VLR_PAGO} ELSE 0 END) as saidas
-            FROM {T_LANCAMENTOS}
-            WHERE EXTRACT(MONTH FROM {C_LANC_DATA}) = ? AND EXTRACT(YEAR FROM {C_LANC_DATA}) = ? 
-              AND {C_LANC_VLR_PAGO} IS NOT NULL AND {C_LANC_VLR_PAGO} != 0
+            SELECT a.ano, a.mes{f", {coluna} as categoria" if por_categoria else ""},
+                   {_centavos('SUM(a.entradas)')} as entradas, {_centavos('SUM(a.saidas)')} as saidas,
+                   ? + {_centavos('SUM(SUM(a.pago)) OVER (ORDER BY a.ano, a.mes)')} as saldo_acumulado,
+                   ? + {_centavos('SUM(SUM(a.projetado)) OVER (ORDER BY a.ano, a.mes)')} as projetado_acumulado
+            FROM {T_AGREGADO} a
+            WHERE (a.ano, a.mes) >= (?, ?) AND (a.ano, a.mes) <= (?, ?)
+            GROUP BY a.ano, a.mes{f", {coluna}" if por_categoria else ""}
         """
+        params = (*anterior, ano_inicio, mes_inicio, ano_fim, mes_fim)
     else:
+        # Só no PostgreSQL sem a tabela de agregados (ou sem a coluna projetado)
+        mes_ref = f"date_trunc('month', l.{C_LANC_DATA})"
+        coluna = f"l.{C_LANC_ID_CATEGORIA}"
+        pago, projetado = _exprs_saldo('l.')
         query = f"""
-            SELECT
-                SUM(CASE WHEN CAST(valor_pago AS REAL) > 0 THEN CAST(valor_pago AS REAL) ELSE 0 END) as entradas,
-                SUM(CASE WHEN CAST(valor_pago AS REAL) < 0 THEN CAST(valor_pago AS REAL) ELSE 0 END) as saidas
-            FROM {T_LANCAMENTOS}
-            WHERE mes = ? AND ano = ? AND valor_pago IS NOT NULL AND valor_pago != 0
+            SELECT EXTRACT(YEAR FROM {mes_ref}) as ano, EXTRACT(MONTH FROM {mes_ref}) as mes{f", {coluna} as categoria" if por_categoria else ""},
+                   {_centavos(f'SUM(CASE WHEN l.{C_LANC_VLR_PAGO} > 0 THEN l.{C_LANC_VLR_PAGO} ELSE 0 END)')} as entradas,
+                   {_centavos(f'SUM(CASE WHEN l.{C_LANC_VLR_PAGO} < 0 THEN l.{C_LANC_VLR_PAGO} ELSE 0 END)')} as saidas,
+                   ? + {_centavos(f'SUM(SUM({pago})) OVER (ORDER BY {mes_ref})')} as saldo_acumulado,
+                   ? + {_centavos(f'SUM(SUM({projetado})) OVER (ORDER BY {mes_ref})')} as projetado_acumulado
+            FROM {T_LANCAMENTOS} l
+            WHERE l.{C_LANC_DATA} >= ? AND l.{C_LANC_DATA} < ?
+            GROUP BY {mes_ref}{f", {coluna}" if por_categoria else ""}
         """
-    cursor.execute(query, (mes, ano))
-    resultado = cursor.fetchone()
-    resultado = _wrap_row(cursor, resultado)
+        ano_limite, mes_limite = (ano_fim + 1, 1) if mes_fim == 12 else (ano_fim, mes_fim + 1)
+        params = (*anterior, date(ano_inicio, mes_inicio, 1), date(ano_limite, mes_limite, 1))
+    cursor.execute(query, params)
+    grupos = cursor.fetchall()
     conn.close()
 
-    entradas = resultado['entradas'] or 0.0
-    saidas = resultado['saidas'] or 0.0
-    saldo = entradas + saidas # Saídas já são negativas
-    return {'entradas': entradas, 'saidas': saidas, 'saldo': saldo}
+    meses = _meses_intervalo(ano_inicio, mes_inicio, ano_fim, mes_fim)
+    posicao = {mes: i for i, mes in enumerate(meses)}
+    entradas = [0] * len(meses)
+    saidas = [0] * len(meses)
+    acumulado = [None] * len(meses)
+    projetado = [None] * len(meses)
+    series = {}
+    for grupo in grupos:
+        i = posicao[(int(grupo['ano']), int(grupo['mes']))]
+        ent = grupo['entradas'] or 0
+        sai = grupo['saidas'] or 0
+        entradas[i] += ent
+        saidas[i] += sai
+        acumulado[i] = grupo['saldo_acumulado']
+        projetado[i] = grupo['projetado_acumulado']
+        if por_categoria and (ent or sai):
+            series.setdefault(grupo['categoria'], [0] * len(meses))[i] += ent + sai
+    # Meses sem lançamentos repetem o saldo do mês anterior
+    for serie, inicial in ((acumulado, anterior[0]), (projetado, anterior[1])):
+        for i, valor in enumerate(serie):
+            if valor is None:
+                serie[i] = serie[i - 1] if i else inicial
+
+    resultado = {
+        'meses': meses,
+        'entradas': entradas,
+        'saidas': saidas,
+        'saldo': [ent + sai for ent, sai in zip(entradas, saidas)],  # Saídas já são negativas
+        'saldo_acumulado': acumulado,
+        'projetado_acumulado': projetado,
+    }
+    if por_categoria:
+        nomes = _mapas_nomes({T_CATEGORIAS: {c for c in series if c}})[T_CATEGORIAS]
+        # Sem categoria fica de fora, como em obter_resumo_mensal
+        categorias = [(nomes[c], serie) for c, serie in series.items() if c in nomes]
+        categorias.sort(key=lambda item: sum(abs(v) for v in item[1]), reverse=True)
+        resultado['por_categoria'] = categorias
+    return resultado
+
+
+# --- Faturas dos cartões ---
+#
+# Cada cartão tem dia de fechamento e de vencimento. Uma compra entra na fatura
+# que fecha no próprio mês, se feita até o dia de fechamento, ou na do mês
+# seguinte; a fatura é identificada pelo mês do vencimento, que cai no mês do
+# fechamento quando o dia de vencimento é maior, ou no mês seguinte. Os totais
+# de várias faturas saem de uma consulta agrupada, restrita ao cartão e ao
+# intervalo de datas (índice por cartão e data). Faturas fechadas não mudam
+# mais: ficam em cache até a próxima gravação de lançamentos deste processo e,
+# no PostgreSQL, onde outro cliente ainda pode lançar uma compra atrasada, por
+# no máximo TTL_FATURAS segundos (0 = só a invalidação local).
+TTL_FATURAS = _config_int('database', 'ttl_faturas', 'DB_TTL_FATURAS', 60 if USE_POSTGRES else 0)
+
+_faturas_fechadas = {}
+
+
+def _indice_mes(ano, mes):
+    return ano * 12 + mes - 1
+
+
+def _data_no_mes(indice, dia):
+    """Data do `dia` no mês `indice` (`_indice_mes`), limitada ao último dia do mês."""
+    ano, mes = divmod(indice, 12)
+    return date(ano, mes + 1, min(dia, calendar.monthrange(ano, mes + 1)[1]))
+
+
+def periodo_fatura(ciclo, ano, mes):
+    """(início, fechamento, vencimento) da fatura que vence em mes/ano; `ciclo` = (dia de fechamento, de vencimento).
+
+    A fatura inclui as compras de `início` até o fechamento, inclusive.
+    """
+    fechamento_dia, vencimento_dia = ciclo
+    vencimento = _indice_mes(ano, mes)
+    fechamento = vencimento - (0 if vencimento_dia > fechamento_dia else 1)
+    inicio = _data_no_mes(fechamento - 1, fechamento_dia) + timedelta(days=1)
+    return inicio, _data_no_mes(fechamento, fechamento_dia), _data_no_mes(vencimento, vencimento_dia)
+
+
+def fatura_da_data(ciclo, data):
+    """(ano, mes) do vencimento da fatura em que entra uma compra feita em `data`."""
+    fechamento_dia, vencimento_dia = ciclo
+    indice = _indice_mes(data.year, data.month) + (1 if data.day > fechamento_dia else 0)
+    indice += 0 if vencimento_dia > fechamento_dia else 1
+    ano, mes = divmod(indice, 12)
+    return ano, mes + 1
+
+
+def obter_ciclos_cartoes():
+    """Dias de fechamento e vencimento de cada cartão: {id: (fechamento, vencimento)}; None se não definidos."""
+    conn, cursor = conectar()
+    cursor.execute(f"SELECT id, dia_fechamento, dia_vencimento FROM {T_CARTOES}")
+    ciclos = {linha['id']: (linha['dia_fechamento'], linha['dia_vencimento'])
+              if linha['dia_fechamento'] and linha['dia_vencimento'] else None
+              for linha in cursor.fetchall()}
+    conn.close()
+    return ciclos
+
+
+def definir_ciclo_cartao(id_cartao, dia_fechamento, dia_vencimento):
+    """Define os dias de fechamento e de vencimento do cartão (None nos dois remove o ciclo)."""
+    for dia in (dia_fechamento, dia_vencimento):
+        if dia is not None and not 1 <= dia <= 31:
+            raise ValueError("os dias de fechamento e vencimento devem estar entre 1 e 31")
+    if (dia_fechamento is None) != (dia_vencimento is None):
+        raise ValueError("informe o dia de fechamento e o de vencimento")
+    conn, cursor = conectar()
+    try:
+        cursor.execute(f"UPDATE {T_CARTOES} SET dia_fechamento = ?, dia_vencimento = ? WHERE id = ?",
+                       (dia_fechamento, dia_vencimento, id_cartao))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _ciclo_cartao(cursor, id_cartao):
+    cursor.execute(f"SELECT dia_fechamento, dia_vencimento FROM {T_CARTOES} WHERE id = ?", (id_cartao,))
+    linha = cursor.fetchone()
+    if linha is None:
+        raise ValueError(f"cartão {id_cartao} não existe")
+    if not linha['dia_fechamento'] or not linha['dia_vencimento']:
+        raise ValueError("defina os dias de fechamento e vencimento do cartão")
+    return int(linha['dia_fechamento']), int(linha['dia_vencimento'])
+
+
+def _totais_faturas(cursor, id_cartao, ciclo, inicio, fim):
+    """Totais por fatura das compras do cartão entre `inicio` e `fim` (inclusive): {índice do vencimento: dict}."""
+    fechamento_dia, vencimento_dia = ciclo
+    deslocamento = 0 if vencimento_dia > fechamento_dia else 1
+    if USE_POSTGRES:
+        data, cartao = f"l.{C_LANC_DATA}", f"l.{C_LANC_ID_CARTAO}"
+        previsto, pago = f"l.{C_LANC_VLR_PREVISTO}", f"l.{C_LANC_VLR_PAGO}"
+        indice = (f"CAST(EXTRACT(YEAR FROM {data}) AS INTEGER) * 12 + CAST(EXTRACT(MONTH FROM {data}) AS INTEGER) - 1"
+                  f" + CASE WHEN EXTRACT(DAY FROM {data}) > ? THEN 1 ELSE 0 END")
+        periodo, params = f"{data} >= ? AND {data} <= ?", [inicio, fim]
+    else:
+        cartao, previsto, pago = "l.cartao_id", "l.valor_previsto", "l.valor_pago"
+        indice = "l.ano * 12 + l.mes - 1 + CASE WHEN l.dia > ? THEN 1 ELSE 0 END"
+        periodo = "(l.ano, l.mes, l.dia) >= (?, ?, ?) AND (l.ano, l.mes, l.dia) <= (?, ?, ?)"
+        params = [inicio.year, inicio.month, inicio.day, fim.year, fim.month, fim.day]
+    cursor.execute(f"""
+        SELECT {indice} + ? as fatura, COUNT(*) as qtd,
+               {_centavos(f'COALESCE(SUM({previsto}), 0)')} as previsto,
+               {_centavos(f'COALESCE(SUM({pago}), 0)')} as pago,
+               {_centavos(f'COALESCE(SUM(COALESCE({pago}, {previsto})), 0)')} as total
+        FROM {T_LANCAMENTOS} l
+        WHERE {cartao} = ? AND {periodo}
+        GROUP BY 1
+    """, [fechamento_dia, deslocamento, id_cartao] + params)
+    return {int(linha['fatura']): {'qtd': linha['qtd'], 'previsto': linha['previsto'], 'pago': linha['pago'],
+                                    'total': linha['total']}
+            for linha in cursor.fetchall()}
+
+
+def obter_faturas(id_cartao, ano_inicio, mes_inicio=1, ano_fim=None, mes_fim=12):
+    """Faturas do cartão com vencimento de mes_inicio/ano_inicio a mes_fim/ano_fim, inclusive.
+
+    Cada fatura é um dict com 'ano' e 'mes' (do vencimento), 'inicio',
+    'fechamento' e 'vencimento' (datas), 'fechada' (o fechamento já passou) e
+    os totais em centavos das compras dela: 'qtd', 'previsto', 'pago' e
+    'total' (pago, ou previsto enquanto não há pagamento). As fechadas vêm do
+    cache quando possível; as demais saem de uma única consulta. Levanta
+    ValueError se o cartão não tem ciclo definido (`definir_ciclo_cartao`).
+    """
+    ano_fim = ano_fim or ano_inicio
+    if (ano_fim, mes_fim) < (ano_inicio, mes_inicio):
+        raise ValueError("O fim do intervalo é anterior ao início.")
+    hoje = date.today()
+    conn, cursor = conectar()
+    try:
+        ciclo = _ciclo_cartao(cursor, id_cartao)
+        with _tendencias_lock:
+            geracao = _geracao_lancamentos
+        faturas = []
+        faltando = []
+        for ano, mes in _meses_intervalo(ano_inicio, mes_inicio, ano_fim, mes_fim):
+            inicio, fechamento, vencimento = periodo_fatura(ciclo, ano, mes)
+            fatura = {'ano': ano, 'mes': mes, 'inicio': inicio, 'fechamento': fechamento,
+                      'vencimento': vencimento, 'fechada': fechamento < hoje}
+            item = _faturas_fechadas.get((id_cartao, ciclo, ano, mes)) if fatura['fechada'] else None
+            if item is not None and TTL_FATURAS and time.monotonic() - item[0] >= TTL_FATURAS:
+                item = None
+            if item is None:
+                faltando.append(fatura)
+            else:
+                fatura.update(item[1])
+            faturas.append(fatura)
+        if faltando:
+            encontrados = _totais_faturas(cursor, id_cartao, ciclo, faltando[0]['inicio'],
+                                          faltando[-1]['fechamento'])
+            vazia = {'qtd': 0, 'previsto': 0, 'pago': 0, 'total': 0}
+            with _tendencias_lock:
+                for fatura in faltando:
+                    totais = encontrados.get(_indice_mes(fatura['ano'], fatura['mes']), vazia)
+                    fatura.update(totais)
+                    # Calculada durante uma gravação concorrente: não entra no cache
+                    if fatura['fechada'] and geracao == _geracao_lancamentos:
+                        _faturas_fechadas[(id_cartao, ciclo, fatura['ano'], fatura['mes'])] = (
+                            time.monotonic(), dict(totais))
+        return faturas
+    finally:
+        conn.close()
+
+
+def listar_lancamentos_fatura(id_cartao, ano, mes):
+    """Lançamentos da fatura do cartão que vence em mes/ano, no formato da listagem."""
+    conn, cursor = conectar()
+    try:
+        ciclo = _ciclo_cartao(cursor, id_cartao)
+    finally:
+        conn.close()
+    inicio, fechamento, _ = periodo_fatura(ciclo, ano, mes)
+    return listar_lancamentos_filtrados(
+        filtro=FiltroLancamentos(cartoes=[id_cartao], data_inicio=inicio, data_fim=fechamento))
+
+
+# --- Manutenção dos agregados mensais ---
+
+_COLUNAS_AGREGADO = ('qtd', 'qtd_pago', 'entradas', 'saidas', 'previsto', 'pago', 'projetado')
 
 
-# Garante que as tabelas sejam criadas na inicialização
-criar_tabelas()
\ No newline at end of file
+def _sql_agregado_calculado():
+    """SELECT que calcula os agregados mensais a partir dos lançamentos."""
+    if USE_POSTGRES:
+        ano = f"CAST(EXTRACT(YEAR FROM {C_LANC_DATA}) AS INTEGER)"
+        mes = f"CAST(EXTRACT(MONTH FROM {C_LANC_DATA}) AS INTEGER)"
+        cat, banco = C_LANC_ID_CATEGORIA, C_LANC_ID_BANCO
+        previsto, pago = C_LANC_VLR_PREVISTO, C_LANC_VLR_PAGO
+    else:
+        ano, mes = "ano", "mes"
+        cat, banco = "categoria_id", "banco_id"
+        previsto, pago = "valor_previsto", "valor_pago"
+    return f"""
+        SELECT {ano} as ano, {mes} as mes,
+               COALESCE({cat}, 0) as {C_AGR_ID_CATEGORIA}, COALESCE({banco}, 0) as {C_AGR_ID_BANCO},
+               COUNT(*) as qtd,
+               SUM(CASE WHEN COALESCE({pago}, 0) != 0 THEN 1 ELSE 0 END) as qtd_pago,
+               COALESCE(SUM(CASE WHEN {pago} > 0 THEN {pago} ELSE 0 END), 0) as entradas,
+               COALESCE(SUM(CASE WHEN {pago} < 0 THEN {pago} ELSE 0 END), 0) as saidas,
+               COALESCE(SUM({previsto}), 0) as previsto,
+               COALESCE(SUM({pago}), 0) as pago,
+               COALESCE(SUM(COALESCE({pago}, {previsto})), 0) as projetado
+        FROM {T_LANCAMENTOS}
+        GROUP BY 1, 2, 3, 4
+    """
+
+
+def _exigir_agregados(cursor):
+    if not _usa_agregados(cursor):
+        raise RuntimeError(f"A tabela '{T_AGREGADO}' não existe. "
+                           "Aplique a seção de agregados de scripts/schema_postgres.sql.")
+
+
+def reconstruir_agregados():
+    """Recalcula do zero a tabela de agregados mensais. Retorna o número de grupos."""
+    conn, cursor = conectar()
+    try:
+        _exigir_agregados(cursor)
+        total = _reconstruir_agregados(cursor)
+        conn.commit()
+        _lancamentos_alterados()
+        return total
+    finally:
+        conn.close()
+
+
+def _reconstruir_agregados(cursor, colunas=_COLUNAS_AGREGADO):
+    # `colunas`: a migração 2 reconstrói a tabela anterior à coluna `projetado`
+    lista = f"ano, mes, {C_AGR_ID_CATEGORIA}, {C_AGR_ID_BANCO}, {', '.join(colunas)}"
+    cursor.execute(f"DELETE FROM {T_AGREGADO}")
+    cursor.execute(f"""
+        INSERT INTO {T_AGREGADO} ({lista})
+        SELECT {lista} FROM ({_sql_agregado_calculado()}) calculado
+    """)
+    cursor.execute(f"SELECT COUNT(*) as total FROM {T_AGREGADO}")
+    return cursor.fetchone()['total']
+
+
+def verificar_agregados(tolerancia=0):
+    """Compara a tabela de agregados com os lançamentos.
+
+    Os valores são exatos nos dois bancos (centavos no SQLite, NUMERIC no
+    PostgreSQL), então por padrão qualquer diferença é uma divergência.
+
+    Retorna a lista de divergências; cada item é um dict com 'chave'
+    (ano, mes, categoria_id, banco_id), 'esperado' e 'atual' (dicts com os
+    totais, ou None quando o grupo falta de um dos lados). Lista vazia = ok.
+    """
+    conn, cursor = conectar()
+    try:
+        _exigir_agregados(cursor)
+        grupos = {}
+        for origem, query in (('esperado', _sql_agregado_calculado()),
+                              ('atual', f"SELECT * FROM {T_AGREGADO}")):
+            cursor.execute(query)
+            for linha in cursor.fetchall():
+                chave = (int(linha['ano']), int(linha['mes']),
+                         int(linha[C_AGR_ID_CATEGORIA]), int(linha[C_AGR_ID_BANCO]))
+                totais = {col: linha[col] for col in _COLUNAS_AGREGADO}
+                grupos.setdefault(chave, {'esperado': None, 'atual': None})[origem] = totais
+    finally:
+        conn.close()
+
+    divergencias = []
+    for chave, lados in sorted(grupos.items()):
+        esperado, atual = lados['esperado'], lados['atual']
+        if esperado and atual and all(abs(esperado[col] - atual[col]) <= tolerancia
+                                      for col in _COLUNAS_AGREGADO):
+            continue
+        divergencias.append({'chave': chave, 'esperado': esperado, 'atual': atual})
+    return divergencias
+
+
+# --- Backup ---
+# SQLite: cópia online página a página (`sqlite3.Connection.backup`), em passos
+# de BACKUP_PAGINAS com uma pausa entre eles, de modo que a aplicação continua
+# lendo e gravando durante o backup. PostgreSQL: dump lógico das tabelas
+# (COPY ... TO STDOUT) num único snapshot, comprimido em gzip. Os arquivos
+# levam data e hora no nome e só os BACKUP_MANTER mais recentes são mantidos.
+
+_PREFIXO_BACKUP = 'financeiro'
+_ARQUIVO_BACKUP = re.compile(rf'^{_PREFIXO_BACKUP}-(\d{{8}}-\d{{6}})(?:_(\d+))?\.(db|sql\.gz)$')
+
+
+def _chave_backup(nome):
+    """Ordem cronológica dos arquivos de backup (None para arquivos que não são backups)."""
+    m = _ARQUIVO_BACKUP.match(nome)
+    return (m.group(1), int(m.group(2) or 0)) if m else None
+
+
+def listar_backups(diretorio=None):
+    """Caminhos dos backups em `diretorio` (padrão BACKUP_DIR), do mais antigo ao mais recente."""
+    diretorio = diretorio or BACKUP_DIR
+    if not os.path.isdir(diretorio):
+        return []
+    nomes = sorted((n for n in os.listdir(diretorio) if _chave_backup(n)), key=_chave_backup)
+    return [os.path.join(diretorio, n) for n in nomes]
+
+
+def _novo_arquivo_backup(diretorio, extensao):
+    base = f"{_PREFIXO_BACKUP}-{datetime.now():%Y%m%d-%H%M%S}"
+    caminho = os.path.join(diretorio, f"{base}.{extensao}")
+    n = 1
+    while os.path.exists(caminho):
+        n += 1
+        caminho = os.path.join(diretorio, f"{base}_{n}.{extensao}")
+    return caminho
+
+
+def _rotacionar_backups(diretorio, manter):
+    """Apaga os backups mais antigos além dos `manter` mais recentes; devolve os apagados."""
+    if manter <= 0:
+        return []
+    removidos = listar_backups(diretorio)[:-manter]
+    for caminho in removidos:
+        os.remove(caminho)
+    return removidos
+
+
+def fazer_backup(diretorio=None, manter=None, paginas=None, pausa_ms=None, ao_progredir=None):
+    """Grava um backup completo do banco em `diretorio` e aplica a retenção.
+
+    No SQLite o arquivo `.db` é copiado online e conferido com
+    `PRAGMA integrity_check`; no PostgreSQL é gerado um `.sql.gz` com o
+    conteúdo das tabelas (restaurável com psql sobre scripts/schema_postgres.sql)
+    e as linhas gravadas são recontadas. O backup só recebe o nome final depois
+    de conferido; se a conferência falhar, o arquivo é apagado e levanta
+    RuntimeError. `ao_progredir(feito, total)` é chamado durante a cópia
+    (páginas no SQLite, tabelas no PostgreSQL).
+
+    Devolve um dict com `arquivo`, `bytes`, `segundos` e `removidos` (backups
+    antigos apagados pela rotação).
+    """
+    diretorio = diretorio or BACKUP_DIR
+    manter = BACKUP_MANTER if manter is None else manter
+    os.makedirs(diretorio, exist_ok=True)
+    inicio = time.perf_counter()
+
+    destino = _novo_arquivo_backup(diretorio, 'sql.gz' if USE_POSTGRES else 'db')
+    parcial = destino + '.parcial'
+    try:
+        if USE_POSTGRES:
+            contagens = _dump_postgres(parcial, ao_progredir)
+            problemas = _conferir_dump(parcial, contagens)
+        else:
+            _copiar_sqlite(parcial, paginas or BACKUP_PAGINAS,
+                           BACKUP_PAUSA_MS if pausa_ms is None else pausa_ms, ao_progredir)
+            problemas = _conferir_sqlite(parcial)
+        if problemas:
+            raise RuntimeError("Backup inválido: " + "; ".join(problemas[:5]))
+        os.replace(parcial, destino)
+    finally:
+        if os.path.exists(parcial):
+            os.remove(parcial)
+
+    return {'arquivo': destino, 'bytes': os.path.getsize(destino),
+            'segundos': time.perf_counter() - inicio,
+            'removidos': _rotacionar_backups(diretorio, manter)}
+
+
+def verificar_backup(caminho):
+    """Confere um arquivo de backup; devolve a lista de problemas (vazia se está íntegro)."""
+    if not os.path.isfile(caminho):
+        return [f"arquivo não encontrado: {caminho}"]
+    if caminho.endswith('.sql.gz'):
+        return _conferir_dump(caminho)
+    return _conferir_sqlite(caminho)
+
+
+def _copiar_sqlite(destino, paginas, pausa_ms, ao_progredir):
+    # Conexão própria, fora do pool: a cópia pode levar minutos e não deve
+    # prender uma das conexões da aplicação
+    origem = sqlite3.connect(SQLITE_FILE, timeout=SQLITE_CONFIG['busy_timeout'] / 1000)
+    copia = sqlite3.connect(destino)
+    try:
+        if origem.execute("PRAGMA journal_mode").fetchone()[0].lower() == 'wal':
+            # Com WAL, uma transação de leitura aberta fixa o snapshot: as outras
+            # conexões continuam gravando e a cópia não recomeça a cada gravação.
+            # Nos demais modos cada passo trava o arquivo só enquanto copia
+            origem.execute("BEGIN")
+            origem.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchall()
+        progresso = (None if ao_progredir is None
+                     else lambda status, restantes, total: ao_progredir(total - restantes, total))
+        origem.backup(copia, pages=max(1, paginas), progress=progresso, sleep=max(0, pausa_ms) / 1000)
+        # O arquivo copiado herda o modo WAL da origem; o backup fica num arquivo só
+        copia.execute("PRAGMA journal_mode = DELETE")
+    finally:
+        copia.close()
+        origem.close()
+
+
+def _conferir_sqlite(caminho):
+    try:
+        conn = sqlite3.connect(f"file:{urllib.parse.quote(os.path.abspath(caminho))}?mode=ro", uri=True)
+        try:
+            resultado = [linha[0] for linha in conn.execute("PRAGMA integrity_check")]
+        finally:
+            conn.close()
+    except sqlite3.DatabaseError as e:
+        return [f"{os.path.basename(caminho)}: {e}"]
+    return [] if resultado == ['ok'] else resultado
+
+
+def _dump_postgres(destino, ao_progredir):
+    """Grava o conteúdo das tabelas em `destino` (SQL com COPY, gzip); devolve as linhas por tabela."""
+    tabelas = (T_CATEGORIAS, T_BANCOS, T_CARTOES, T_RECORRENCIAS, T_LANCAMENTOS)
+    conn = _psycopg2.connect(DATABASE_URL)
+    # Um único snapshot para todas as tabelas, sem bloquear as gravações
+    conn.set_session(isolation_level='REPEATABLE READ', readonly=True)
+    contagens = {}
+    try:
+        cursor = conn.cursor()
+        with gzip.open(destino, 'wt', encoding='utf-8') as saida:
+            saida.write(f"-- Backup do Controle Financeiro, {datetime.now():%Y-%m-%d %H:%M:%S}\n"
+                        "-- Restaure sobre um banco com o schema de scripts/schema_postgres.sql\n"
+                        "SET client_encoding = 'UTF8';\nBEGIN;\n\n")
+            for i, tabela in enumerate(tabelas):
+                # Colunas geradas (descricao_busca) são recalculadas pelo servidor na restauração
+                cursor.execute("""
+                    SELECT column_name FROM information_schema.columns
+                    WHERE table_schema = current_schema() AND table_name = %s AND is_generated = 'NEVER'
+                    ORDER BY ordinal_position
+                """, (tabela,))
+                colunas = ', '.join(f'"{linha[0]}"' for linha in cursor.fetchall())
+                # Tabela ausente (schema de uma versão anterior do script): fica fora do backup
+                if colunas:
+                    saida.write(f"COPY {tabela} ({colunas}) FROM stdin;\n")
+                    cursor.copy_expert(f"COPY (SELECT {colunas} FROM {tabela} ORDER BY id) TO STDOUT", saida)
+                    saida.write("\\.\n\n")
+                    contagens[tabela] = cursor.rowcount
+                if ao_progredir is not None:
+                    ao_progredir(i + 1, len(tabelas))
+            for tabela in contagens:
+                saida.write(f"SELECT setval(pg_get_serial_sequence('{tabela}', 'id'), "
+                            f"COALESCE(MAX(id), 1), MAX(id) IS NOT NULL) FROM {tabela};\n")
+            saida.write("\nCOMMIT;\n")
+    finally:
+        conn.rollback()
+        conn.close()
+    return contagens
+
+
+def _conferir_dump(caminho, esperado=None):
+    """Relê um dump `.sql.gz`: gzip íntegro, blocos COPY fechados e, se dado, as linhas por tabela."""
+    contagens, tabela, fim = {}, None, False
+    try:
+        with gzip.open(caminho, 'rt', encoding='utf-8') as entrada:
+            for linha in entrada:
+                if tabela is not None:
+                    if linha == '\\.\n':
+                        tabela = None
+                    else:
+                        contagens[tabela] += 1
+                elif linha.startswith('COPY '):
+                    tabela = linha.split()[1]
+                    contagens[tabela] = 0
+                elif linha == 'COMMIT;\n':
+                    fim = True
+    except (OSError, EOFError, UnicodeDecodeError) as e:
+        return [f"{os.path.basename(caminho)}: {e}"]
+    problemas = []
+    if tabela is not None:
+        problemas.append(f"bloco COPY de '{tabela}' sem fim")
+    if not fim:
+        problemas.append("dump incompleto (sem COMMIT)")
+    for nome, linhas in (esperado or {}).items():
+        if linhas >= 0 and contagens.get(nome) != linhas:
+            problemas.append(f"{nome}: {contagens.get(nome)} linhas no arquivo, {linhas} copiadas")
+    return problemas
+
+
+# Garante que o schema esteja atualizado na inicialização (sem custo quando já está)
+aplicar_migracoes()
\ No newline at end of file
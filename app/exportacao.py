@@ -0,0 +1,139 @@
+"""Exportação de lançamentos para CSV e JSON Lines, com memória constante.
+
+As linhas vêm de `database.iterar_lancamentos` (cursor do lado do servidor no
+PostgreSQL) e são escritas à medida que chegam, então o tamanho do livro-caixa
+não muda o consumo de memória. Pensado também para rodar sem interface, por
+exemplo num dump noturno agendado.
+
+Uso:
+
+  python -m app.exportacao --formato csv --saida lancamentos.csv
+  python -m app.exportacao --formato jsonl --saida dump.jsonl.gz    # .gz comprime
+  python -m app.exportacao --ano 2024 --mes 3                       # CSV na saída padrão
+  python -m app.exportacao --moeda --saida planilha.csv             # valores como "R$ 1.234,56"
+  python -m app.exportacao --ano 2024 --categoria 3 5 --nao-pagos   # ids de categoria/banco/cartão
+
+O CSV usa as mesmas colunas aceitas por `python -m app.importacao`.
+"""
+import argparse
+import csv
+import gzip
+import json
+import sys
+from datetime import date, datetime
+
+from . import database
+from .formatacao import formatar_brl, ler_valor
+
+COLUNAS = ('id', 'data', 'descricao', 'valor_previsto', 'valor_pago', 'categoria', 'banco', 'cartao')
+
+
+def _valor(centavos):
+    # Os arquivos trazem reais com duas casas ("1234.50"), como a importação lê;
+    # montado a partir dos centavos, sem passar por ponto flutuante
+    if centavos is None:
+        return None
+    reais, resto = divmod(abs(int(centavos)), 100)
+    return f"{'-' if centavos < 0 else ''}{reais}.{resto:02d}"
+
+
+def registros(linhas, moeda=False):
+    """Converte linhas da listagem em dicts com as `COLUNAS` de exportação.
+
+    Com `moeda=True` os valores saem formatados em reais (para leitura humana;
+    `python -m app.importacao` também os aceita de volta).
+    """
+    valor = formatar_brl if moeda else _valor
+    for lanc in linhas:
+        yield {
+            'id': int(lanc['id']),
+            'data': date(int(lanc['ano']), int(lanc['mes']), int(lanc['dia'])).isoformat(),
+            'descricao': lanc['descricao'],
+            'valor_previsto': valor(lanc['valor_previsto']),
+            'valor_pago': valor(lanc['valor_pago']),
+            'categoria': lanc['categoria'],
+            'banco': lanc['banco'],
+            'cartao': lanc['cartao'],
+        }
+
+
+def escrever_csv(linhas, saida, moeda=False):
+    escritor = csv.DictWriter(saida, fieldnames=COLUNAS)
+    escritor.writeheader()
+    total = 0
+    for registro in registros(linhas, moeda):
+        escritor.writerow(registro)
+        total += 1
+    return total
+
+
+def escrever_jsonl(linhas, saida, moeda=False):
+    total = 0
+    for registro in registros(linhas, moeda):
+        saida.write(json.dumps(registro, ensure_ascii=False))
+        saida.write('\n')
+        total += 1
+    return total
+
+
+ESCRITORES = {'csv': escrever_csv, 'jsonl': escrever_jsonl}
+
+
+def exportar(saida, formato='csv', moeda=False, **filtros):
+    """Exporta os lançamentos (filtros de `database.iterar_lancamentos`) para `saida`.
+
+    Retorna o número de lançamentos escritos.
+    """
+    if formato not in ESCRITORES:
+        raise ValueError(f"Formato não suportado: '{formato}'. Use csv ou jsonl.")
+    return ESCRITORES[formato](database.iterar_lancamentos(**filtros), saida, moeda)
+
+
+def _abrir_saida(caminho):
+    if not caminho or caminho == '-':
+        return sys.stdout
+    if caminho.endswith('.gz'):
+        return gzip.open(caminho, 'wt', encoding='utf-8', newline='')
+    return open(caminho, 'w', encoding='utf-8', newline='')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m app.exportacao',
+                                     description="Exporta os lançamentos para CSV ou JSON Lines.")
+    parser.add_argument('--formato', choices=sorted(ESCRITORES), default='csv')
+    parser.add_argument('--saida', help="arquivo de saída (padrão: saída padrão; '.gz' comprime)")
+    parser.add_argument('--moeda', action='store_true', help='valores formatados em reais ("R$ 1.234,56")')
+    parser.add_argument('--mes', type=int)
+    parser.add_argument('--ano', type=int)
+    parser.add_argument('--de', dest='data_inicio', help="data inicial (AAAA-MM-DD)")
+    parser.add_argument('--ate', dest='data_fim', help="data final, inclusiva (AAAA-MM-DD)")
+    parser.add_argument('--categoria', dest='categorias', type=int, nargs='+', metavar='ID')
+    parser.add_argument('--banco', dest='bancos', type=int, nargs='+', metavar='ID')
+    parser.add_argument('--cartao', dest='cartoes', type=int, nargs='+', metavar='ID')
+    parser.add_argument('--valor-min', type=ler_valor, help="valor pago (ou previsto) mínimo, em reais")
+    parser.add_argument('--valor-max', type=ler_valor, help="valor pago (ou previsto) máximo, em reais")
+    situacao = parser.add_mutually_exclusive_group()
+    situacao.add_argument('--pagos', dest='pago', action='store_const', const=True)
+    situacao.add_argument('--nao-pagos', dest='pago', action='store_const', const=False)
+    args = parser.parse_args(argv)
+
+    filtros = {'mes': args.mes, 'ano': args.ano,
+               'filtro': database.FiltroLancamentos(categorias=args.categorias, bancos=args.bancos,
+                                                    cartoes=args.cartoes, valor_min=args.valor_min,
+                                                    valor_max=args.valor_max, pago=args.pago)}
+    for campo in ('data_inicio', 'data_fim'):
+        if getattr(args, campo):
+            filtros[campo] = datetime.strptime(getattr(args, campo), '%Y-%m-%d').date()
+
+    saida = _abrir_saida(args.saida)
+    try:
+        total = exportar(saida, args.formato, args.moeda, **filtros)
+    finally:
+        if saida is not sys.stdout:
+            saida.close()
+    print(f"{total} lançamentos exportados.", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
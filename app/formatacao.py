@@ -0,0 +1,107 @@
+"""Formatação de valores e linhas para exibição (tabelas da interface e exportações).
+
+A moeda é formatada sem depender do locale do sistema ("R$ 1.234,56",
+negativos como "-R$ 1.234,56", igual ao pt_BR do glibc), então o resultado é
+o mesmo em qualquer máquina, mesmo sem o locale pt_BR instalado. Como valores
+se repetem muito num livro-caixa (parcelas, assinaturas, tarifas), o texto de
+cada valor fica em cache.
+
+Valores monetários são centavos (int), como o `database` grava e devolve;
+`ler_valor` faz o caminho inverso, do texto digitado para centavos, sem
+passar por float.
+"""
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from functools import lru_cache
+
+# Troca os separadores do formato americano ("1,234.56") pelos brasileiros
+_SEPARADORES_BR = str.maketrans(',.', '.,')
+
+# Posições das colunas na linha da listagem (database.listar_lancamentos_*)
+_COL_BANCO_CARTAO = (6, 7)
+_COL_PREVISTO = 8
+_COL_PAGO = 9
+# Saldo corrido (saldo_pago, saldo_projetado), quando a listagem o traz
+_COL_SALDOS = (10, 11)
+
+
+@lru_cache(maxsize=8192)
+def _formatar_brl(centavos):
+    reais, resto = divmod(abs(centavos), 100)
+    texto = f"{reais:,}".translate(_SEPARADORES_BR) + f",{resto:02d}"
+    return f"-R$ {texto}" if centavos < 0 else f"R$ {texto}"
+
+
+def _celula_moeda(centavos):
+    """(texto, negativo) de um valor em centavos vindo do banco."""
+    if centavos is None:
+        return "", False
+    return _formatar_brl(centavos), centavos < 0
+
+
+def formatar_brl(centavos):
+    """Formata centavos (int) como moeda brasileira; None vira ""."""
+    return _celula_moeda(centavos)[0]
+
+
+def formatar_valor(centavos):
+    """Centavos no formato de edição ("-1234,50"), o que `ler_valor` lê de volta; None vira ""."""
+    if centavos is None:
+        return ""
+    reais, resto = divmod(abs(centavos), 100)
+    return f"{'-' if centavos < 0 else ''}{reais},{resto:02d}"
+
+
+def ler_valor(texto):
+    """Converte '1.234,56', '-12,5', '1234.56', 'R$ 10' etc. em centavos (None se vazio).
+
+    Com vírgula, o ponto é separador de milhar (formato brasileiro); sem
+    vírgula, é o separador decimal. Mais de duas casas decimais são
+    arredondadas (meio centavo para cima). Texto inválido levanta ValueError.
+    """
+    texto = (texto or '').strip().replace('R$', '').replace(' ', '')
+    if not texto:
+        return None
+    if ',' in texto:
+        texto = texto.replace('.', '').replace(',', '.')
+    try:
+        valor = Decimal(texto)
+    except InvalidOperation:
+        raise ValueError(f"valor inválido: '{texto}'") from None
+    if not valor.is_finite():
+        raise ValueError(f"valor inválido: '{texto}'")
+    return int(valor.scaleb(2).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def formatar_lancamentos(linhas):
+    """Formata um lote de linhas da listagem para o Treeview.
+
+    Retorna uma lista de (valores, tags): `valores` com banco/cartão vazios no
+    lugar de None e os valores em moeda; `tags` com 'negativo' quando o valor
+    previsto ou o pago é negativo.
+    """
+    celula = _celula_moeda
+    resultado = []
+    for lanc in linhas:
+        valores = list(lanc)
+        for i in _COL_BANCO_CARTAO:
+            if valores[i] is None:
+                valores[i] = ""
+        valores[_COL_PREVISTO], previsto_negativo = celula(valores[_COL_PREVISTO])
+        valores[_COL_PAGO], pago_negativo = celula(valores[_COL_PAGO])
+        if len(valores) > _COL_SALDOS[0]:
+            for i in _COL_SALDOS:
+                valores[i] = celula(valores[i])[0]
+        tags = ('negativo',) if previsto_negativo or pago_negativo else ()
+        resultado.append((tuple(valores), tags))
+    return resultado
+
+
+def formatar_lancamento(lanc):
+    """`formatar_lancamentos` para uma única linha."""
+    return formatar_lancamentos((lanc,))[0]
+
+
+def formatar_totais(pares):
+    """Formata pares (nome, total), como os de `obter_resumo_mensal`, para exibição."""
+    formatar = formatar_brl
+    return [(nome, formatar(total)) for nome, total in pares]
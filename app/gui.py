@@ -1,8 +1,19 @@
 import tkinter as tk
-from tkinter import ttk, messagebox
-import locale
+from tkinter import ttk, messagebox, filedialog
+from bisect import bisect_left
 from datetime import datetime, date
-from . import database
+from . import database, importacao
+from .formatacao import (formatar_brl, formatar_lancamento, formatar_lancamentos, formatar_totais,
+                         formatar_valor, ler_valor)
+from .tarefas import ExecutorTk
+
+# Quantidade de lançamentos buscada por vez ao rolar a tabela principal
+TAMANHO_PAGINA = 200
+# Busca textual: espera (ms) após a última tecla antes de consultar e máximo de resultados
+ATRASO_BUSCA = 250
+LIMITE_BUSCA = 200
+# Opções de "Repetir" no formulário: (frequência, parcelado) de `database.criar_recorrencia`
+REPETICOES = {"Não": None, "Mensal": ('mensal', False), "Anual": ('anual', False), "Parcelado": ('mensal', True)}
 
 
 # --- Nova Classe para Janelas de Cadastro Genéricas ---
@@ -10,8 +21,9 @@ class CadastroItemWindow(tk.Toplevel):
     """
     Janela genérica para cadastrar novos itens (categorias, bancos, cartões).
     """
-    def __init__(self, master, item_type: str, callback_on_save):
+    def __init__(self, master, executor, item_type: str, callback_on_save):
         super().__init__(master)
+        self.executor = executor
         self.item_type = item_type
         self.callback_on_save = callback_on_save
         self.title(f"Cadastrar {item_type.capitalize()}")
@@ -24,44 +36,249 @@ class CadastroItemWindow(tk.Toplevel):
         self.nome_entry.pack(pady=5)
         self.nome_entry.focus_set()
 
-        ttk.Button(self, text="Salvar", command=self.salvar_item).pack(pady=10)
+        self.btn_salvar = ttk.Button(self, text="Salvar", command=self.salvar_item)
+        self.btn_salvar.pack(pady=10)
 
     def salvar_item(self):
         nome = self.nome_entry.get().strip()
         if not nome:
             messagebox.showerror("Erro", "O nome não pode ser vazio.", parent=self)
             return
+
+        def concluido(_):
+            self.callback_on_save()
+            if self.winfo_exists():
+                messagebox.showinfo("Sucesso", f"{self.item_type.capitalize()} '{nome}' adicionada com sucesso!",
+                                    parent=self)
+                self.destroy()
+
+        def falhou(erro):
+            if not self.winfo_exists():
+                return
+            self.btn_salvar.config(state='normal')
+            if isinstance(erro, ValueError):
+                messagebox.showerror("Erro", str(erro), parent=self)
+            else:
+                messagebox.showerror("Erro", f"Não foi possível adicionar a {self.item_type.capitalize()}: {erro}",
+                                     parent=self)
+
+        self.btn_salvar.config(state='disabled')
+        self.executor.executar(database.adicionar_item_cadastro, self.item_type, nome, origem='gravacao',
+                               ao_concluir=concluido, ao_falhar=falhou)
+
+
+class SaldosIniciaisWindow(tk.Toplevel):
+    """Saldo inicial de cada banco: o ponto de partida do saldo corrido da tabela."""
+    def __init__(self, master, executor, callback_on_save):
+        super().__init__(master)
+        self.executor = executor
+        self.callback_on_save = callback_on_save
+        self.title("Saldos Iniciais dos Bancos")
+        self.geometry("400x350")
+        self.transient(master)
+        self.grab_set()
+
+        self.tree = ttk.Treeview(self, columns=("Banco", "Saldo inicial"), show='headings', selectmode='browse')
+        self.tree.heading("Banco", text="Banco")
+        self.tree.heading("Saldo inicial", text="Saldo inicial")
+        self.tree.column("Banco", anchor='w', width=200)
+        self.tree.column("Saldo inicial", anchor='e', width=120)
+        self.tree.pack(fill="both", expand=True, padx=10, pady=10)
+        self.tree.bind("<<TreeviewSelect>>", self.ao_selecionar)
+
+        frame_edicao = ttk.Frame(self)
+        frame_edicao.pack(fill="x", padx=10, pady=(0, 10))
+        ttk.Label(frame_edicao, text="Saldo inicial:").pack(side='left', padx=5)
+        self.valor_entry = ttk.Entry(frame_edicao, width=15, justify='right')
+        self.valor_entry.pack(side='left', padx=5)
+        self.btn_salvar = ttk.Button(frame_edicao, text="Salvar", command=self.salvar)
+        self.btn_salvar.pack(side='left', padx=5)
+
+        self.saldos = {}
+        self.carregar()
+
+    def carregar(self):
+        self.executor.executar(self.buscar_saldos, canal='saldos_iniciais', ao_concluir=self.exibir)
+
+    @staticmethod
+    def buscar_saldos():
+        return database.listar_itens_cadastro(database.T_BANCOS), database.obter_saldos_iniciais()
+
+    def exibir(self, resultado):
+        if not self.winfo_exists():
+            return
+        bancos, self.saldos = resultado
+        self.tree.delete(*self.tree.get_children())
+        for banco in bancos:
+            self.tree.insert("", "end", iid=str(banco['id']),
+                             values=(banco['nome'], formatar_brl(self.saldos.get(banco['id']) or 0)))
+
+    def ao_selecionar(self, _):
+        selecao = self.tree.selection()
+        if selecao:
+            valor = self.saldos.get(int(selecao[0])) or 0
+            self.valor_entry.delete(0, tk.END)
+            self.valor_entry.insert(0, formatar_valor(valor))
+
+    def salvar(self):
+        selecao = self.tree.selection()
+        if not selecao:
+            messagebox.showerror("Erro", "Selecione um banco.", parent=self)
+            return
         try:
-            database.adicionar_item_cadastro(self.item_type, nome)
-            messagebox.showinfo("Sucesso", f"{self.item_type.capitalize()} '{nome}' adicionada com sucesso!", parent=self)
+            valor = ler_valor(self.valor_entry.get()) or 0
+        except ValueError:
+            messagebox.showerror("Erro", "Valor inválido.", parent=self)
+            return
+
+        def concluido(_):
+            if self.winfo_exists():
+                self.carregar()
             self.callback_on_save()
-            self.destroy()
-        except ValueError as e:
-            messagebox.showerror("Erro", str(e), parent=self)
-        except Exception as e:
-            messagebox.showerror("Erro", f"Não foi possível adicionar a {self.item_type.capitalize()}: {e}", parent=self)
+
+        self.executor.executar(database.definir_saldo_inicial, int(selecao[0]), valor, origem='gravacao',
+                               ao_concluir=concluido)
+
+
+class FaturasWindow(tk.Toplevel):
+    """Faturas de um cartão no ano (pelo mês de vencimento), com os dias de fechamento e vencimento."""
+    def __init__(self, master, executor):
+        super().__init__(master)
+        self.executor = executor
+        self.title("Faturas dos Cartões")
+        self.geometry("760x420")
+        self.transient(master)
+        self.grab_set()
+
+        frame_cartao = ttk.Frame(self)
+        frame_cartao.pack(fill="x", padx=10, pady=(10, 0))
+        ttk.Label(frame_cartao, text="Cartão:").pack(side='left', padx=5)
+        self.cartao_combo = ttk.Combobox(frame_cartao, state="readonly", width=20)
+        self.cartao_combo.pack(side='left', padx=5)
+        self.cartao_combo.bind("<<ComboboxSelected>>", lambda _: self.ao_selecionar_cartao())
+        ttk.Label(frame_cartao, text="Fechamento:").pack(side='left', padx=(15, 5))
+        self.fechamento_spin = ttk.Spinbox(frame_cartao, from_=1, to=31, width=4)
+        self.fechamento_spin.pack(side='left', padx=5)
+        ttk.Label(frame_cartao, text="Vencimento:").pack(side='left', padx=5)
+        self.vencimento_spin = ttk.Spinbox(frame_cartao, from_=1, to=31, width=4)
+        self.vencimento_spin.pack(side='left', padx=5)
+        ttk.Button(frame_cartao, text="Salvar dias", command=self.salvar_ciclo).pack(side='left', padx=5)
+
+        ttk.Label(frame_cartao, text="Ano:").pack(side='left', padx=(15, 5))
+        self.ano_spin = ttk.Spinbox(frame_cartao, from_=1900, to=2999, width=6,
+                                    command=self.carregar_faturas)
+        self.ano_spin.pack(side='left', padx=5)
+        self.ano_spin.set(datetime.now().year)
+        self.ano_spin.bind("<Return>", lambda _: self.carregar_faturas())
+
+        cols = ("Vencimento", "Compras de", "até", "Qtd", "Previsto", "Pago", "Total", "Situação")
+        self.tree = ttk.Treeview(self, columns=cols, show='headings')
+        for col in cols:
+            self.tree.heading(col, text=col)
+            self.tree.column(col, anchor='e' if col in ("Previsto", "Pago", "Total") else 'center', width=85)
+        self.tree.pack(fill="both", expand=True, padx=10, pady=10)
+        self.lbl_aviso = ttk.Label(self, text="")
+        self.lbl_aviso.pack(pady=(0, 10))
+
+        self.cartoes_map = {}
+        self.ciclos = {}
+        self.executor.executar(self.buscar_cartoes, canal='faturas_cartoes', ao_concluir=self.exibir_cartoes)
+
+    @staticmethod
+    def buscar_cartoes():
+        return database.listar_itens_cadastro(database.T_CARTOES), database.obter_ciclos_cartoes()
+
+    def exibir_cartoes(self, resultado):
+        if not self.winfo_exists():
+            return
+        cartoes, self.ciclos = resultado
+        self.cartoes_map = {cartao['nome']: cartao['id'] for cartao in cartoes}
+        self.cartao_combo['values'] = list(self.cartoes_map.keys())
+        if cartoes and not self.cartao_combo.get():
+            self.cartao_combo.set(cartoes[0]['nome'])
+        self.ao_selecionar_cartao()
+
+    def cartao_selecionado(self):
+        return self.cartoes_map.get(self.cartao_combo.get())
+
+    def ao_selecionar_cartao(self):
+        ciclo = self.ciclos.get(self.cartao_selecionado())
+        self.fechamento_spin.set(ciclo[0] if ciclo else "")
+        self.vencimento_spin.set(ciclo[1] if ciclo else "")
+        self.carregar_faturas()
+
+    def carregar_faturas(self):
+        self.tree.delete(*self.tree.get_children())
+        id_cartao = self.cartao_selecionado()
+        if id_cartao is None:
+            self.lbl_aviso.config(text="Cadastre um cartão para ver as faturas.")
+            return
+        if not self.ciclos.get(id_cartao):
+            self.lbl_aviso.config(text="Informe os dias de fechamento e vencimento do cartão.")
+            return
+        try:
+            ano = int(self.ano_spin.get())
+        except ValueError:
+            return
+        self.lbl_aviso.config(text="")
+        self.executor.executar(database.obter_faturas, id_cartao, ano, canal='faturas',
+                               ao_concluir=self.exibir_faturas)
+
+    def exibir_faturas(self, faturas):
+        if not self.winfo_exists():
+            return
+        self.tree.delete(*self.tree.get_children())
+        for fatura in faturas:
+            self.tree.insert("", "end", values=(
+                fatura['vencimento'].strftime('%d/%m/%Y'), fatura['inicio'].strftime('%d/%m/%Y'),
+                fatura['fechamento'].strftime('%d/%m/%Y'), fatura['qtd'], formatar_brl(fatura['previsto']),
+                formatar_brl(fatura['pago']), formatar_brl(fatura['total']),
+                "Fechada" if fatura['fechada'] else "Aberta"))
+
+    def salvar_ciclo(self):
+        id_cartao = self.cartao_selecionado()
+        if id_cartao is None:
+            messagebox.showerror("Erro", "Selecione um cartão.", parent=self)
+            return
+        try:
+            ciclo = (int(self.fechamento_spin.get()), int(self.vencimento_spin.get()))
+        except ValueError:
+            messagebox.showerror("Erro", "Informe os dias de fechamento e vencimento.", parent=self)
+            return
+
+        def concluido(_):
+            self.ciclos[id_cartao] = ciclo
+            if self.winfo_exists():
+                self.carregar_faturas()
+
+        def falhou(erro):
+            messagebox.showerror("Erro", str(erro), parent=self)
+
+        self.executor.executar(database.definir_ciclo_cartao, id_cartao, *ciclo, origem='gravacao',
+                               ao_concluir=concluido, ao_falhar=falhou)
 
 
 # --- Nova Classe para Janela de Análise ---
 class AnaliseFinanceiraWindow(tk.Toplevel):
-    def __init__(self, master):
+    def __init__(self, master, executor):
         super().__init__(master)
-        self.title("Análise Financeira Mensal")
-        self.geometry("800x600")
+        self.executor = executor
+        self.title("Análise Financeira")
+        self.geometry("900x650")
         self.transient(master)
         self.grab_set()
 
-        # --- Configuração de Localização (Locale) para Moeda ---
-        try:
-            locale.setlocale(locale.LC_ALL, 'pt_BR.UTF-8')
-        except locale.Error:
-            try:
-                locale.setlocale(locale.LC_ALL, 'Portuguese_Brazil.1252')
-            except locale.Error:
-                locale.setlocale(locale.LC_ALL, '')
+        # Aba "Mês": resumo de um mês; aba "Tendência": evolução mês a mês
+        abas = ttk.Notebook(self)
+        abas.pack(fill="both", expand=True, padx=5, pady=5)
+        aba_mes = ttk.Frame(abas)
+        aba_tendencia = ttk.Frame(abas)
+        abas.add(aba_mes, text="Mês")
+        abas.add(aba_tendencia, text="Tendência")
+        self.criar_aba_tendencia(aba_tendencia)
 
         # --- Frame de Filtros ---
-        frame_filtros = ttk.LabelFrame(self, text="Selecionar Período")
+        frame_filtros = ttk.LabelFrame(aba_mes, text="Selecionar Período")
         frame_filtros.pack(fill="x", padx=10, pady=10)
 
         ttk.Label(frame_filtros, text="Mês:").pack(side='left', padx=5, pady=5)
@@ -72,10 +289,11 @@ class AnaliseFinanceiraWindow(tk.Toplevel):
         self.ano_entry = ttk.Entry(frame_filtros, width=6)
         self.ano_entry.pack(side='left', padx=5, pady=5)
 
-        ttk.Button(frame_filtros, text="Analisar", command=self.executar_analise).pack(side='left', padx=10, pady=5)
+        self.btn_analisar = ttk.Button(frame_filtros, text="Analisar", command=self.executar_analise)
+        self.btn_analisar.pack(side='left', padx=10, pady=5)
 
         # --- Frame de Resultados ---
-        frame_resultados = ttk.Frame(self)
+        frame_resultados = ttk.Frame(aba_mes)
         frame_resultados.pack(fill="both", expand=True, padx=10, pady=10)
 
         # --- Resumo Geral (Entradas, Saídas, Saldo) ---
@@ -122,42 +340,204 @@ class AnaliseFinanceiraWindow(tk.Toplevel):
         mes = int(mes_str)
         ano = int(ano_str)
 
+        # Resumo, categorias e bancos vêm de uma única consulta, fora da thread do Tk
+        self.btn_analisar.config(state='disabled', text="Analisando...")
+        self.executor.executar(database.obter_resumo_mensal, mes, ano, canal='analise',
+                               ao_concluir=self.exibir_resumo, ao_falhar=self.exibir_erro)
+
+    def exibir_resumo(self, resumo):
+        if not self.winfo_exists():
+            return  # janela fechada antes do resultado chegar
+        self.btn_analisar.config(state='normal', text="Analisar")
+
         # 1. Atualizar Resumo Geral
-        resumo = database.obter_entradas_saidas_saldo(mes, ano)
-        self.lbl_entradas.config(text=f"Entradas: {self.formatar_moeda(resumo['entradas'])}")
-        self.lbl_saidas.config(text=f"Saídas: {self.formatar_moeda(resumo['saidas'])}")
-        self.lbl_saldo.config(text=f"Saldo: {self.formatar_moeda(resumo['saldo'])}")
+        self.lbl_entradas.config(text=f"Entradas: {formatar_brl(resumo['entradas'])}")
+        self.lbl_saidas.config(text=f"Saídas: {formatar_brl(resumo['saidas'])}")
+        self.lbl_saldo.config(text=f"Saldo: {formatar_brl(resumo['saldo'])}")
 
         # 2. Atualizar Tabelas
-        self.popular_tabela(self.tree_cat, database.obter_soma_por_categoria(mes, ano))
-        self.popular_tabela(self.tree_banco, database.obter_soma_por_banco(mes, ano))
+        self.popular_tabela(self.tree_cat, resumo['por_categoria'])
+        self.popular_tabela(self.tree_banco, resumo['por_banco'])
+
+    def exibir_erro(self, erro):
+        if not self.winfo_exists():
+            return
+        self.btn_analisar.config(state='normal', text="Analisar")
+        messagebox.showerror("Erro", f"Não foi possível carregar a análise: {erro}", parent=self)
 
     def popular_tabela(self, tree, dados):
-        for i in tree.get_children():
-            tree.delete(i)
-        for item in dados:
-            tree.insert("", "end", values=(item[0], self.formatar_moeda(item[1])))
+        tree.delete(*tree.get_children())
+        for valores in formatar_totais(dados):
+            tree.insert("", "end", values=valores)
+
+    # --- Aba de tendência ---
+
+    def criar_aba_tendencia(self, parent):
+        self.tendencia = None  # último resultado de database.obter_tendencia_mensal
+
+        frame_periodo = ttk.LabelFrame(parent, text="Intervalo")
+        frame_periodo.pack(fill="x", padx=10, pady=10)
+        hoje = date.today()
+        # Padrão: os últimos 12 meses, incluindo o atual
+        inicio = (hoje.year - 1, hoje.month + 1) if hoje.month < 12 else (hoje.year, 1)
+        self.tend_mes_inicio, self.tend_ano_inicio = self.campos_mes_ano(frame_periodo, "De:", *inicio)
+        self.tend_mes_fim, self.tend_ano_fim = self.campos_mes_ano(frame_periodo, "Até:", hoje.month, hoje.year)
+
+        ttk.Label(frame_periodo, text="Série:").pack(side='left', padx=(15, 5), pady=5)
+        self.tend_serie = ttk.Combobox(frame_periodo, values=["Total"], width=22, state="readonly")
+        self.tend_serie.set("Total")
+        self.tend_serie.pack(side='left', padx=5, pady=5)
+        self.tend_serie.bind("<<ComboboxSelected>>", lambda e: self.exibir_serie())
+
+        self.btn_tendencia = ttk.Button(frame_periodo, text="Atualizar", command=self.executar_tendencia)
+        self.btn_tendencia.pack(side='left', padx=10, pady=5)
+
+        # Gráfico do saldo de cada mês (barras acima/abaixo de zero)
+        self.grafico = tk.Canvas(parent, height=220, background='white', highlightthickness=0)
+        self.grafico.pack(fill="x", padx=10, pady=5)
+        self.grafico.bind("<Configure>", lambda e: self.desenhar_grafico())
+
+        frame_tabela = ttk.Frame(parent)
+        frame_tabela.pack(fill="both", expand=True, padx=10, pady=5)
+        colunas = ("Mês", "Entradas", "Saídas", "Saldo", "Acumulado", "Acumulado Projetado")
+        self.tree_tendencia = ttk.Treeview(frame_tabela, columns=colunas, show='headings')
+        for coluna in colunas:
+            self.tree_tendencia.heading(coluna, text=coluna)
+            self.tree_tendencia.column(coluna, anchor='e', width=120)
+        self.tree_tendencia.column("Mês", anchor='w', width=90)
+        barra = ttk.Scrollbar(frame_tabela, orient='vertical', command=self.tree_tendencia.yview)
+        self.tree_tendencia.configure(yscrollcommand=barra.set)
+        barra.pack(side='right', fill='y')
+        self.tree_tendencia.pack(fill="both", expand=True)
+
+    def campos_mes_ano(self, parent, rotulo, mes, ano):
+        ttk.Label(parent, text=rotulo).pack(side='left', padx=5, pady=5)
+        combo = ttk.Combobox(parent, values=list(range(1, 13)), width=3, state="readonly")
+        combo.set(mes)
+        combo.pack(side='left', padx=2, pady=5)
+        entry = ttk.Entry(parent, width=6)
+        entry.insert(0, str(ano))
+        entry.pack(side='left', padx=2, pady=5)
+        return combo, entry
+
+    def executar_tendencia(self):
+        try:
+            mes_inicio, ano_inicio = int(self.tend_mes_inicio.get()), int(self.tend_ano_inicio.get())
+            mes_fim, ano_fim = int(self.tend_mes_fim.get()), int(self.tend_ano_fim.get())
+        except ValueError:
+            messagebox.showerror("Erro", "Informe o mês e o ano do início e do fim.", parent=self)
+            return
+        if (ano_fim, mes_fim) < (ano_inicio, mes_inicio):
+            messagebox.showerror("Erro", "O fim do intervalo é anterior ao início.", parent=self)
+            return
+
+        # Todos os meses (e as séries por categoria) vêm de uma única consulta
+        self.btn_tendencia.config(state='disabled', text="Carregando...")
+        self.executor.executar(database.obter_tendencia_mensal, ano_inicio, ano_fim,
+                               mes_inicio=mes_inicio, mes_fim=mes_fim, por_categoria=True,
+                               canal='tendencia', origem='analise',
+                               ao_concluir=self.exibir_tendencia, ao_falhar=self.erro_tendencia)
+
+    def exibir_tendencia(self, tendencia):
+        if not self.winfo_exists():
+            return
+        self.btn_tendencia.config(state='normal', text="Atualizar")
+        self.tendencia = tendencia
+        nomes = [nome for nome, _ in tendencia['por_categoria']]
+        self.tend_serie.config(values=["Total"] + nomes)
+        if self.tend_serie.get() not in nomes:
+            self.tend_serie.set("Total")
+        self.exibir_serie()
+
+    def erro_tendencia(self, erro):
+        if not self.winfo_exists():
+            return
+        self.btn_tendencia.config(state='normal', text="Atualizar")
+        messagebox.showerror("Erro", f"Não foi possível carregar a tendência: {erro}", parent=self)
+
+    def serie_selecionada(self):
+        """(entradas, saídas, saldo) da série escolhida; entradas/saídas são None por categoria."""
+        tendencia = self.tendencia
+        nome = self.tend_serie.get()
+        for categoria, saldo in tendencia['por_categoria']:
+            if categoria == nome:
+                return None, None, saldo
+        return tendencia['entradas'], tendencia['saidas'], tendencia['saldo']
+
+    def exibir_serie(self):
+        if self.tendencia is None:
+            return
+        entradas, saidas, saldo = self.serie_selecionada()
+        # O saldo acumulado é o das contas: só na série total
+        acumulado = self.tendencia['saldo_acumulado'] if entradas else None
+        projetado = self.tendencia['projetado_acumulado'] if entradas else None
+        tree = self.tree_tendencia
+        tree.delete(*tree.get_children())
+        for i, (ano, mes) in enumerate(self.tendencia['meses']):
+            tree.insert("", "end", values=(
+                f"{mes:02d}/{ano}",
+                formatar_brl(entradas[i]) if entradas else "",
+                formatar_brl(saidas[i]) if saidas else "",
+                formatar_brl(saldo[i]),
+                formatar_brl(acumulado[i]) if acumulado else "",
+                formatar_brl(projetado[i]) if projetado else ""))
+        self.desenhar_grafico()
+
+    def desenhar_grafico(self):
+        canvas = self.grafico
+        canvas.delete("all")
+        if self.tendencia is None:
+            return
+        _, _, saldo = self.serie_selecionada()
+        meses = self.tendencia['meses']
+        largura, altura = canvas.winfo_width(), canvas.winfo_height()
+        if largura < 50:
+            return  # ainda não mapeado; o <Configure> redesenha
+        margem, base_rotulos = 10, 18
+        maximo = max((abs(v) for v in saldo), default=0) or 1
+        area = altura - 2 * margem - base_rotulos
+        zero = margem + area / 2
+        passo = (largura - 2 * margem) / len(meses)
+        # Com muitos meses, só os rótulos de janeiro (ou um a cada N meses)
+        a_cada = 1 if passo >= 40 else (12 if passo * 12 >= 40 else max(1, int(40 // passo) + 1))
+        canvas.create_line(margem, zero, largura - margem, zero, fill='gray')
+        for i, ((ano, mes), valor) in enumerate(zip(meses, saldo)):
+            x0 = margem + i * passo + passo * 0.15
+            x1 = margem + (i + 1) * passo - passo * 0.15
+            y = zero - (float(valor) / float(maximo)) * (area / 2)
+            if valor:
+                canvas.create_rectangle(x0, min(y, zero), x1, max(y, zero), width=0,
+                                        fill='#2e7d32' if valor > 0 else '#c62828')
+            if (a_cada == 12 and mes == 1) or (a_cada != 12 and i % a_cada == 0):
+                rotulo = f"{mes:02d}/{ano % 100:02d}" if a_cada != 12 else str(ano)
+                canvas.create_text((x0 + x1) / 2, altura - margem, text=rotulo, font=('Helvetica', 8))
 
-    def formatar_moeda(self, valor):
-        return locale.currency(valor, grouping=True, symbol=True)
 
 class AppPrincipal:
     def __init__(self, root):
         self.root = root
         self.root.title("Controle Financeiro Pessoal")
-        self.root.geometry("1000x600")
+        self.root.geometry("1200x600")
 
-        # --- Configuração de Localização (Locale) para Moeda ---
-        try:
-            locale.setlocale(locale.LC_ALL, 'pt_BR.UTF-8')
-        except locale.Error:
-            try:
-                locale.setlocale(locale.LC_ALL, 'Portuguese_Brazil.1252')
-            except locale.Error:
-                locale.setlocale(locale.LC_ALL, '')
+        # Chamadas ao banco rodam fora da thread do Tk (ver app/tarefas.py)
+        self.executor = ExecutorTk(root, ao_mudar_estado=self.indicar_carregando)
+        self.root.protocol("WM_DELETE_WINDOW", self.fechar)
 
         self.id_selecionado = None
-        self.lancamentos_data = []
+        self.lancamentos_data = {}  # id -> linha, na ordem da tabela (iid do Treeview = id)
+
+        # --- Estado da listagem paginada ---
+        self.filtros_tabela = {}       # kwargs das funções de listagem ({'filtro': FiltroLancamentos})
+        self.nomes_filtro = {}         # coluna da listagem -> nome exigido (categoria/banco/cartão)
+        self.chaves_carregadas = []    # chave_lancamento das linhas exibidas, ordenadas
+        self.ultima_chave = None       # chave da última linha carregada
+        self.fim_da_listagem = True
+        self.carregando_pagina = False
+        self.total_lancamentos = 0
+        self.com_saldo = False         # listagem com saldo corrido (só período e banco filtrados)
+        self.selecionar_ao_carregar = None  # id a selecionar quando sua página chegar
+        self.termo_busca = ""          # termo cujos resultados estão na tabela ("" = listagem)
+        self.busca_agendada = None     # after() pendente da busca enquanto o usuário digita
 
         # --- Dicionários para mapear nome -> ID ---
         self.categorias_map = {} # Mapeia nome da categoria para ID
@@ -212,17 +592,63 @@ class AppPrincipal:
                                       validate='key', validatecommand=vcmd)
         self.v_pago_entry.grid(row=1, column=5, padx=5, pady=5, sticky='w')
 
+        # Recorrência: gera de uma vez os lançamentos dos próximos meses (só em inclusões)
+        ttk.Label(frame_master, text="Repetir:").grid(row=0, column=6, padx=15, pady=5, sticky='w')
+        self.repetir_combo = ttk.Combobox(frame_master, values=list(REPETICOES), state="readonly", width=12)
+        self.repetir_combo.grid(row=0, column=7, padx=5, pady=5, sticky='w')
+        self.repetir_combo.set("Não")
+
+        ttk.Label(frame_master, text="Vezes:").grid(row=1, column=6, padx=15, pady=5, sticky='w')
+        self.vezes_spin = ttk.Spinbox(frame_master, from_=0, to=database.MAX_OCORRENCIAS, width=6)
+        self.vezes_spin.grid(row=1, column=7, padx=5, pady=5, sticky='w')
+        self.vezes_spin.set(0)
+
         self.btn_salvar = ttk.Button(frame_master, text="Salvar Lançamento", command=self.salvar_lancamento)
         self.btn_salvar.grid(row=3, column=5, padx=5, pady=5, sticky='e')
         self.btn_limpar = ttk.Button(frame_master, text="Limpar Campos", command=self.limpar_campos)
         self.btn_limpar.grid(row=4, column=5, padx=5, pady=5, sticky='e')
 
         # --- Widgets do Frame Filtros ---
+        # Segunda linha (cadastros e valores), empacotada antes para ficar embaixo
+        filtros_cadastros = ttk.Frame(frame_filtros)
+        filtros_cadastros.pack(side='bottom', fill='x')
+
         ttk.Label(frame_filtros, text="Mês:").pack(side='left', padx=5, pady=5)
-        self.filtro_mes = ttk.Combobox(frame_filtros, values=["Todos"] + list(range(1, 13)), state="readonly")
+        self.filtro_mes = ttk.Combobox(frame_filtros, values=["Todos"] + list(range(1, 13)), state="readonly",
+                                       width=8)
         self.filtro_mes.pack(side='left', padx=5, pady=5)
         self.filtro_mes.set("Todos")
 
+        ttk.Label(frame_filtros, text="Ano:").pack(side='left', padx=5, pady=5)
+        self.filtro_ano = ttk.Combobox(frame_filtros, values=["Todos", datetime.now().year], state="readonly",
+                                       width=8)
+        self.filtro_ano.pack(side='left', padx=5, pady=5)
+        self.filtro_ano.set(datetime.now().year)
+
+        ttk.Label(filtros_cadastros, text="Categoria:").pack(side='left', padx=5, pady=5)
+        self.filtro_categoria = ttk.Combobox(filtros_cadastros, values=["Todas"], state="readonly", width=18)
+        self.filtro_categoria.pack(side='left', padx=5, pady=5)
+        self.filtro_categoria.set("Todas")
+
+        ttk.Label(filtros_cadastros, text="Banco:").pack(side='left', padx=5, pady=5)
+        self.filtro_banco = ttk.Combobox(filtros_cadastros, values=["Todos"], state="readonly", width=15)
+        self.filtro_banco.pack(side='left', padx=5, pady=5)
+        self.filtro_banco.set("Todos")
+
+        ttk.Label(filtros_cadastros, text="Cartão:").pack(side='left', padx=5, pady=5)
+        self.filtro_cartao = ttk.Combobox(filtros_cadastros, values=["Todos"], state="readonly", width=15)
+        self.filtro_cartao.pack(side='left', padx=5, pady=5)
+        self.filtro_cartao.set("Todos")
+
+        ttk.Label(filtros_cadastros, text="Valor de:").pack(side='left', padx=(15, 5), pady=5)
+        self.filtro_valor_min = ttk.Entry(filtros_cadastros, width=10, justify='right',
+                                          validate='key', validatecommand=vcmd)
+        self.filtro_valor_min.pack(side='left', padx=5, pady=5)
+        ttk.Label(filtros_cadastros, text="até:").pack(side='left', padx=5, pady=5)
+        self.filtro_valor_max = ttk.Entry(filtros_cadastros, width=10, justify='right',
+                                          validate='key', validatecommand=vcmd)
+        self.filtro_valor_max.pack(side='left', padx=5, pady=5)
+
         self.somente_previsto_var = tk.BooleanVar()
         self.filtro_check = ttk.Checkbutton(frame_filtros, text="Mostrar somente sem valor pago",
                                             variable=self.somente_previsto_var)
@@ -230,8 +656,19 @@ class AppPrincipal:
 
         ttk.Button(frame_filtros, text="Filtrar", command=self.atualizar_tabela).pack(side='left', padx=5, pady=5)
 
+        ttk.Label(frame_filtros, text="Buscar:").pack(side='left', padx=(15, 5), pady=5)
+        self.busca_var = tk.StringVar()
+        self.busca_entry = ttk.Entry(frame_filtros, width=25, textvariable=self.busca_var)
+        self.busca_entry.pack(side='left', padx=5, pady=5)
+        self.busca_entry.bind("<Escape>", lambda _: self.busca_var.set(""))
+        self.busca_var.trace_add('write', self.ao_digitar_busca)
+
+        self.lbl_total = ttk.Label(frame_filtros, text="")
+        self.lbl_total.pack(side='right', padx=5, pady=5)
+
         # --- Tabela (Treeview) ---
-        cols = ('ID', 'Dia', 'Mês', 'Ano', 'Descrição', 'Categoria', 'Banco', 'Cartão', 'Previsto', 'Pago')
+        cols = ('ID', 'Dia', 'Mês', 'Ano', 'Descrição', 'Categoria', 'Banco', 'Cartão', 'Previsto', 'Pago',
+                'Saldo', 'Saldo Projetado')
         self.tree = ttk.Treeview(frame_detail, columns=cols, show='headings')
 
         self.tree.tag_configure('negativo', foreground='red')
@@ -249,10 +686,13 @@ class AppPrincipal:
         self.tree.column('Cartão', width=120, anchor='w')
         self.tree.column('Previsto', width=100, anchor='e')
         self.tree.column('Pago', width=100, anchor='e')
+        # Saldo corrido: preenchido quando a tabela mostra uma conta (sem filtro de categoria, cartão, valor...)
+        self.tree.column('Saldo', width=110, anchor='e')
+        self.tree.column('Saldo Projetado', width=110, anchor='e')
 
-        scrollbar = ttk.Scrollbar(frame_detail, orient=tk.VERTICAL, command=self.tree.yview)
-        self.tree.configure(yscroll=scrollbar.set)
-        scrollbar.pack(side='right', fill='y')
+        self.scrollbar = ttk.Scrollbar(frame_detail, orient=tk.VERTICAL, command=self.tree.yview)
+        self.tree.configure(yscroll=self.ao_rolar_tabela)
+        self.scrollbar.pack(side='right', fill='y')
         self.tree.pack(fill='both', expand=True)
 
         self.tree.bind("<Double-1>", self.carregar_para_edicao)
@@ -262,74 +702,297 @@ class AppPrincipal:
         frame_acoes.pack(pady=5)
         ttk.Button(frame_acoes, text="Análise Financeira", command=self.abrir_janela_analise).pack(side='left', padx=10)
         ttk.Button(frame_acoes, text="Excluir Lançamento Selecionado", command=self.excluir_lancamento_selecionado).pack(side='left', padx=10)
+        ttk.Button(frame_acoes, text="Importar Arquivo...", command=self.importar_arquivo).pack(side='left', padx=10)
+        ttk.Button(frame_acoes, text="Saldos Iniciais...", command=self.abrir_saldos_iniciais).pack(side='left', padx=10)
+        ttk.Button(frame_acoes, text="Faturas...", command=self.abrir_faturas).pack(side='left', padx=10)
 
         self.carregar_comboboxes()
+        # Antes da primeira página (as tarefas rodam em ordem): avança as recorrências sem fim
+        self.executor.executar(database.expandir_recorrencias, origem='recorrencias')
         self.atualizar_tabela()
 
+    def fechar(self):
+        self.executor.encerrar()
+        self.root.destroy()
+
+    def indicar_carregando(self, ocupado):
+        """Estado de carga enquanto há consultas em andamento."""
+        self.root.config(cursor='watch' if ocupado else '')
+        if ocupado:
+            self.lbl_total.config(text="Carregando...")
+        else:
+            self.atualizar_rotulo_total()
+
     def carregar_comboboxes(self):
-        categorias = database.listar_itens_cadastro(database.T_CATEGORIAS)
+        self.executor.executar(self.buscar_cadastros, canal='cadastros', ao_concluir=self.preencher_comboboxes)
+
+    @staticmethod
+    def buscar_cadastros():
+        return (database.listar_itens_cadastro(database.T_CATEGORIAS),
+                database.listar_itens_cadastro(database.T_BANCOS),
+                database.listar_itens_cadastro(database.T_CARTOES),
+                database.listar_anos(),
+                database.recorrencias_disponiveis())
+
+    def preencher_comboboxes(self, cadastros):
+        categorias, bancos, cartoes, anos, recorrencias = cadastros
         self.categorias_map = {cat['nome']: cat['id'] for cat in categorias}
         self.cat_combo['values'] = list(self.categorias_map.keys())
-        bancos = database.listar_itens_cadastro(database.T_BANCOS)
+        self.filtro_categoria['values'] = ["Todas"] + list(self.categorias_map.keys())
         self.bancos_map = {banco['nome']: banco['id'] for banco in bancos}
         self.banco_combo['values'] = list(self.bancos_map.keys())
-        cartoes = database.listar_itens_cadastro(database.T_CARTOES)
+        self.filtro_banco['values'] = ["Todos"] + list(self.bancos_map.keys())
         self.cartoes_map = {cartao['nome']: cartao['id'] for cartao in cartoes}
         self.cartao_combo['values'] = list(self.cartoes_map.keys())
+        self.filtro_cartao['values'] = ["Todos"] + list(self.cartoes_map.keys())
+        self.filtro_ano['values'] = ["Todos"] + sorted(set(anos) | {datetime.now().year}, reverse=True)
+        # PostgreSQL sem a seção de recorrências do schema: só lançamentos avulsos
+        self.repetir_combo.config(state='readonly' if recorrencias else 'disabled')
+        self.vezes_spin.config(state='normal' if recorrencias else 'disabled')
 
     def atualizar_tabela(self):
-        for i in self.tree.get_children():
-            self.tree.delete(i)
-
-        mes = self.filtro_mes.get()
-        mes = int(mes) if mes != "Todos" else None
-
-        self.lancamentos_data = database.listar_lancamentos_filtrados(
-            mes=mes,
-            somente_previsto=self.somente_previsto_var.get()
-        )
-
-        for lanc in self.lancamentos_data:
-            valores = list(lanc)
-            tags = []
-
-            # Substitui None por "" para Banco e Cartão
-            if valores[6] is None:
-                valores[6] = ""
-            if valores[7] is None:
-                valores[7] = ""
-
-            val_previsto_raw = valores[8]
-            if val_previsto_raw is not None:
-                try:
-                    val_previsto = float(val_previsto_raw)
-                    if val_previsto < 0:
-                        tags.append('negativo')
-                    valores[8] = self.formatar_moeda(val_previsto)
-                except (ValueError, TypeError):
-                    valores[8] = str(val_previsto_raw)
-            else:
-                valores[8] = "" # Keep as empty string if None
-
-            val_pago_raw = valores[9]
-            if val_pago_raw is not None:
-                try:
-                    val_pago_float = float(val_pago_raw)
-                    if val_pago_float < 0 and 'negativo' not in tags:
-                        tags.append('negativo')
-                    valores[9] = self.formatar_moeda(val_pago_float)
-                except (ValueError, TypeError):
-                    valores[9] = str(val_pago_raw)
-            else:
-                valores[9] = ""
+        """Recarrega a tabela do início com os filtros atuais.
+
+        Só a primeira página é buscada aqui; as seguintes são carregadas sob
+        demanda conforme o usuário rola a tabela (ver `ao_rolar_tabela`).
+        """
+        self.tree.delete(*self.tree.get_children())
+
+        self.filtros_tabela = {'filtro': self.montar_filtro()}
+        self.com_saldo = self.filtros_tabela['filtro'].somente_conta()
+        self.termo_busca = self.busca_var.get().strip()
+        self.lancamentos_data = {}
+        self.chaves_carregadas = []
+        self.ultima_chave = None
+        self.fim_da_listagem = False
+        self.carregando_pagina = True
+        self.total_lancamentos = 0
+        # Canal 'tabela': se o filtro mudar de novo antes da resposta, esta é descartada
+        if self.termo_busca:
+            # Busca textual: os resultados mais relevantes de uma vez, sem paginação
+            self.executor.executar(database.buscar_lancamentos, self.termo_busca, limite=LIMITE_BUSCA,
+                                   canal='tabela', ao_concluir=self.exibir_resultados_busca,
+                                   ao_falhar=self.falha_ao_carregar_pagina, **self.filtros_tabela)
+            return
+        self.executor.executar(self.buscar_primeira_pagina, dict(self.filtros_tabela), self.com_saldo,
+                               canal='tabela', ao_concluir=self.exibir_primeira_pagina,
+                               ao_falhar=self.falha_ao_carregar_pagina)
+
+    def montar_filtro(self):
+        """`FiltroLancamentos` com os valores escolhidos na área de filtros."""
+        mes, ano = self.filtro_mes.get(), self.filtro_ano.get()
+        self.nomes_filtro = {}
+        ids = {}
+        for coluna, combo, mapa in (('categoria', self.filtro_categoria, self.categorias_map),
+                                    ('banco', self.filtro_banco, self.bancos_map),
+                                    ('cartao', self.filtro_cartao, self.cartoes_map)):
+            if combo.get() in mapa:
+                self.nomes_filtro[coluna] = combo.get()
+                ids[coluna] = [mapa[combo.get()]]
+        return database.FiltroLancamentos(
+            mes=int(mes) if mes != "Todos" else None,
+            ano=int(ano) if ano != "Todos" else None,
+            categorias=ids.get('categoria'), bancos=ids.get('banco'), cartoes=ids.get('cartao'),
+            valor_min=self.valor_digitado(self.filtro_valor_min),
+            valor_max=self.valor_digitado(self.filtro_valor_max),
+            pago=False if self.somente_previsto_var.get() else None)
+
+    @staticmethod
+    def valor_digitado(entry):
+        try:
+            return ler_valor(entry.get())
+        except ValueError:
+            return None  # só "-" ou "," digitados
+
+    @staticmethod
+    def buscar_primeira_pagina(filtros, com_saldo):
+        total = database.contar_lancamentos(**filtros)
+        return total, database.listar_lancamentos_pagina(limite=TAMANHO_PAGINA, com_saldo=com_saldo, **filtros)
+
+    def exibir_primeira_pagina(self, resultado):
+        self.total_lancamentos, pagina = resultado
+        self.exibir_pagina(pagina)
+
+    def exibir_resultados_busca(self, lancamentos):
+        self.carregando_pagina = False
+        self.fim_da_listagem = True
+        self.total_lancamentos = len(lancamentos)
+        for lanc in lancamentos:
+            self.lancamentos_data[int(lanc['id'])] = lanc
+        self.inserir_linhas(lancamentos)
+        self.atualizar_rotulo_total()
+
+    def ao_digitar_busca(self, *_):
+        """Agenda a busca para quando o usuário parar de digitar (debounce de ATRASO_BUSCA ms)."""
+        if self.busca_agendada is not None:
+            self.root.after_cancel(self.busca_agendada)
+        self.busca_agendada = self.root.after(ATRASO_BUSCA, self.buscar_digitado)
+
+    def buscar_digitado(self):
+        self.busca_agendada = None
+        if self.busca_var.get().strip() != self.termo_busca:
+            self.atualizar_tabela()
+
+    def carregar_proxima_pagina(self):
+        if self.fim_da_listagem or self.carregando_pagina:
+            return
+        self.carregando_pagina = True
+        saldo_anterior = None
+        if self.com_saldo and self.ultima_chave is not None:
+            # A página seguinte continua do saldo da última linha carregada
+            ultima = self.lancamentos_data[self.ultima_chave[3]]
+            saldo_anterior = (ultima['saldo_pago'], ultima['saldo_projetado'])
+        self.executor.executar(database.listar_lancamentos_pagina, apos=self.ultima_chave,
+                               limite=TAMANHO_PAGINA, com_saldo=self.com_saldo, saldo_anterior=saldo_anterior,
+                               canal='tabela', ao_concluir=self.exibir_pagina,
+                               ao_falhar=self.falha_ao_carregar_pagina, **self.filtros_tabela)
+
+    def falha_ao_carregar_pagina(self, erro):
+        self.carregando_pagina = False
+        messagebox.showerror("Erro", f"Não foi possível carregar os lançamentos: {erro}")
+
+    def exibir_pagina(self, pagina):
+        self.carregando_pagina = False
+        if len(pagina) < TAMANHO_PAGINA:
+            self.fim_da_listagem = True
+        if pagina:
+            self.ultima_chave = database.chave_lancamento(pagina[-1])
+            for lanc in pagina:
+                self.lancamentos_data[int(lanc['id'])] = lanc
+                self.chaves_carregadas.append(database.chave_lancamento(lanc))
+            self.inserir_linhas(pagina)
+            if self.selecionar_ao_carregar in self.lancamentos_data:
+                self.tree.selection_set(str(self.selecionar_ao_carregar))
+            self.selecionar_ao_carregar = None
+        self.atualizar_rotulo_total()
+
+    def atualizar_rotulo_total(self):
+        if self.termo_busca:
+            mais = " (os mais relevantes)" if self.total_lancamentos >= LIMITE_BUSCA else ""
+            self.lbl_total.config(text=f"{self.total_lancamentos} resultado(s) para \"{self.termo_busca}\"{mais}")
+            return
+        self.lbl_total.config(text=f"Exibindo {len(self.lancamentos_data)} de {self.total_lancamentos} lançamentos")
+
+    def ao_rolar_tabela(self, primeiro, ultimo):
+        """Acompanha a rolagem da tabela e busca a próxima página perto do fim."""
+        self.scrollbar.set(primeiro, ultimo)
+        if not self.fim_da_listagem and float(ultimo) > 0.9:
+            # Fora do callback de rolagem: inserir linhas dispara nova rolagem
+            self.root.after_idle(self.carregar_proxima_pagina_se_necessario)
+
+    def carregar_proxima_pagina_se_necessario(self):
+        if not self.fim_da_listagem and self.tree.yview()[1] > 0.9:
+            self.carregar_proxima_pagina()
+
+    def inserir_linhas(self, lancamentos):
+        # Formata a página inteira de uma vez antes de tocar no Treeview
+        for lanc, (valores, tags) in zip(lancamentos, formatar_lancamentos(lancamentos)):
+            self.tree.insert("", "end", iid=str(lanc['id']), values=valores, tags=tags)
+
+    def formatar_linha(self, lanc):
+        """Valores exibidos no Treeview e tags de uma linha da listagem."""
+        return formatar_lancamento(lanc)
+
+    def corresponde_filtro(self, lanc):
+        """Indica se a linha seria retornada pela listagem com os filtros atuais."""
+        filtro = self.filtros_tabela.get('filtro')
+        if filtro is None:
+            return True
+        if filtro.mes and int(lanc['mes']) != filtro.mes:
+            return False
+        if filtro.ano and int(lanc['ano']) != filtro.ano:
+            return False
+        if any(lanc[coluna] != nome for coluna, nome in self.nomes_filtro.items()):
+            return False
+        valor = lanc['valor_pago'] if lanc['valor_pago'] is not None else lanc['valor_previsto']
+        if filtro.valor_min is not None and (valor is None or valor < filtro.valor_min):
+            return False
+        if filtro.valor_max is not None and (valor is None or valor > filtro.valor_max):
+            return False
+        if filtro.pago is False and lanc['valor_pago']:
+            return False
+        return True
+
+    def aplicar_alteracao(self, antigo, novo):
+        """Atualiza na tabela apenas a linha afetada por uma gravação.
+
+        `antigo` é a linha como estava exibida (None para inclusões) e `novo`
+        a linha retornada pelo banco (None para exclusões). A posição da linha
+        é encontrada por busca binária na ordem da listagem, sem recarregar
+        nada do banco.
+        """
+        if self.carregando_pagina and self.ultima_chave is None:
+            # A primeira página ainda vai chegar e já reflete a gravação (as
+            # tarefas do executor rodam em ordem)
+            return
+        if self.ultima_chave is None and not self.fim_da_listagem:
+            # Nenhuma página carregada (a primeira falhou): não há onde encaixar a linha
+            self.atualizar_tabela()
+            return
+        if self.termo_busca:
+            # Resultados da busca estão em ordem de relevância: refaz a busca
+            self.atualizar_tabela()
+            return
 
-            self.tree.insert("", "end", values=tuple(valores), tags=tags)
+        if antigo is not None:
+            if self.corresponde_filtro(antigo):
+                self.total_lancamentos -= 1
+            chave = database.chave_lancamento(antigo)
+            i = bisect_left(self.chaves_carregadas, chave)
+            if i < len(self.chaves_carregadas) and self.chaves_carregadas[i] == chave:
+                del self.chaves_carregadas[i]
+                del self.lancamentos_data[chave[3]]
+                self.tree.delete(str(chave[3]))
+
+        if novo is not None and self.corresponde_filtro(novo):
+            self.total_lancamentos += 1
+            chave = database.chave_lancamento(novo)
+            # Além da última página carregada a linha aparece ao rolar a tabela
+            if self.fim_da_listagem or chave <= self.ultima_chave:
+                i = bisect_left(self.chaves_carregadas, chave)
+                self.chaves_carregadas.insert(i, chave)
+                self.lancamentos_data[chave[3]] = novo
+                valores, tags = self.formatar_linha(novo)
+                self.tree.insert("", i, iid=str(chave[3]), values=valores, tags=tags)
+                self.tree.selection_set(str(chave[3]))
+
+        if self.com_saldo:
+            alteradas = [database.chave_lancamento(lanc) for lanc in (antigo, novo)
+                         if lanc is not None and self.corresponde_filtro(lanc)]
+            if alteradas:
+                self.recarregar_saldos(min(alteradas), novo)
+        self.atualizar_rotulo_total()
+
+    def recarregar_saldos(self, chave, novo=None):
+        """Recarrega as linhas a partir de `chave`, cujo saldo corrido mudou.
+
+        As linhas anteriores continuam certas; as seguintes são descartadas e
+        voltam do banco em páginas, a partir do saldo da linha anterior.
+        """
+        i = bisect_left(self.chaves_carregadas, chave)
+        if i == len(self.chaves_carregadas):
+            return  # além do que está carregado: chega certo ao rolar
+        descartadas = self.chaves_carregadas[i:]
+        del self.chaves_carregadas[i:]
+        for chave_descartada in descartadas:
+            del self.lancamentos_data[chave_descartada[3]]
+        self.tree.delete(*(str(c[3]) for c in descartadas))
+        self.ultima_chave = self.chaves_carregadas[-1] if self.chaves_carregadas else None
+        self.fim_da_listagem = False
+        if novo is not None:
+            self.selecionar_ao_carregar = int(novo['id'])
+        # Substitui no canal 'tabela' uma página que ainda esteja a caminho
+        self.carregando_pagina = False
+        self.carregar_proxima_pagina()
 
     def salvar_lancamento(self):
         if not self.desc_entry.get():
             messagebox.showerror("Erro", "O campo Descrição é obrigatório.")
             return
 
+        if self.gravacao_em_andamento():
+            return
+
         data_str = self.data_lancamento_entry.get()
         try:
             dt_obj = datetime.strptime(data_str, '%d/%m/%Y')
@@ -340,33 +1003,82 @@ class AppPrincipal:
             messagebox.showerror("Erro", "Formato de data inválido. Use DD/MM/AAAA.")
             return
 
+        try:
+            valor_previsto = ler_valor(self.v_prev_entry.get())
+            valor_pago = ler_valor(self.v_pago_entry.get())
+        except ValueError:
+            messagebox.showerror("Erro", "Valor inválido.")
+            return
+
         dados = {
             'dia': dia, 'mes': mes, 'ano': ano,
             'descricao': self.desc_entry.get(),
             'categoria_id': self.categorias_map.get(self.cat_combo.get()),
             'banco_id': self.bancos_map.get(self.banco_combo.get()),
             'cartao_id': self.cartoes_map.get(self.cartao_combo.get()),
-            'valor_previsto': float(self.v_prev_entry.get().strip().replace(',', '.')) if self.v_prev_entry.get().strip() else None,
-            'valor_pago': float(self.v_pago_entry.get().strip().replace(',', '.')) if self.v_pago_entry.get().strip() else None
+            'valor_previsto': valor_previsto,
+            'valor_pago': valor_pago
         }
 
+        repeticao = REPETICOES[self.repetir_combo.get()]
+        if repeticao and not self.id_selecionado:
+            self.salvar_recorrencia(dados, *repeticao)
+            return
+
         if self.id_selecionado:
-            database.atualizar_lancamento(self.id_selecionado, dados)
+            antigo = self.lancamentos_data.get(self.id_selecionado)
+            gravar = (database.atualizar_lancamento, self.id_selecionado, dados)
         else:
-            database.adicionar_lancamento(dados)
+            antigo = None
+            gravar = (database.adicionar_lancamento, dados)
 
-        self.limpar_campos()
-        self.atualizar_tabela()
+        def concluido(novo):
+            self.gravacao_concluida()
+            self.limpar_campos()
+            self.aplicar_alteracao(antigo, novo)
+
+        self.btn_salvar.config(state='disabled', text="Salvando...")
+        self.executor.executar(*gravar, origem='gravacao', ao_concluir=concluido, ao_falhar=self.falha_ao_gravar)
+
+    def salvar_recorrencia(self, dados, frequencia, parcelado):
+        try:
+            vezes = int(self.vezes_spin.get() or 0)
+        except ValueError:
+            vezes = -1
+        if vezes < 0 or (parcelado and vezes < 2):
+            messagebox.showerror("Erro", "Informe em quantas vezes (parcelas ou meses). 0 repete sem fim.")
+            return
+
+        def concluido(_):
+            self.gravacao_concluida()
+            self.limpar_campos()
+            # Vários lançamentos de uma vez: recarrega a tabela em vez de inserir linha a linha
+            self.atualizar_tabela()
+
+        self.btn_salvar.config(state='disabled', text="Salvando...")
+        self.executor.executar(database.criar_recorrencia, dados, frequencia, vezes or None, parcelado,
+                               origem='gravacao', ao_concluir=concluido, ao_falhar=self.falha_ao_gravar)
+
+    def gravacao_em_andamento(self):
+        """Indica se ainda há uma gravação em andamento (evita enviar duas vezes)."""
+        return str(self.btn_salvar['state']) == 'disabled'
+
+    def gravacao_concluida(self):
+        self.btn_salvar.config(state='normal', text="Salvar Lançamento")
+
+    def falha_ao_gravar(self, erro):
+        self.gravacao_concluida()
+        messagebox.showerror("Erro", f"Não foi possível gravar o lançamento: {erro}")
 
     def carregar_para_edicao(self, event):
         item_selecionado = self.tree.focus()
         if not item_selecionado:
             return
 
-        id_selecionado_str = self.tree.item(item_selecionado, 'values')[0]
-        self.id_selecionado = int(id_selecionado_str)
+        # O iid do item é o id do lançamento
+        self.id_selecionado = int(item_selecionado)
 
-        dados_originais = next((lanc for lanc in self.lancamentos_data if lanc[0] == self.id_selecionado), None)
+        dados_originais = self.lancamentos_data.get(self.id_selecionado)
 
         if not dados_originais:
             messagebox.showerror("Erro", "Não foi possível encontrar os dados originais para edição.")
@@ -383,19 +1095,8 @@ class AppPrincipal:
         self.banco_combo.set(dados_originais[6] or "")
         self.cartao_combo.set(dados_originais[7] or "")
         
-        valor_previsto_raw = dados_originais[8]
-        self.v_prev_entry.delete(0, 'end')
-        if valor_previsto_raw is not None:
-            self.v_prev_entry.insert(0, f"{float(valor_previsto_raw):.2f}".replace('.', ','))
-        else:
-            self.v_prev_entry.insert(0, "")
-
-        valor_pago_raw = dados_originais[9]
-        self.v_pago_entry.delete(0, 'end')
-        if valor_pago_raw is not None:
-            self.v_pago_entry.insert(0, f"{float(valor_pago_raw):.2f}".replace('.', ','))
-        else:
-            self.v_pago_entry.insert(0, "")
+        self.v_prev_entry.delete(0, 'end'); self.v_prev_entry.insert(0, formatar_valor(dados_originais[8]))
+        self.v_pago_entry.delete(0, 'end'); self.v_pago_entry.insert(0, formatar_valor(dados_originais[9]))
 
     def excluir_lancamento_selecionado(self):
         item_selecionado = self.tree.focus()
@@ -404,10 +1105,14 @@ class AppPrincipal:
             return
 
         if messagebox.askyesno("Confirmar", "Tem certeza que deseja excluir o lançamento selecionado?"):
-            id_lancamento = self.tree.item(item_selecionado, 'values')[0]
-            database.excluir_lancamento(id_lancamento)
-            self.atualizar_tabela()
-            self.limpar_campos()
+            id_lancamento = int(item_selecionado)
+            antigo = self.lancamentos_data.get(id_lancamento)
+
+            def concluido(_):
+                self.aplicar_alteracao(antigo, None)
+                self.limpar_campos()
+
+            self.executor.executar(database.excluir_lancamento, id_lancamento, origem='gravacao', ao_concluir=concluido)
 
     def limpar_campos(self):
         self.id_selecionado = None
@@ -418,6 +1123,8 @@ class AppPrincipal:
         self.cartao_combo.set('')
         self.v_prev_entry.delete(0, 'end')
         self.v_pago_entry.delete(0, 'end')
+        self.repetir_combo.set("Não")
+        self.vezes_spin.set(0)
         self.desc_entry.focus()
 
     def validar_valor(self, P):
@@ -433,24 +1140,53 @@ class AppPrincipal:
         check_val = P.replace(',', '', 1).lstrip('-')
         return check_val.isdigit()
 
-    def formatar_moeda(self, valor):
-        """Formata um número como moeda local."""
-        if valor is None:
-            return ""
-        try:
-            return locale.currency(valor, grouping=True, symbol=True)
-        except (TypeError, ValueError):
-            return str(valor)
-
     # --- Métodos para abrir janelas de cadastro ---
     def abrir_cadastro_categoria(self):
-        CadastroItemWindow(self.root, database.T_CATEGORIAS, self.carregar_comboboxes)
+        CadastroItemWindow(self.root, self.executor, database.T_CATEGORIAS, self.carregar_comboboxes)
 
     def abrir_cadastro_banco(self):
-        CadastroItemWindow(self.root, database.T_BANCOS, self.carregar_comboboxes)
+        CadastroItemWindow(self.root, self.executor, database.T_BANCOS, self.carregar_comboboxes)
 
     def abrir_cadastro_cartao(self):
-        CadastroItemWindow(self.root, database.T_CARTOES, self.carregar_comboboxes)
+        CadastroItemWindow(self.root, self.executor, database.T_CARTOES, self.carregar_comboboxes)
 
     def abrir_janela_analise(self):
-        AnaliseFinanceiraWindow(self.root)
+        AnaliseFinanceiraWindow(self.root, self.executor)
+
+    def abrir_saldos_iniciais(self):
+        SaldosIniciaisWindow(self.root, self.executor, self.atualizar_tabela)
+
+    def abrir_faturas(self):
+        FaturasWindow(self.root, self.executor)
+
+    def importar_arquivo(self):
+        caminho = filedialog.askopenfilename(
+            title="Importar lançamentos",
+            filetypes=[("Extratos", "*.csv *.ofx"), ("CSV", "*.csv"), ("OFX", "*.ofx")])
+        if not caminho:
+            return
+
+        def progresso(lidos, inseridos, erros):
+            # Chamado na thread de trabalho: o rótulo é atualizado na thread do Tk
+            self.executor.agendar(self.lbl_total.config,
+                                  text=f"Importando... {lidos} lidos, {inseridos} importados, {erros} com erro")
+
+        def falhou(erro):
+            messagebox.showerror("Erro", f"Não foi possível importar o arquivo: {erro}")
+            self.atualizar_rotulo_total()
+
+        self.executor.executar(importacao.importar_arquivo, caminho, ao_progredir=progresso, origem='importacao',
+                               ao_concluir=self.importacao_concluida, ao_falhar=falhou)
+
+    def importacao_concluida(self, resultado):
+        mensagem = f"{resultado['inseridos']} de {resultado['lidos']} lançamentos importados."
+        if resultado['erros']:
+            detalhes = "\n".join(f"Linha {linha}: {msg}" for linha, msg in resultado['erros'][:10])
+            mais = len(resultado['erros']) - 10
+            if mais > 0:
+                detalhes += f"\n... e mais {mais}"
+            messagebox.showwarning("Importação concluída com erros", f"{mensagem}\n\n{detalhes}")
+        else:
+            messagebox.showinfo("Importação concluída", mensagem)
+        self.carregar_comboboxes()
+        self.atualizar_tabela()
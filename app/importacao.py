@@ -0,0 +1,160 @@
+"""Importação de lançamentos a partir de arquivos CSV e OFX.
+
+Os leitores são geradores: o arquivo é percorrido uma vez e os registros vão
+direto para `database.importar_lancamentos`, que grava em lotes numa única
+transação. Linhas inválidas são relatadas sem interromper a importação.
+
+Uso:
+
+  python -m app.importacao extrato.csv
+  python -m app.importacao extrato.ofx --banco "Banco do Brasil" --categoria-padrao Importados
+
+CSV: cabeçalho com as colunas data, descricao, valor_previsto, valor_pago,
+categoria, banco e cartao (só data e descricao são obrigatórias; separador
+',' ou ';'). Datas em DD/MM/AAAA ou AAAA-MM-DD; valores em "1.234,56" ou
+"1234.56".
+"""
+import argparse
+import csv
+import os
+import re
+import sys
+from datetime import datetime
+
+from . import database
+from .formatacao import ler_valor
+
+
+def converter_data(texto):
+    texto = texto.strip()
+    for formato in ('%d/%m/%Y', '%Y-%m-%d', '%Y%m%d'):
+        try:
+            return datetime.strptime(texto, formato).date()
+        except ValueError:
+            pass
+    raise ValueError(f"data inválida: '{texto}'")
+
+
+def _abrir_texto(caminho):
+    # Extratos de bancos brasileiros costumam vir em Latin-1; confere o arquivo
+    # inteiro (em blocos) antes de decidir, para não falhar no meio da importação
+    try:
+        with open(caminho, encoding='utf-8-sig') as f:
+            while f.read(1 << 20):
+                pass
+        encoding = 'utf-8-sig'
+    except UnicodeDecodeError:
+        encoding = 'cp1252'
+    return open(caminho, encoding=encoding, newline='')
+
+
+def ler_csv(caminho, padroes=None):
+    """Gera registros para `database.importar_lancamentos` a partir de um CSV."""
+    padroes = padroes or {}
+    with _abrir_texto(caminho) as f:
+        amostra = f.read(4096)
+        f.seek(0)
+        try:
+            dialeto = csv.Sniffer().sniff(amostra, delimiters=',;')
+        except csv.Error:
+            dialeto = csv.excel
+        leitor = csv.DictReader(f, dialect=dialeto)
+        leitor.fieldnames = [(nome or '').strip().lower() for nome in leitor.fieldnames or []]
+        if 'data' not in leitor.fieldnames or 'descricao' not in leitor.fieldnames:
+            raise ValueError("O CSV precisa ter ao menos as colunas 'data' e 'descricao'.")
+
+        for numero, linha in enumerate(leitor, start=2):
+            try:
+                descricao = (linha.get('descricao') or '').strip()
+                if not descricao:
+                    raise ValueError("descrição vazia")
+                yield {
+                    'linha': numero,
+                    'data': converter_data(linha.get('data') or ''),
+                    'descricao': descricao,
+                    'valor_previsto': ler_valor(linha.get('valor_previsto')),
+                    'valor_pago': ler_valor(linha.get('valor_pago')),
+                    'categoria': (linha.get('categoria') or '').strip() or padroes.get('categoria'),
+                    'banco': (linha.get('banco') or '').strip() or padroes.get('banco'),
+                    'cartao': (linha.get('cartao') or '').strip() or padroes.get('cartao'),
+                }
+            except ValueError as e:
+                yield {'linha': numero, 'erro': str(e)}
+
+
+_RE_TRANSACAO = re.compile(r'<STMTTRN>(.*?)(?:</STMTTRN>|(?=<STMTTRN>)|(?=</BANKTRANLIST>))', re.S | re.I)
+
+
+def _campo_ofx(bloco, tag):
+    # OFX 1.x (SGML) não fecha as tags; OFX 2.x (XML) fecha
+    achado = re.search(rf'<{tag}>([^<\r\n]*)', bloco, re.I)
+    return achado.group(1).strip() if achado else ''
+
+
+def ler_ofx(caminho, padroes=None):
+    """Gera registros a partir das transações (<STMTTRN>) de um extrato OFX.
+
+    O valor da transação (TRNAMT) vai para `valor_pago`; a descrição vem de
+    MEMO ou, na falta dele, de NAME.
+    """
+    padroes = padroes or {}
+    with _abrir_texto(caminho) as f:
+        conteudo = f.read()
+    for numero, achado in enumerate(_RE_TRANSACAO.finditer(conteudo), start=1):
+        bloco = achado.group(1)
+        try:
+            data_txt = _campo_ofx(bloco, 'DTPOSTED')[:8]
+            descricao = _campo_ofx(bloco, 'MEMO') or _campo_ofx(bloco, 'NAME')
+            if not descricao:
+                raise ValueError("transação sem MEMO/NAME")
+            yield {
+                'linha': numero,
+                'data': converter_data(data_txt),
+                'descricao': descricao,
+                'valor_previsto': None,
+                'valor_pago': ler_valor(_campo_ofx(bloco, 'TRNAMT')),
+                'categoria': padroes.get('categoria'),
+                'banco': padroes.get('banco'),
+                'cartao': padroes.get('cartao'),
+            }
+        except ValueError as e:
+            yield {'linha': numero, 'erro': str(e)}
+
+
+LEITORES = {'csv': ler_csv, 'ofx': ler_ofx}
+
+
+def importar_arquivo(caminho, formato=None, padroes=None, tamanho_lote=1000, ao_progredir=None):
+    """Importa um arquivo CSV/OFX. O formato é deduzido da extensão se omitido."""
+    formato = (formato or os.path.splitext(caminho)[1].lstrip('.')).lower()
+    if formato not in LEITORES:
+        raise ValueError(f"Formato não suportado: '{formato}'. Use csv ou ofx.")
+    return database.importar_lancamentos(LEITORES[formato](caminho, padroes), tamanho_lote=tamanho_lote,
+                                         ao_progredir=ao_progredir)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m app.importacao',
+                                     description="Importa lançamentos de um arquivo CSV ou OFX.")
+    parser.add_argument('arquivo')
+    parser.add_argument('--formato', choices=sorted(LEITORES), help="padrão: extensão do arquivo")
+    parser.add_argument('--categoria-padrao', help="categoria para linhas sem categoria")
+    parser.add_argument('--banco', help="banco para linhas sem banco")
+    parser.add_argument('--cartao', help="cartão para linhas sem cartão")
+    parser.add_argument('--lote', type=int, default=1000, help="lançamentos por lote (padrão: 1000)")
+    args = parser.parse_args(argv)
+
+    padroes = {'categoria': args.categoria_padrao, 'banco': args.banco, 'cartao': args.cartao}
+
+    def progresso(lidos, inseridos, erros):
+        print(f"\r{lidos} lidos, {inseridos} importados, {erros} com erro", end='', flush=True)
+
+    resultado = importar_arquivo(args.arquivo, args.formato, padroes, args.lote, progresso)
+    print()
+    for linha, mensagem in resultado['erros']:
+        print(f"  linha {linha}: {mensagem}")
+    return 1 if resultado['erros'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,128 @@
+"""Medição das consultas feitas pelo `database`: tempos, contadores e consultas lentas.
+
+Desligada por padrão. Quando ligada (`[database] instrumentacao = 1` no
+config.ini, `DB_INSTRUMENTACAO=1` ou `database.instrumentar(Coletor())`), cada
+comando executado pelos cursores de `database.conectar()` gera uma `Medicao`
+com a duração (do `execute` até o último fetch), as linhas lidas ou afetadas,
+a função pública do `database` que o executou e a origem da chamada.
+
+A origem é o nome dado com `with origem('analise'):` (a interface marca assim
+cada tela, via `ExecutorTk.executar(..., origem=...)`) ou, sem isso, a primeira
+função fora do `database` na pilha. Os contadores são agregados por
+(origem, função), o que mostra qual tela gera carga no banco compartilhado.
+
+Comandos acima de `limite_lento_ms` vão para o log de consultas lentas (os
+últimos ficam em memória e cada um é registrado no logger `app.database.lentas`)
+e, com `explicar=True`, são acompanhados do plano (`EXPLAIN` no PostgreSQL,
+`EXPLAIN QUERY PLAN` no SQLite).
+"""
+import contextvars
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger('app.database.lentas')
+
+_origem = contextvars.ContextVar('origem_consulta', default=None)
+
+
+@contextmanager
+def origem(nome):
+    """Marca as consultas feitas dentro do bloco como vindas de `nome` (ex.: uma tela)."""
+    token = _origem.set(nome)
+    try:
+        yield
+    finally:
+        _origem.reset(token)
+
+
+def origem_atual():
+    return _origem.get()
+
+
+class Medicao:
+    """Um comando executado: SQL, duração (ms), linhas, função e origem."""
+    __slots__ = ('sql', 'duracao_ms', 'linhas', 'funcao', 'origem', 'erro', 'plano')
+
+    def __init__(self, sql, duracao_ms, linhas, funcao, origem, erro=None):
+        self.sql = sql
+        self.duracao_ms = duracao_ms
+        self.linhas = linhas
+        self.funcao = funcao
+        self.origem = origem
+        self.erro = erro
+        self.plano = None
+
+    def como_dict(self):
+        return {campo: getattr(self, campo) for campo in self.__slots__}
+
+    def __repr__(self):
+        return f"Medicao({self.funcao!r}, {self.duracao_ms:.3f} ms, {self.linhas} linhas)"
+
+
+class Coletor:
+    """Coletor padrão: contadores por (origem, função) e log das consultas lentas.
+
+    Qualquer objeto com `registrar(medicao)` e `deve_explicar(medicao)` serve
+    como coletor em `database.instrumentar()`; este é thread-safe e mantém as
+    `tamanho_log` consultas lentas mais recentes.
+    """
+
+    def __init__(self, limite_lento_ms=200, explicar=False, tamanho_log=200):
+        self.limite_lento_ms = limite_lento_ms
+        self.explicar = explicar
+        self._lentas = deque(maxlen=tamanho_log)
+        self._contadores = {}
+        self._lock = threading.Lock()
+
+    def deve_explicar(self, medicao):
+        """Pedido pelo `database` antes de `registrar`, para anexar o plano à medição."""
+        return self.explicar and medicao.erro is None and medicao.duracao_ms >= self.limite_lento_ms
+
+    def registrar(self, medicao):
+        chave = (medicao.origem, medicao.funcao)
+        lenta = medicao.duracao_ms >= self.limite_lento_ms
+        with self._lock:
+            contador = self._contadores.get(chave)
+            if contador is None:
+                contador = self._contadores[chave] = {
+                    'origem': medicao.origem, 'funcao': medicao.funcao, 'comandos': 0,
+                    'tempo_ms': 0.0, 'max_ms': 0.0, 'linhas': 0, 'lentas': 0, 'erros': 0}
+            contador['comandos'] += 1
+            contador['tempo_ms'] += medicao.duracao_ms
+            contador['max_ms'] = max(contador['max_ms'], medicao.duracao_ms)
+            contador['linhas'] += medicao.linhas or 0
+            contador['lentas'] += lenta
+            contador['erros'] += medicao.erro is not None
+            if lenta:
+                self._lentas.append(medicao)
+        if lenta:
+            logger.warning("%.1f ms em %s (origem %s, %s linhas): %s%s", medicao.duracao_ms, medicao.funcao,
+                           medicao.origem, medicao.linhas, ' '.join(medicao.sql.split()),
+                           f"\n{medicao.plano}" if medicao.plano else "")
+
+    def contadores(self):
+        """Contadores por (origem, função), do maior tempo total para o menor."""
+        with self._lock:
+            itens = [dict(c) for c in self._contadores.values()]
+        return sorted(itens, key=lambda c: c['tempo_ms'], reverse=True)
+
+    def consultas_lentas(self):
+        """As consultas lentas mais recentes (`Medicao`), da mais antiga para a mais nova."""
+        with self._lock:
+            return list(self._lentas)
+
+    def zerar(self):
+        with self._lock:
+            self._contadores.clear()
+            self._lentas.clear()
+
+    def relatorio(self):
+        """Tabela de texto com os contadores, para logs e para a linha de comando."""
+        linhas = [f"{'origem':<28}{'função':<32}{'comandos':>9}{'total ms':>12}{'máx ms':>10}"
+                  f"{'linhas':>10}{'lentas':>8}"]
+        for c in self.contadores():
+            linhas.append(f"{str(c['origem'])[:27]:<28}{str(c['funcao'])[:31]:<32}{c['comandos']:>9}"
+                          f"{c['tempo_ms']:>12.1f}{c['max_ms']:>10.1f}{c['linhas']:>10}{c['lentas']:>8}")
+        return "\n".join(linhas)
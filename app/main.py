@@ -15,28 +15,6 @@ def run_app():
     APP_NAME = "Controle Financeiro"
     definir_nome_app(APP_NAME)
 
-    from .database import restaurar_backup, USE_POSTGRES
-    from tkinter import messagebox
-
-    if not USE_POSTGRES:
-        try:
-            result = restaurar_backup()
-            if result:
-                # A mensagem de sucesso pode ser um pouco intrusiva a cada inicialização.
-                # Vamos comentá-la por enquanto.
-                # messagebox.showinfo("Sucesso", "Seus dados foram restaurados com sucesso!")
-                pass
-        except Exception as e:
-            # Só fecha o app se for erro realmente inesperado (não "sem backup")
-            msg = str(e).lower()
-            if 'no such table' in msg or 'lancamentos_backup' in msg:
-                pass  # ignora erro de não existir backup
-            else:
-                messagebox.showerror("Erro na Restauração",
-                    f"Ocorreu um erro ao tentar restaurar seus dados.\n\n"
-                    f"Erro: {str(e)}")
-                sys.exit(1)
-
     root = tk.Tk()
     app = AppPrincipal(root)
     root.mainloop()
@@ -0,0 +1,130 @@
+"""Comandos de manutenção do banco de dados, sem interface gráfica.
+
+Uso:
+
+  python -m app.manutencao reconstruir-agregados
+  python -m app.manutencao verificar-agregados
+  python -m app.manutencao versao-schema
+  python -m app.manutencao backup [--destino PASTA] [--manter N] [--paginas N] [--pausa-ms MS]
+  python -m app.manutencao verificar-backup ARQUIVO
+  python -m app.manutencao listar-backups [--destino PASTA]
+  python -m app.manutencao expandir-recorrencias [--ate AAAA-MM-DD]
+"""
+import argparse
+import os
+import sys
+from datetime import date
+
+from . import database
+
+
+def cmd_reconstruir_agregados(args):
+    total = database.reconstruir_agregados()
+    print(f"Agregados mensais reconstruídos: {total} grupos.")
+    return 0
+
+
+def cmd_verificar_agregados(args):
+    divergencias = database.verificar_agregados()
+    if not divergencias:
+        print("Agregados mensais conferem com os lançamentos.")
+        return 0
+    for item in divergencias:
+        ano, mes, categoria_id, banco_id = item['chave']
+        print(f"{mes:02d}/{ano} categoria={categoria_id} banco={banco_id}: "
+              f"esperado={item['esperado']} atual={item['atual']}")
+    print(f"\n{len(divergencias)} grupo(s) divergente(s). "
+          "Rode 'python -m app.manutencao reconstruir-agregados' para corrigir.")
+    return 1
+
+
+def cmd_versao_schema(args):
+    versao = database.versao_schema()
+    if versao is None:
+        print("PostgreSQL: schema mantido por scripts/schema_postgres.sql.")
+    else:
+        print(f"Schema SQLite na versão {versao} (mais recente: {database.MIGRACOES_SQLITE[-1][0]}).")
+    return 0
+
+
+def cmd_backup(args):
+    def progresso(feito, total):
+        if sys.stderr.isatty():
+            print(f"\rCopiando... {feito}/{total}", end='', file=sys.stderr, flush=True)
+
+    try:
+        resultado = database.fazer_backup(args.destino, args.manter, args.paginas, args.pausa_ms,
+                                          ao_progredir=progresso)
+    except RuntimeError as e:
+        print(f"\n{e}", file=sys.stderr)
+        return 1
+    if sys.stderr.isatty():
+        print(file=sys.stderr)
+    print(f"Backup gravado e conferido: {resultado['arquivo']} "
+          f"({resultado['bytes'] / 1_048_576:.1f} MiB em {resultado['segundos']:.1f} s).")
+    for caminho in resultado['removidos']:
+        print(f"Removido pela rotação: {caminho}")
+    return 0
+
+
+def cmd_verificar_backup(args):
+    problemas = database.verificar_backup(args.arquivo)
+    if not problemas:
+        print(f"{args.arquivo}: íntegro.")
+        return 0
+    for problema in problemas:
+        print(problema)
+    return 1
+
+
+def cmd_listar_backups(args):
+    backups = database.listar_backups(args.destino)
+    if not backups:
+        print(f"Nenhum backup em {args.destino or database.BACKUP_DIR}.")
+    for caminho in backups:
+        print(f"{caminho}  ({os.path.getsize(caminho) / 1_048_576:.1f} MiB)")
+    return 0
+
+
+def cmd_expandir_recorrencias(args):
+    gerados = database.expandir_recorrencias(args.ate)
+    print(f"Recorrências expandidas: {gerados} lançamento(s) gerado(s).")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m app.manutencao',
+                                     description="Manutenção do banco de dados do Controle Financeiro.")
+    sub = parser.add_subparsers(dest='comando', required=True)
+    sub.add_parser('reconstruir-agregados', help="Recalcula a tabela de agregados mensais"
+                   ).set_defaults(func=cmd_reconstruir_agregados)
+    sub.add_parser('verificar-agregados', help="Confere os agregados mensais com os lançamentos"
+                   ).set_defaults(func=cmd_verificar_agregados)
+    sub.add_parser('versao-schema', help="Mostra a versão do schema aplicada"
+                   ).set_defaults(func=cmd_versao_schema)
+    backup = sub.add_parser('backup', help="Grava um backup do banco, confere e aplica a retenção")
+    backup.add_argument('--destino', help=f"pasta dos backups (padrão: {database.BACKUP_DIR})")
+    backup.add_argument('--manter', type=int, help="backups mantidos; 0 mantém todos "
+                        f"(padrão: {database.BACKUP_MANTER})")
+    backup.add_argument('--paginas', type=int, help="SQLite: páginas copiadas por passo "
+                        f"(padrão: {database.BACKUP_PAGINAS})")
+    backup.add_argument('--pausa-ms', type=int, help="SQLite: pausa entre os passos "
+                        f"(padrão: {database.BACKUP_PAUSA_MS})")
+    backup.set_defaults(func=cmd_backup)
+    verificar = sub.add_parser('verificar-backup', help="Confere a integridade de um arquivo de backup")
+    verificar.add_argument('arquivo')
+    verificar.set_defaults(func=cmd_verificar_backup)
+    listar = sub.add_parser('listar-backups', help="Lista os backups, do mais antigo ao mais recente")
+    listar.add_argument('--destino', help=f"pasta dos backups (padrão: {database.BACKUP_DIR})")
+    listar.set_defaults(func=cmd_listar_backups)
+    expandir = sub.add_parser('expandir-recorrencias',
+                              help="Gera os lançamentos das recorrências sem fim até uma data")
+    expandir.add_argument('--ate', type=date.fromisoformat,
+                          help=f"data final (padrão: {database.RECORRENCIA_MESES} meses à frente)")
+    expandir.set_defaults(func=cmd_expandir_recorrencias)
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
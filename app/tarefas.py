@@ -0,0 +1,136 @@
+"""Execução de chamadas ao banco fora da thread do Tk.
+
+O Tkinter só pode ser usado pela thread do mainloop, e uma consulta lenta
+feita nela congela a janela inteira. `ExecutorTk` roda as funções numa thread
+de trabalho e entrega o resultado de volta na thread do Tk, por um laço de
+`root.after` que só fica ativo enquanto há tarefas pendentes.
+
+Tarefas enviadas com o mesmo `canal` se substituem: quando o usuário muda o
+filtro duas vezes seguidas, só o resultado da última consulta chega à tela (as
+anteriores são canceladas se ainda não começaram, ou descartadas ao terminar).
+
+Cada tarefa roda marcada com uma origem (`origem=`, o canal ou o nome da
+função), que identifica a tela nas medições de `app.instrumentacao`.
+"""
+import queue
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from tkinter import messagebox
+
+from .instrumentacao import origem as origem_consultas
+
+# Intervalo (ms) entre verificações de resultados prontos
+INTERVALO_ENTREGA = 15
+
+
+class ExecutorTk:
+    """Executa funções numa thread de trabalho e entrega o resultado via `root.after`.
+
+    Com `trabalhadores=1` (o padrão) as tarefas rodam na ordem em que foram
+    enviadas, então uma gravação seguida de uma consulta enxerga a gravação.
+    `ao_mudar_estado(ocupado)` é chamado na thread do Tk quando passa a haver
+    tarefas pendentes e quando todas terminam, para exibir o estado de carga.
+    """
+
+    def __init__(self, root, trabalhadores=1, ao_mudar_estado=None):
+        self.root = root
+        self.ao_mudar_estado = ao_mudar_estado
+        self._pool = ThreadPoolExecutor(max_workers=trabalhadores, thread_name_prefix='banco')
+        self._prontos = queue.Queue()
+        self._geracoes = {}      # canal -> número da tarefa mais recente
+        self._futuros = {}       # canal -> future da tarefa mais recente
+        self._pendentes = 0
+        self._verificando = False
+        self._encerrado = False
+
+    def executar(self, funcao, *args, ao_concluir=None, ao_falhar=None, canal=None, origem=None, **kwargs):
+        """Agenda `funcao(*args, **kwargs)` na thread de trabalho.
+
+        `ao_concluir(resultado)` ou `ao_falhar(erro)` rodam depois na thread do
+        Tk. Sem `ao_falhar`, o erro é exibido numa caixa de mensagem. `origem`
+        rotula as consultas da tarefa na instrumentação (padrão: o canal).
+        """
+        if self._encerrado:
+            return
+        geracao = None
+        if canal is not None:
+            geracao = self._geracoes.get(canal, 0) + 1
+            self._geracoes[canal] = geracao
+
+        origem = origem or canal or getattr(funcao, '__qualname__', None)
+
+        def tarefa():
+            try:
+                with origem_consultas(origem):
+                    resultado = funcao(*args, **kwargs)
+            except Exception as e:
+                self._prontos.put((canal, geracao, ao_falhar or _mostrar_erro, e, True))
+            else:
+                self._prontos.put((canal, geracao, ao_concluir, resultado, True))
+
+        futuro = self._pool.submit(tarefa)
+        self._pendentes += 1
+        if self._pendentes == 1 and self.ao_mudar_estado:
+            self.ao_mudar_estado(True)
+        if canal is not None:
+            # A tarefa anterior do canal nem precisa rodar se ainda não começou
+            anterior = self._futuros.get(canal)
+            if anterior is not None and anterior.cancel():
+                self._tarefa_encerrada()
+            self._futuros[canal] = futuro
+        self._agendar_verificacao()
+        return futuro
+
+    def agendar(self, funcao, *args, **kwargs):
+        """Pede que `funcao` rode na thread do Tk (pode ser chamado de qualquer thread).
+
+        Útil para relatar progresso a partir de uma tarefa em andamento.
+        """
+        self._prontos.put((None, None, lambda _: funcao(*args, **kwargs), None, False))
+
+    def encerrar(self):
+        """Cancela as consultas (tarefas com `canal`) que ainda não começaram; não espera a atual terminar.
+
+        As tarefas sem canal (gravações) continuam na fila e rodam antes de o
+        processo sair: o interpretador espera a thread de trabalho terminar.
+        """
+        self._encerrado = True
+        for futuro in self._futuros.values():
+            futuro.cancel()
+        self._futuros.clear()
+        self._pool.shutdown(wait=False)
+
+    def _agendar_verificacao(self):
+        if not self._verificando:
+            self._verificando = True
+            self.root.after(INTERVALO_ENTREGA, self._entregar)
+
+    def _entregar(self):
+        self._verificando = False
+        if self._encerrado:
+            return
+        while True:
+            try:
+                canal, geracao, callback, valor, fim_de_tarefa = self._prontos.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                # Resultados de tarefas já substituídas no mesmo canal são descartados
+                if callback is not None and (canal is None or self._geracoes.get(canal) == geracao):
+                    callback(valor)
+            except Exception:
+                self.root.report_callback_exception(*sys.exc_info())
+            finally:
+                if fim_de_tarefa:
+                    self._tarefa_encerrada()
+        if self._pendentes:
+            self._agendar_verificacao()
+
+    def _tarefa_encerrada(self):
+        self._pendentes -= 1
+        if self._pendentes == 0 and self.ao_mudar_estado:
+            self.ao_mudar_estado(False)
+
+
+def _mostrar_erro(erro):
+    messagebox.showerror("Erro", f"Erro ao acessar o banco de dados: {erro}")
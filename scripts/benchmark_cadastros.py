@@ -0,0 +1,86 @@
+"""Compara JOIN nos cadastros com a resolução dos nomes pelo cache (`NOMES_NO_CLIENTE`).
+
+Gera um livro-caixa sintético num SQLite temporário e mede, com
+`database.NOMES_NO_CLIENTE` desligado (LEFT JOIN em categorias/bancos/cartões)
+e ligado (ids na consulta, nomes vindos do cache em memória):
+
+  - listagem de um ano inteiro (`listar_lancamentos_filtrados`);
+  - leitura completa (`iterar_lancamentos`);
+  - 50 páginas da listagem paginada;
+  - 1000 leituras de um lançamento (`obter_lancamento`, usado após cada gravação).
+
+Rode:
+
+  python scripts/benchmark_cadastros.py [--linhas 300000]
+  DATABASE_URL=postgresql://... python scripts/benchmark_cadastros.py --banco-configurado
+
+Com `--banco-configurado` usa o banco da aplicação (que já deve ter dados) em
+vez de gerar um SQLite temporário; é o jeito de medir no PostgreSQL.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def medir(funcao, repeticoes=1):
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        funcao()
+    return (time.perf_counter() - inicio) / repeticoes * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--linhas', type=int, default=300_000)
+    parser.add_argument('--banco-configurado', action='store_true')
+    args = parser.parse_args()
+
+    if not args.banco_configurado:
+        os.environ['SQLITE_FILE'] = os.path.join(tempfile.mkdtemp(prefix='bench_cadastros_'), 'bench.db')
+        os.environ['DATABASE_URL'] = 'sqlite:///' + os.environ['SQLITE_FILE']
+    sys.path.insert(0, ROOT_DIR)
+    from app import database
+
+    if not args.banco_configurado:
+        from benchmark_resumo_mensal import gerar_livro
+        print(f"Gerando {args.linhas} lançamentos ...")
+        gerar_livro(database, args.linhas)
+
+    primeiro = database.listar_lancamentos_pagina(limite=1)
+    if not primeiro:
+        sys.exit("O banco não tem lançamentos.")
+    ano, id_lancamento = int(primeiro[0]['ano']), int(primeiro[0]['id'])
+
+    def paginas():
+        apos = None
+        for _ in range(50):
+            pagina = database.listar_lancamentos_pagina(apos=apos, limite=200)
+            if not pagina:
+                break
+            apos = database.chave_lancamento(pagina[-1])
+
+    medidas = {
+        f'listagem do ano {ano}': (lambda: database.listar_lancamentos_filtrados(ano=ano), 3),
+        'leitura completa': (lambda: sum(1 for _ in database.iterar_lancamentos()), 1),
+        '50 páginas': (paginas, 5),
+        '1000 obter_lancamento': (lambda: [database.obter_lancamento(id_lancamento) for _ in range(1000)], 1),
+    }
+
+    database.nomes_cadastro(database.T_CATEGORIAS)  # cache já quente, como na aplicação
+    print(f"{'medida (ms)':<26}{'JOIN':>12}{'cache':>12}")
+    for nome, (funcao, repeticoes) in medidas.items():
+        tempos = []
+        for no_cliente in (False, True):
+            database.NOMES_NO_CLIENTE = no_cliente
+            funcao()  # aquecimento
+            tempos.append(medir(funcao, repeticoes))
+        print(f"{nome:<26}{tempos[0]:>12.1f}{tempos[1]:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
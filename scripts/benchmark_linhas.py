@@ -0,0 +1,123 @@
+"""Mede memória e tempo do adaptador de linhas (`database.Linha`).
+
+Compara, para o mesmo resultado em memória (tuplas como as devolvidas pelo
+driver), o caminho antigo do PostgreSQL -- um dict por linha (RealDictCursor)
+convertido em `RowProxy` por `_wrap_rows` -- com `Linha`, que reaproveita a
+tupla e compartilha o mapa de colunas. `sqlite3.Row` entra como referência.
+
+Rode:
+
+  python scripts/benchmark_linhas.py [--linhas 1000000]
+
+Não precisa de PostgreSQL: os valores são gerados localmente.
+"""
+import argparse
+import gc
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+COLUNAS = ('id', 'dia', 'mes', 'ano', 'descricao', 'valor_previsto', 'valor_pago',
+           'categoria', 'banco', 'cartao', 'data_lancamento')
+
+
+class RowProxy:
+    """Cópia do adaptador antigo, mantida aqui só para comparação."""
+    def __init__(self, columns, values):
+        self._cols = list(columns)
+        self._vals = list(values)
+        self._map = {c: self._vals[i] for i, c in enumerate(self._cols)}
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            return self._vals[key]
+        return self._map[key]
+
+
+def gerar_tuplas(linhas):
+    categorias = [f"Categoria {i}" for i in range(20)]
+    bancos = [f"Banco {i}" for i in range(5)]
+    return [(i, i % 28 + 1, i % 12 + 1, 2020, f"Lançamento {i}", None, -i % 500 * 100,
+             categorias[i % 20], bancos[i % 5], None, date(2020, i % 12 + 1, i % 28 + 1))
+            for i in range(linhas)]
+
+
+def caminho_antigo(tuplas):
+    dicts = [dict(zip(COLUNAS, t)) for t in tuplas]        # RealDictCursor
+    cols = list(COLUNAS)
+    return [RowProxy(cols, [r.get(c) for c in cols]) for r in dicts]   # _wrap_rows
+
+
+def caminho_linha(database, tuplas):
+    return list(map(database._classe_linha(COLUNAS), tuplas))
+
+
+def preparar_sqlite(tuplas):
+    conn = sqlite3.connect(':memory:')
+    conn.row_factory = sqlite3.Row
+    conn.execute(f"CREATE TABLE t ({', '.join(COLUNAS)})")
+    conn.executemany(f"INSERT INTO t VALUES ({', '.join('?' * len(COLUNAS))})",
+                     (t[:10] + (t[10].isoformat(),) for t in tuplas))
+    return conn
+
+
+def caminho_sqlite_row(conn):
+    return conn.execute("SELECT * FROM t").fetchall()
+
+
+def medir(nome, construir, linhas):
+    # Tempo e memória em rodadas separadas: o tracemalloc distorce o tempo
+    gc.collect()
+    inicio = time.perf_counter()
+    resultado = construir()
+    t_construir = time.perf_counter() - inicio
+    del resultado
+    gc.collect()
+    tracemalloc.start()
+    resultado = construir()
+    memoria = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    inicio = time.perf_counter()
+    total = 0
+    for linha in resultado:
+        total += linha['mes'] + linha['id']
+    t_acesso = time.perf_counter() - inicio
+    print(f"{nome:<22} {t_construir * 1000:9.0f} ms {t_acesso * 1000:9.0f} ms "
+          f"{memoria / 2**20:9.1f} MiB {memoria / linhas:8.0f} B/linha")
+    del resultado
+    return memoria
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--linhas', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    # Importar o módulo aplica as migrações; aponta para um SQLite descartável
+    os.environ['SQLITE_FILE'] = os.path.join(tempfile.mkdtemp(prefix='bench_linhas_'), 'bench.db')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.environ['SQLITE_FILE']
+    sys.path.insert(0, ROOT_DIR)
+    from app import database
+
+    print(f"Gerando {args.linhas} tuplas ...")
+    tuplas = gerar_tuplas(args.linhas)
+    print(f"{'caminho':<22} {'construção':>12} {'acesso':>12} {'memória extra':>13} {'':>10}")
+    antigo = medir("dict + RowProxy", lambda: caminho_antigo(tuplas), args.linhas)
+    novo = medir("Linha", lambda: caminho_linha(database, tuplas), args.linhas)
+    conn = preparar_sqlite(tuplas)
+    del tuplas
+    medir("sqlite3.Row (ref.)", lambda: caminho_sqlite_row(conn), args.linhas)
+    print("\n('memória extra' não conta as tuplas do driver, já alocadas; no sqlite3.Row\n"
+          " inclui os valores lidos do banco)")
+    print(f"Linha usa {antigo / novo:.1f}x menos memória que o caminho antigo.")
+
+
+if __name__ == '__main__':
+    main()
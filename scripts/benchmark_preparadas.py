@@ -0,0 +1,114 @@
+"""Compara consultas enviadas como texto com instruções preparadas no PostgreSQL.
+
+Mede a latência de cada chamada (mediana) das consultas de listagem e de
+relatório com `database.PREPARAR_APOS = 0` (o servidor analisa e planeja o
+texto a cada execução) e ligado (PREPARE uma vez por conexão, depois só
+EXECUTE), e mostra a taxa de acerto do registro de instruções
+(`database.estatisticas_instrucoes()`).
+
+Rode:
+
+  python scripts/benchmark_preparadas.py [--linhas 100000]      # sobe um PostgreSQL local
+  python scripts/benchmark_preparadas.py --postgres-url postgresql://u@127.0.0.1/banco_descartavel
+
+Sem --postgres-url é criado um cluster temporário com initdb/pg_ctl, ouvindo
+em 127.0.0.1 (como em `python -m app.bench --backend postgres`). A URL deve
+apontar para um banco vazio e descartável: o schema é criado e os dados são
+gerados nele.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT_DIR)
+
+
+def medir(funcao, repeticoes, aquecimento):
+    for _ in range(aquecimento):
+        funcao()
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(tempos)
+
+
+def comparar(url, args):
+    os.environ['DATABASE_URL'] = url
+    from app import bench, database
+    if not database.USE_POSTGRES:
+        sys.exit("psycopg2 não está instalado: o benchmark precisa do PostgreSQL.")
+
+    bench.aplicar_schema_postgres(url)
+    print(f"Gerando {args.linhas} lançamentos ...")
+    bench.gerar_livro(database, args.linhas)
+
+    ano, mes = bench.ANOS[len(bench.ANOS) // 2], 6
+    primeiro = database.listar_lancamentos_pagina(mes=mes, ano=ano, limite=1)[0]
+    id_lancamento = int(primeiro['id'])
+    chave_meio = database.chave_lancamento(
+        database.listar_lancamentos_pagina(mes=mes, ano=ano, limite=100)[-1])
+    filtro = database.FiltroLancamentos(ano=ano, bancos=[1, 2], pago=True)
+
+    medidas = {
+        'listar_lancamentos_pagina (mês)': lambda: database.listar_lancamentos_pagina(
+            mes=mes, ano=ano, limite=200),
+        'listar_lancamentos_pagina (meio)': lambda: database.listar_lancamentos_pagina(
+            mes=mes, ano=ano, apos=chave_meio, limite=200),
+        'listar_lancamentos_pagina (filtro)': lambda: database.listar_lancamentos_pagina(
+            filtro=filtro, limite=200),
+        'listar (mês, com saldo)': lambda: database.listar_lancamentos_pagina(
+            mes=mes, ano=ano, limite=200, com_saldo=True),
+        'contar_lancamentos': lambda: database.contar_lancamentos(mes=mes, ano=ano),
+        'obter_lancamento': lambda: database.obter_lancamento(id_lancamento),
+        'obter_resumo_mensal': lambda: database.obter_resumo_mensal(mes, ano),
+        'obter_entradas_saidas_saldo': lambda: database.obter_entradas_saidas_saldo(mes, ano),
+        'obter_soma_por_categoria': lambda: database.obter_soma_por_categoria(mes, ano),
+        'obter_saldo_anterior': lambda: database.obter_saldo_anterior(mes, ano),
+    }
+
+    limiar = database.PREPARAR_APOS or 5
+    print(f"\n{'mediana por chamada (ms)':<38}{'texto':>10}{'preparada':>12}{'economia':>10}")
+    for nome, funcao in medidas.items():
+        tempos = []
+        for preparar_apos in (0, limiar):
+            database.PREPARAR_APOS = preparar_apos
+            # O aquecimento passa do limiar: a medição já pega a instrução preparada
+            tempos.append(medir(funcao, args.repeticoes, aquecimento=limiar + 1))
+        economia = 1 - tempos[1] / tempos[0] if tempos[0] else 0.0
+        print(f"{nome:<38}{tempos[0]:>10.3f}{tempos[1]:>12.3f}{economia:>9.0%}")
+
+    database.estatisticas_instrucoes(zerar=True)
+    for funcao in medidas.values():
+        for _ in range(args.repeticoes):
+            funcao()
+    estatisticas = database.estatisticas_instrucoes()
+    print(f"\nInstruções: {estatisticas['distintas']} distintas, {estatisticas['execucoes']} execuções, "
+          f"taxa de acerto {estatisticas['taxa_acerto']:.1%} "
+          f"({estatisticas['preparos']} PREPARE, {estatisticas['falhas']} recusadas)")
+    database.fechar_conexoes()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--linhas', type=int, default=100_000)
+    parser.add_argument('--repeticoes', type=int, default=200)
+    parser.add_argument('--postgres-url', help="banco PostgreSQL vazio e descartável (em vez de subir um local)")
+    args = parser.parse_args()
+
+    if args.postgres_url:
+        comparar(args.postgres_url, args)
+        return
+    from app.bench import PostgresTemporario
+    with tempfile.TemporaryDirectory(prefix='bench_preparadas_') as diretorio:
+        with PostgresTemporario(diretorio) as pg:
+            comparar(pg.url, args)
+
+
+if __name__ == '__main__':
+    main()
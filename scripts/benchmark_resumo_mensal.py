@@ -0,0 +1,88 @@
+"""Compara o resumo mensal em uma consulta com o caminho antigo de três consultas.
+
+Gera um livro-caixa sintético num arquivo SQLite temporário e mede, para o
+mesmo mês, o tempo de:
+
+  - `obter_entradas_saidas_saldo` + `obter_soma_por_categoria` + `obter_soma_por_banco`
+  - `obter_resumo_mensal`
+
+Rode:
+
+  python scripts/benchmark_resumo_mensal.py [--linhas 200000] [--repeticoes 20]
+
+Nunca toca no banco configurado da aplicação (usa sempre um SQLite temporário).
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def gerar_livro(database, linhas, seed=42):
+    rnd = random.Random(seed)
+    conn, cursor = database.conectar()
+    cursor.executemany(f"INSERT INTO {database.T_CATEGORIAS} (nome) VALUES (?)",
+                       [(f"Categoria {i}",) for i in range(1, 21)])
+    cursor.executemany(f"INSERT INTO {database.T_BANCOS} (nome) VALUES (?)",
+                       [(f"Banco {i}",) for i in range(1, 6)])
+    cursor.executemany(
+        f"""INSERT INTO {database.T_LANCAMENTOS}
+            (dia, mes, ano, descricao, categoria_id, banco_id, cartao_id, valor_previsto, valor_pago)
+            VALUES (?, ?, ?, ?, ?, ?, NULL, ?, ?)""",
+        ((rnd.randint(1, 28), rnd.randint(1, 12), rnd.randint(2015, 2024), f"Lançamento {i}",
+          rnd.randint(1, 20), rnd.randint(1, 5), None,
+          round(rnd.uniform(-500, 300) * 100)) for i in range(linhas)))
+    conn.commit()
+    conn.close()
+
+
+def medir(funcao, repeticoes):
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        funcao()
+    return (time.perf_counter() - inicio) / repeticoes * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--linhas', type=int, default=200_000)
+    parser.add_argument('--repeticoes', type=int, default=20)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix='bench_resumo_')
+    # Força SQLite num arquivo temporário, ignorando config.ini/DATABASE_URL
+    os.environ['SQLITE_FILE'] = os.path.join(tmpdir, 'bench.db')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.environ['SQLITE_FILE']
+    sys.path.insert(0, ROOT_DIR)
+    from app import database
+
+    print(f"Gerando {args.linhas} lançamentos em {os.environ['SQLITE_FILE']} ...")
+    gerar_livro(database, args.linhas)
+    mes, ano = 6, 2020
+
+    def tres_consultas():
+        database.obter_entradas_saidas_saldo(mes, ano)
+        database.obter_soma_por_categoria(mes, ano)
+        database.obter_soma_por_banco(mes, ano)
+
+    def uma_consulta():
+        database.obter_resumo_mensal(mes, ano)
+
+    # Confere se os dois caminhos dão o mesmo resultado antes de medir
+    resumo = database.obter_resumo_mensal(mes, ano)
+    antigo = database.obter_entradas_saidas_saldo(mes, ano)
+    assert abs(resumo['saldo'] - antigo['saldo']) < 0.01
+    assert [r[0] for r in database.obter_soma_por_categoria(mes, ano)] == [r[0] for r in resumo['por_categoria']]
+
+    t_antigo = medir(tres_consultas, args.repeticoes)
+    t_novo = medir(uma_consulta, args.repeticoes)
+    print(f"três consultas:      {t_antigo:8.2f} ms")
+    print(f"obter_resumo_mensal: {t_novo:8.2f} ms  ({t_antigo / t_novo:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""Compara os perfis de desempenho do SQLite (`database.PERFIS_SQLITE`).
+
+Para cada perfil, num processo e num arquivo SQLite temporário próprios, mede:
+
+  - importação em lote de `--linhas` lançamentos (`importar_lancamentos`);
+  - `--gravacoes` inclusões avulsas, cada uma com seu commit (como na tela);
+  - leitura completa da listagem (`iterar_lancamentos`);
+  - resumos mensais (`obter_resumo_mensal`) de todos os meses;
+  - 50 páginas da listagem paginada, como ao rolar a tabela.
+
+O perfil 'original' reproduz a configuração anterior (journal DELETE e os
+padrões da biblioteca), como referência.
+
+Rode:
+
+  python scripts/benchmark_sqlite_perfis.py [--linhas 500000] [--gravacoes 500]
+  python scripts/benchmark_sqlite_perfis.py --perfis seguro rapido
+
+Os números dependem muito do disco (o custo de synchronous=FULL é o fsync de
+cada commit); meça na máquina onde o livro-caixa vai rodar.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Referência: como o SQLite rodava antes dos perfis (padrões da biblioteca)
+ORIGINAL = {'SQLITE_JOURNAL_MODE': 'DELETE', 'SQLITE_SYNCHRONOUS': 'FULL', 'SQLITE_CACHE_SIZE': '-2000',
+            'SQLITE_MMAP_SIZE': '0', 'SQLITE_TEMP_STORE': 'DEFAULT', 'SQLITE_CHECKPOINT_INTERVAL': '0'}
+
+
+def registros(linhas, seed=42):
+    rnd = random.Random(seed)
+    for i in range(linhas):
+        yield {
+            'linha': i + 1,
+            'data': date(rnd.randint(2015, 2024), rnd.randint(1, 12), rnd.randint(1, 28)),
+            'descricao': f"Lançamento {i}",
+            'valor_previsto': None,
+            'valor_pago': round(rnd.uniform(-500, 300) * 100),
+            'categoria': f"Categoria {rnd.randint(1, 20)}",
+            'banco': f"Banco {rnd.randint(1, 5)}",
+            'cartao': None,
+        }
+
+
+def cronometrar(resultados, nome, funcao):
+    inicio = time.perf_counter()
+    funcao()
+    resultados[nome] = round(time.perf_counter() - inicio, 3)
+
+
+def rodar_perfil(args):
+    """Executado no processo filho, já com SQLITE_PERFIL e SQLITE_FILE definidos."""
+    sys.path.insert(0, ROOT_DIR)
+    from app import database
+
+    r = {}
+    cronometrar(r, 'importacao', lambda: database.importar_lancamentos(registros(args.linhas)))
+
+    def gravacoes():
+        for i in range(args.gravacoes):
+            database.adicionar_lancamento({'dia': 1 + i % 28, 'mes': 1 + i % 12, 'ano': 2024,
+                                           'descricao': f"Avulso {i}", 'categoria_id': None,
+                                           'banco_id': None, 'cartao_id': None,
+                                           'valor_previsto': None, 'valor_pago': -1000})
+    cronometrar(r, 'gravacoes_avulsas', gravacoes)
+    cronometrar(r, 'leitura_completa', lambda: sum(1 for _ in database.iterar_lancamentos()))
+    cronometrar(r, 'resumos_mensais', lambda: [database.obter_resumo_mensal(m, a)
+                                               for a in range(2015, 2025) for m in range(1, 13)])
+
+    def paginas():
+        apos = None
+        for _ in range(50):
+            pagina = database.listar_lancamentos_pagina(apos=apos, limite=200)
+            if not pagina:
+                break
+            apos = database.chave_lancamento(pagina[-1])
+    cronometrar(r, 'paginacao', paginas)
+
+    database.fechar_conexoes()
+    r['tamanho_mb'] = round(os.path.getsize(os.environ['SQLITE_FILE']) / 2**20, 1)
+    print(json.dumps(r))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--linhas', type=int, default=500_000)
+    parser.add_argument('--gravacoes', type=int, default=500)
+    parser.add_argument('--perfis', nargs='+', default=['original', 'seguro', 'rapido'],
+                        help="perfis de database.PERFIS_SQLITE, ou 'original' (padrões do SQLite)")
+    parser.add_argument('--perfil-interno', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.perfil_interno:
+        rodar_perfil(args)
+        return
+
+    tmpdir = tempfile.mkdtemp(prefix='bench_perfis_')
+    resultados = {}
+    for perfil in args.perfis:
+        arquivo = os.path.join(tmpdir, f'{perfil}.db')
+        env = dict(os.environ, SQLITE_PERFIL=perfil, SQLITE_FILE=arquivo,
+                   DATABASE_URL='sqlite:///' + arquivo)
+        if perfil == 'original':
+            env.update(ORIGINAL)
+        print(f"Perfil {perfil} ({args.linhas} lançamentos) ...", file=sys.stderr)
+        saida = subprocess.run([sys.executable, __file__, '--perfil-interno', perfil,
+                                '--linhas', str(args.linhas), '--gravacoes', str(args.gravacoes)],
+                               env=env, check=True, capture_output=True, text=True).stdout
+        resultados[perfil] = json.loads(saida.strip().splitlines()[-1])
+
+    medidas = list(next(iter(resultados.values())))
+    print(f"{'medida (s)':<20}" + "".join(f"{p:>12}" for p in resultados))
+    for medida in medidas:
+        print(f"{medida:<20}" + "".join(f"{resultados[p][medida]:>12}" for p in resultados))
+
+
+if __name__ == '__main__':
+    main()
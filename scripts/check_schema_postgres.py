@@ -69,12 +69,15 @@ EXPECTED = {
         'columns': {
             'id': {'type': 'int', 'nullable': False, 'pk': True},
             'nome': {'type': 'text', 'nullable': False, 'unique': True},
+            'saldo_inicial': {'type': 'numeric', 'nullable': False},
         }
     },
     'cartao': {
         'columns': {
             'id': {'type': 'int', 'nullable': False, 'pk': True},
             'nome': {'type': 'text', 'nullable': False, 'unique': True},
+            'dia_fechamento': {'type': 'int', 'nullable': True},
+            'dia_vencimento': {'type': 'int', 'nullable': True},
         }
     },
     'lancamento': {
@@ -87,6 +90,24 @@ EXPECTED = {
             'id_categoria': {'type': 'int', 'nullable': False, 'fk': ('categoria', 'id')},
             'id_banco': {'type': 'int', 'nullable': True, 'fk': ('banco', 'id')},
             'id_cartao': {'type': 'int', 'nullable': True, 'fk': ('cartao', 'id')},
+            'descricao_busca': {'type': 'tsvector', 'nullable': True},
+            'id_recorrencia': {'type': 'int', 'nullable': True, 'fk': ('recorrencia', 'id')},
+            'parcela': {'type': 'int', 'nullable': True},
+        }
+    },
+    'recorrencia': {
+        'columns': {
+            'id': {'type': 'int', 'nullable': False, 'pk': True},
+            'descricao': {'type': 'text', 'nullable': False},
+            'frequencia': {'type': 'text', 'nullable': False},
+            'parcelado': {'type': 'boolean', 'nullable': False},
+            'data_inicio': {'type': 'date', 'nullable': False},
+            'quantidade': {'type': 'int', 'nullable': True},
+            'valor': {'type': 'numeric', 'nullable': False},
+            'id_categoria': {'type': 'int', 'nullable': True, 'fk': ('categoria', 'id')},
+            'id_banco': {'type': 'int', 'nullable': True, 'fk': ('banco', 'id')},
+            'id_cartao': {'type': 'int', 'nullable': True, 'fk': ('cartao', 'id')},
+            'geradas': {'type': 'int', 'nullable': False},
         }
     }
 }
@@ -47,4 +47,147 @@ CREATE TABLE lancamento (
 CREATE INDEX idx_lancamento_data ON lancamento(data_lancamento);
 CREATE INDEX idx_lancamento_categoria ON lancamento(id_categoria);
 CREATE INDEX idx_lancamento_banco ON lancamento(id_banco);
-CREATE INDEX idx_lancamento_cartao ON lancamento(id_cartao);
\ No newline at end of file
+CREATE INDEX idx_lancamento_cartao ON lancamento(id_cartao);
+
+-- Índices compostos para os relatórios agrupados por período
+-- (obter_soma_por_categoria / obter_soma_por_banco). O filtro de período é um
+-- intervalo em data_lancamento e o INCLUDE permite somar valor_real direto do
+-- índice (index-only scan), sem visitar a tabela. Requer PostgreSQL 11+.
+CREATE INDEX IF NOT EXISTS idx_lancamento_data_categoria
+    ON lancamento(data_lancamento, id_categoria) INCLUDE (valor_real);
+CREATE INDEX IF NOT EXISTS idx_lancamento_data_banco
+    ON lancamento(data_lancamento, id_banco) INCLUDE (valor_real);
+
+
+-- Agregados mensais: totais por (ano, mês, categoria, banco), mantidos pelo
+-- trigger abaixo a cada INSERT/UPDATE/DELETE em lancamento. Os relatórios de
+-- meses inteiros leem daqui (custo proporcional ao número de grupos, não de
+-- lançamentos). Para recalcular/conferir: python -m app.manutencao
+-- reconstruir-agregados | verificar-agregados
+CREATE TABLE IF NOT EXISTS agregado_mensal (
+    ano INTEGER NOT NULL,
+    mes INTEGER NOT NULL,
+    id_categoria INTEGER NOT NULL DEFAULT 0,  -- 0 = sem categoria
+    id_banco INTEGER NOT NULL DEFAULT 0,      -- 0 = sem banco
+    qtd INTEGER NOT NULL DEFAULT 0,           -- lançamentos no grupo
+    qtd_pago INTEGER NOT NULL DEFAULT 0,      -- lançamentos com valor_real != 0
+    entradas NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    saidas NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    previsto NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    pago NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    projetado NUMERIC(14, 2) NOT NULL DEFAULT 0,  -- valor_real, ou previsto enquanto não pago
+    PRIMARY KEY (ano, mes, id_categoria, id_banco)
+);
+
+-- Bancos criados antes da coluna: depois de aplicar o script, rode
+-- python -m app.manutencao reconstruir-agregados para preenchê-la
+ALTER TABLE agregado_mensal ADD COLUMN IF NOT EXISTS projetado NUMERIC(14, 2) NOT NULL DEFAULT 0;
+
+CREATE OR REPLACE FUNCTION fn_lancamento_agregado() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE agregado_mensal SET
+            qtd = qtd - 1,
+            qtd_pago = qtd_pago - (CASE WHEN COALESCE(OLD.valor_real, 0) <> 0 THEN 1 ELSE 0 END),
+            entradas = entradas - (CASE WHEN OLD.valor_real > 0 THEN OLD.valor_real ELSE 0 END),
+            saidas = saidas - (CASE WHEN OLD.valor_real < 0 THEN OLD.valor_real ELSE 0 END),
+            previsto = previsto - COALESCE(OLD.valor_previsto, 0),
+            pago = pago - COALESCE(OLD.valor_real, 0),
+            projetado = projetado - COALESCE(OLD.valor_real, OLD.valor_previsto, 0)
+        WHERE ano = EXTRACT(YEAR FROM OLD.data_lancamento)
+          AND mes = EXTRACT(MONTH FROM OLD.data_lancamento)
+          AND id_categoria = COALESCE(OLD.id_categoria, 0)
+          AND id_banco = COALESCE(OLD.id_banco, 0);
+        DELETE FROM agregado_mensal
+        WHERE ano = EXTRACT(YEAR FROM OLD.data_lancamento)
+          AND mes = EXTRACT(MONTH FROM OLD.data_lancamento)
+          AND id_categoria = COALESCE(OLD.id_categoria, 0)
+          AND id_banco = COALESCE(OLD.id_banco, 0)
+          AND qtd <= 0;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO agregado_mensal AS a
+            (ano, mes, id_categoria, id_banco, qtd, qtd_pago, entradas, saidas, previsto, pago, projetado)
+        VALUES (
+            EXTRACT(YEAR FROM NEW.data_lancamento),
+            EXTRACT(MONTH FROM NEW.data_lancamento),
+            COALESCE(NEW.id_categoria, 0),
+            COALESCE(NEW.id_banco, 0),
+            1,
+            CASE WHEN COALESCE(NEW.valor_real, 0) <> 0 THEN 1 ELSE 0 END,
+            CASE WHEN NEW.valor_real > 0 THEN NEW.valor_real ELSE 0 END,
+            CASE WHEN NEW.valor_real < 0 THEN NEW.valor_real ELSE 0 END,
+            COALESCE(NEW.valor_previsto, 0),
+            COALESCE(NEW.valor_real, 0),
+            COALESCE(NEW.valor_real, NEW.valor_previsto, 0))
+        ON CONFLICT (ano, mes, id_categoria, id_banco) DO UPDATE SET
+            qtd = a.qtd + EXCLUDED.qtd,
+            qtd_pago = a.qtd_pago + EXCLUDED.qtd_pago,
+            entradas = a.entradas + EXCLUDED.entradas,
+            saidas = a.saidas + EXCLUDED.saidas,
+            previsto = a.previsto + EXCLUDED.previsto,
+            pago = a.pago + EXCLUDED.pago,
+            projetado = a.projetado + EXCLUDED.projetado;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_lancamento_agregado ON lancamento;
+CREATE TRIGGER trg_lancamento_agregado
+    AFTER INSERT OR UPDATE OR DELETE ON lancamento
+    FOR EACH ROW EXECUTE FUNCTION fn_lancamento_agregado();
+
+
+-- Ordem da listagem principal (data, id): atende a paginação por chave de
+-- listar_lancamentos_pagina sem ordenar a tabela a cada página.
+CREATE INDEX IF NOT EXISTS idx_lancamento_data_id ON lancamento(data_lancamento, id);
+
+
+-- Busca textual na descrição (buscar_lancamentos): tsvector gerado da
+-- descrição em minúsculas e sem acentos, com índice GIN. As maiúsculas
+-- acentuadas também estão no translate porque lower() não as converte em
+-- bancos com locale C. A configuração 'simple' não aplica radicalização, o que
+-- mantém a busca por prefixo ("farm:*") previsível. Requer PostgreSQL 12+.
+ALTER TABLE lancamento ADD COLUMN IF NOT EXISTS descricao_busca tsvector
+    GENERATED ALWAYS AS (to_tsvector('simple', translate(lower(descricao),
+        'áàâãäéèêëíìîïóòôõöúùûüçñÁÀÂÃÄÉÈÊËÍÌÎÏÓÒÔÕÖÚÙÛÜÇÑ',
+        'aaaaaeeeeiiiiooooouuuucnaaaaaeeeeiiiiooooouuuucn'))) STORED;
+CREATE INDEX IF NOT EXISTS idx_lancamento_descricao_busca ON lancamento USING GIN (descricao_busca);
+
+
+-- Saldo corrido (listar_lancamentos_pagina(com_saldo=True), tendência mensal):
+-- saldo de cada banco antes do primeiro lançamento. O saldo anterior a um
+-- mês vem dos agregados (coluna projetado acima), sem somar o histórico.
+ALTER TABLE banco ADD COLUMN IF NOT EXISTS saldo_inicial NUMERIC(14, 2) NOT NULL DEFAULT 0;
+
+
+-- Recorrências e parcelamentos (criar_recorrencia): a regra é gravada uma vez
+-- e suas ocorrências são lançamentos comuns, com id_recorrencia e o número da
+-- ocorrência (parcela). O índice único impede gerar a mesma ocorrência duas
+-- vezes quando dois clientes expandem as regras ao mesmo tempo.
+CREATE TABLE IF NOT EXISTS recorrencia (
+    id SERIAL PRIMARY KEY,
+    descricao TEXT NOT NULL,
+    frequencia TEXT NOT NULL CHECK (frequencia IN ('mensal', 'anual')),
+    parcelado BOOLEAN NOT NULL DEFAULT FALSE,
+    data_inicio DATE NOT NULL,            -- primeira ocorrência
+    quantidade INTEGER,                   -- NULL = sem fim
+    valor NUMERIC(10, 2) NOT NULL,        -- nas parcelas, o total da compra
+    id_categoria INTEGER REFERENCES categoria(id),
+    id_banco INTEGER REFERENCES banco(id),
+    id_cartao INTEGER REFERENCES cartao(id),
+    geradas INTEGER NOT NULL DEFAULT 0
+);
+ALTER TABLE lancamento ADD COLUMN IF NOT EXISTS id_recorrencia INTEGER REFERENCES recorrencia(id);
+ALTER TABLE lancamento ADD COLUMN IF NOT EXISTS parcela INTEGER;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_lancamento_recorrencia ON lancamento(id_recorrencia, parcela);
+
+
+-- Faturas dos cartões (obter_faturas): dias de fechamento e vencimento de cada
+-- cartão e índice por (cartão, data) com os valores incluídos, para que os
+-- totais de um intervalo de faturas saiam do índice (index-only scan).
+ALTER TABLE cartao ADD COLUMN IF NOT EXISTS dia_fechamento INTEGER CHECK (dia_fechamento BETWEEN 1 AND 31);
+ALTER TABLE cartao ADD COLUMN IF NOT EXISTS dia_vencimento INTEGER CHECK (dia_vencimento BETWEEN 1 AND 31);
+CREATE INDEX IF NOT EXISTS idx_lancamento_cartao_data
+    ON lancamento(id_cartao, data_lancamento) INCLUDE (valor_previsto, valor_real);